@@ -1,6 +1,7 @@
 """
 Generate fake data for households survey raw input data.
 """
+
 # mypy: ignore-errors
 from genericpath import isdir
 from io import StringIO
@@ -20,8 +21,7 @@ from dummy_data_generation.schemas import get_example_survey_response_data_v2_da
 from dummy_data_generation.schemas import get_nims_data_description
 from survey_pipeline_template.hdfs_utils import create_dir
 from survey_pipeline_template.hdfs_utils import write_string_to_file
-from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
-
+from survey_pipeline_template.pyspark_utils import pandas_to_spark
 
 _ = Field("en-gb", seed=42, providers=[Distribution, CustomRandom])
 
@@ -173,7 +173,6 @@ def generate_sample_direct_data(directory, file_date, records):
 
 
 def generate_nims_table(table_name, participant_ids, records=10):
-    spark_session = get_or_create_spark_session()
     schema = Schema(schema=get_nims_data_description(_, participant_ids))
     nims_pandas_df = pd.DataFrame(schema.create(iterations=records))
     nims_pandas_df["vaccination_date_dose_1"] = pd.to_datetime(
@@ -184,7 +183,7 @@ def generate_nims_table(table_name, participant_ids, records=10):
     )
     nims_pandas_df["found_pds"] = pd.to_numeric(nims_pandas_df["found_pds"])
     nims_pandas_df["pds_conflict"] = pd.to_numeric(nims_pandas_df["pds_conflict"])
-    nims_df = spark_session.createDataFrame(
+    nims_df = pandas_to_spark(
         nims_pandas_df,
         schema="""cis_participant_id string, product_dose_1 string, vaccination_date_dose_1 timestamp,
         product_dose_2 string, vaccination_date_dose_2 timestamp, found_pds integer, pds_conflict integer""",
@@ -17,6 +17,7 @@ from pyspark.sql import Window
 from survey_pipeline_template.expressions import all_columns_null
 from survey_pipeline_template.expressions import any_column_not_null
 from survey_pipeline_template.expressions import sum_within_row
+from survey_pipeline_template.pyspark_utils import spark_to_pandas
 
 
 def add_prefix(df: DataFrame, column_name_to_update: str, prefix: str, sep: str = ""):
@@ -403,11 +404,13 @@ def update_from_lookup_df(df: DataFrame, lookup_df: DataFrame, id_column: str =
         lookup_df = lookup_df.filter(F.col("dataset_name") == dataset_name)
 
     if id_column is None:
-        id_columns = list(lookup_df.select("id_column_name").distinct().toPandas()["id_column_name"])
+        id_columns = list(spark_to_pandas(lookup_df.select("id_column_name").distinct())["id_column_name"])
 
     for id_column in id_columns:
         temp_lookup_df = lookup_df.filter(F.col("id_column_name") == id_column)
-        columns_to_edit = list(temp_lookup_df.select("target_column_name").distinct().toPandas()["target_column_name"])
+        columns_to_edit = list(
+            spark_to_pandas(temp_lookup_df.select("target_column_name").distinct())["target_column_name"]
+        )
         pivoted_lookup_df = (
             temp_lookup_df.groupBy("id")
             .pivot("target_column_name")
@@ -514,12 +517,10 @@ def update_column_values_from_map(
     mapping_expr = F.create_map([F.lit(x) for x in chain(*_map.items())])  # type: ignore
     if error_if_value_not_found:
         temp_df = df.distinct()
-        values_set = set(temp_df.select(column_name_to_update).toPandas()[column_name_to_update].tolist())
+        values_set = set(spark_to_pandas(temp_df.select(column_name_to_update))[column_name_to_update].tolist())
         map_set = set(map.keys())
         if map_set != values_set:
-            missing = set(temp_df.select(column_name_to_update).toPandas()[column_name_to_update].tolist()) - set(
-                map.keys()
-            )
+            missing = values_set - set(map.keys())
             raise LookupError(f"Insufficient mapping values: contents of:{missing} remains unmapped")
         df = df.withColumn(
             column_name_to_update,
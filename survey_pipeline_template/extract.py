@@ -1,49 +1,90 @@
+import os
 import subprocess
+import tempfile
+from datetime import date
 from datetime import datetime
+from datetime import time
 from typing import Any
+from typing import Iterator
 from typing import List
 from typing import Optional
 from typing import Union
 
+import openpyxl
 import pandas as pd
-import pyspark.sql.functions as F
 from pyspark.sql import DataFrame
+from pyspark.sql.types import BooleanType
+from pyspark.sql.types import ByteType
+from pyspark.sql.types import DataType
+from pyspark.sql.types import DateType
+from pyspark.sql.types import DoubleType
+from pyspark.sql.types import FloatType
+from pyspark.sql.types import IntegerType
+from pyspark.sql.types import LongType
+from pyspark.sql.types import ShortType
+from pyspark.sql.types import StringType
+from pyspark.sql.types import StructField
+from pyspark.sql.types import StructType
+from pyspark.sql.types import TimestampType
 
-from survey_pipeline_template.pipeline.load import extract_from_table
-from survey_pipeline_template.pyspark_utils import column_to_list
+from survey_pipeline_template.file_catalog import get_file_catalog
+from survey_pipeline_template.file_catalog import get_table_item_set
+from survey_pipeline_template.hdfs_utils import copy_hdfs_to_local
+from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+from survey_pipeline_template.pyspark_utils import get_staging_directory
 
 
 class InvalidFileError(Exception):
     pass
 
 
-def list_contents(path: str, recursive: Optional[bool] = False, date_from_filename: Optional[bool] = True) -> DataFrame:
+def list_contents(path: str, recursive: bool = False, date_from_filename: Optional[bool] = True) -> DataFrame:
     """
     Read contents of a directory and return the path for each file and
-    returns a dataframe of
+    returns a dataframe of the columns output by `hadoop fs -ls`, along with the filename.
+    `id`, the replication factor of each file, is only available from `hadoop fs -ls` and is null when the contents
+    are listed through a file catalog.
+
     Parameters
     ----------
     path : String
     recursive
     """
-    command = ["hadoop", "fs", "-ls"]
-    if recursive:
-        command.append("-R")
-    ls = subprocess.Popen([*command, path], stdout=subprocess.PIPE)
     names = ["permission", "id", "owner", "group", "value", "upload_date", "upload_time", "file_path"]
     files = []
-    for line in ls.stdout:  # type: ignore
-        dic = {}
-        f = line.decode("utf-8")
-        attributes = f.split()
-
-        attributes = [*attributes[:7], " ".join(attributes[7:])]
-        if "Found" not in f:
-            for i, component in enumerate(attributes):
-                dic[names[i]] = component
-            dic["filename"] = dic["file_path"].split("/")[-1]
-        files.append(dic)
-    df = pd.DataFrame(files)
+    file_catalog = get_file_catalog(path)
+    if file_catalog is not None:
+        for file_info in file_catalog.list_status(path, recursive=recursive):
+            files.append(
+                {
+                    "permission": file_info.permission,
+                    "id": None,
+                    "owner": file_info.owner,
+                    "group": file_info.group,
+                    "value": str(file_info.size),
+                    "upload_date": file_info.modification_time.strftime("%Y-%m-%d"),
+                    "upload_time": file_info.modification_time.strftime("%H:%M"),
+                    "file_path": file_info.path,
+                    "filename": file_info.path.split("/")[-1],
+                }
+            )
+    else:
+        command = ["hadoop", "fs", "-ls"]
+        if recursive:
+            command.append("-R")
+        ls = subprocess.Popen([*command, path], stdout=subprocess.PIPE)
+        for line in ls.stdout:  # type: ignore
+            dic = {}
+            f = line.decode("utf-8")
+            attributes = f.split()
+
+            attributes = [*attributes[:7], " ".join(attributes[7:])]
+            if "Found" not in f:
+                for i, component in enumerate(attributes):
+                    dic[names[i]] = component
+                dic["filename"] = dic["file_path"].split("/")[-1]
+            files.append(dic)
+    df = pd.DataFrame(files, columns=[*names, "filename"])
     if date_from_filename:
         df["upload_date"] = df["filename"].str.extract(
             (r"(\d{8})(?:_\d{4}|_\d{6})?(?=.csv|.txt|.xlsx|.json)"), expand=False
@@ -109,8 +150,7 @@ def remove_list_items_in_table(item_list: list, table_name: str, item_column: st
     item_column
         name of column in table containing items to remove from list
     """
-    table_item_column = extract_from_table(table_name).select(item_column).distinct()
-    table_items = column_to_list(table_item_column, item_column)
+    table_items = get_table_item_set(table_name, item_column)
 
     item_list = [i for i in item_list if i not in table_items]
     return item_list
@@ -120,10 +160,7 @@ def filter_list_items_in_table_when_condition(
     item_list: list, table_name: str, item_column: str, condition_column: str, condition_value: Any
 ):
     """"""
-    table_item_column = (
-        extract_from_table(table_name).filter(F.col(condition_column) == condition_value).select(item_column).distinct()
-    )
-    table_items = column_to_list(table_item_column, item_column)
+    table_items = get_table_item_set(table_name, item_column, condition_column, condition_value)
 
     item_list = [i for i in item_list if i not in table_items]
     return item_list
@@ -161,3 +198,115 @@ def get_files_to_be_processed(
         )
 
     return file_paths
+
+
+def _coerce_excel_value(value: Any, data_type: DataType) -> Any:
+    """Convert a cell value to the python type of a Spark data type, or None if it cannot be converted."""
+    if value is None or value == "":
+        return None
+    try:
+        if isinstance(data_type, StringType):
+            return str(value)
+        if isinstance(data_type, (ByteType, ShortType, IntegerType, LongType)):
+            return int(float(value)) if isinstance(value, str) else int(value)
+        if isinstance(data_type, (FloatType, DoubleType)):
+            return float(value)
+        if isinstance(data_type, BooleanType):
+            if isinstance(value, str):
+                return {"true": True, "false": False}.get(value.strip().lower())
+            return bool(value)
+        if isinstance(data_type, TimestampType):
+            if isinstance(value, datetime):
+                return value
+            return datetime.combine(value, time()) if isinstance(value, date) else None
+        if isinstance(data_type, DateType):
+            if isinstance(value, datetime):
+                return value.date()
+            return value if isinstance(value, date) else None
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
+def iter_excel_chunks(local_path: str, schema: StructType, chunk_size: int = 20000) -> Iterator[List[list]]:
+    """
+    Read the rows of the first worksheet of a local Excel workbook in chunks, without loading the whole workbook into
+    memory. The header row is skipped and values are converted to the types of the schema's fields, by position.
+
+    Parameters
+    ----------
+    local_path
+        path to the workbook on the local file system
+    schema
+        schema of the columns of the worksheet, in order
+    chunk_size
+        maximum number of rows in each chunk
+    """
+    workbook = openpyxl.load_workbook(local_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        next(rows, None)
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            row = list(row[: len(schema.fields)]) + [None] * (len(schema.fields) - len(row))
+            chunk.append([_coerce_excel_value(value, field.dataType) for value, field in zip(row, schema.fields)])
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def read_excel_header(local_path: str) -> List[str]:
+    """Read the header row of the first worksheet of a local Excel workbook."""
+    workbook = openpyxl.load_workbook(local_path, read_only=True, data_only=True)
+    try:
+        header = next(workbook.worksheets[0].iter_rows(values_only=True), ())
+    finally:
+        workbook.close()
+    return [str(value) for value in header if value is not None]
+
+
+def read_excel_to_pyspark_df(file_path: str, schema: Optional[StructType] = None, chunk_size: int = 20000) -> DataFrame:
+    """
+    Read the first worksheet of an Excel workbook into a DataFrame, holding no more than one chunk of rows in driver
+    memory at a time.
+
+    The workbook is copied to a local temporary file and streamed with openpyxl's read-only mode. Each chunk of rows
+    is written to parquet under the Spark checkpoint directory, which must be set, and the DataFrame is read back from
+    there. The staged data is removed along with the checkpoint directory at the end of the run.
+
+    Parameters
+    ----------
+    file_path
+        local or HDFS path to the workbook
+    schema
+        schema to apply to the columns of the worksheet, by position. Columns are read as strings, named by the
+        header row, if not set
+    chunk_size
+        number of rows to hold in memory at a time
+    """
+    spark_session = get_or_create_spark_session()
+    staging_path = get_staging_directory("excel_staging")
+    if staging_path is None:
+        raise ValueError(f"A Spark checkpoint directory must be set to stage the rows of {file_path}")
+
+    with tempfile.TemporaryDirectory() as local_directory:
+        local_path = os.path.join(local_directory, os.path.basename(file_path))
+        if not copy_hdfs_to_local(file_path, local_path):
+            raise OSError(f"Unable to copy {file_path} to {local_path}")
+        if schema is None:
+            schema = StructType([StructField(name, StringType()) for name in read_excel_header(local_path)])
+
+        chunk_written = False
+        for chunk in iter_excel_chunks(local_path, schema, chunk_size):
+            spark_session.createDataFrame(chunk, schema=schema).write.mode("append").parquet(staging_path)
+            chunk_written = True
+
+    if not chunk_written:
+        return spark_session.createDataFrame([], schema=schema)
+    return spark_session.read.schema(schema).parquet(staging_path)
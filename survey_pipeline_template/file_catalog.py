@@ -0,0 +1,253 @@
+"""
+Catalog of input files, for discovering files to be processed.
+
+Directory listings are cached by the modification time of each directory, and the files recorded in log tables are
+held as sets, so that discovery does not slow down as input directories grow.
+"""
+
+import json
+import threading
+from datetime import datetime
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+import pyspark.sql.functions as F
+
+from survey_pipeline_template.filesystem import FileInfo
+from survey_pipeline_template.filesystem import FileSystem
+from survey_pipeline_template.filesystem import get_filesystem
+from survey_pipeline_template.filesystem import PathType
+
+
+class FileCatalog(FileSystem):
+    """
+    Lists files and directories, reusing the listing of any directory that has not been modified since it was last
+    listed.
+
+    A directory's modification time changes when files are added to, removed from or renamed within it, but not when
+    an existing file is changed in place, so the sizes and modification times of files in unmodified directories may
+    be out of date.
+
+    Parameters
+    ----------
+    file_system
+        file system to list files from
+    cache_path
+        path of a JSON file to keep the cached listings in between runs. Listings are only cached in memory if not set
+    """
+
+    def __init__(self, file_system: FileSystem, cache_path: Optional[str] = None):
+        self.file_system = file_system
+        self.cache_path = cache_path
+        self._lock = threading.RLock()
+        self._modified = False
+        self._listings: Dict[str, Tuple[float, List[FileInfo]]] = {}
+        if cache_path is not None:
+            self._load()
+
+    @staticmethod
+    def _to_json(file_info: FileInfo) -> List[Any]:
+        return [*file_info[:3], file_info.modification_time.timestamp(), *file_info[4:]]
+
+    @staticmethod
+    def _from_json(values: List[Any]) -> FileInfo:
+        path, is_dir, size, modification_time, owner, group, permission = values
+        return FileInfo(
+            path=path,
+            is_dir=is_dir,
+            size=size,
+            modification_time=datetime.fromtimestamp(modification_time),
+            owner=owner,
+            group=group,
+            permission=permission,
+        )
+
+    def _load(self):
+        cache_file_system = get_filesystem(self.cache_path)
+        if cache_file_system is None or not cache_file_system.isfile(self.cache_path):
+            return
+        try:
+            cached_listings = json.loads(cache_file_system.read_bytes(self.cache_path).decode("UTF-8"))
+        except ValueError:
+            print(f"WARNING: ignoring invalid file catalog cache {self.cache_path}")  # functional
+            return
+        self._listings = {
+            directory: (listing["modification_time"], [self._from_json(values) for values in listing["files"]])
+            for directory, listing in cached_listings.items()
+        }
+
+    def save(self):
+        """Write the cached listings to the cache file, if any directories have been listed since it was loaded."""
+        with self._lock:
+            if self.cache_path is None or not self._modified:
+                return
+            cached_listings = {
+                directory: {
+                    "modification_time": modification_time,
+                    "files": [self._to_json(file_info) for file_info in file_infos],
+                }
+                for directory, (modification_time, file_infos) in self._listings.items()
+            }
+            cache_file_system = get_filesystem(self.cache_path)
+            if cache_file_system is not None:
+                cache_file_system.write_bytes(self.cache_path, json.dumps(cached_listings).encode("UTF-8"), True)
+                self._modified = False
+
+    # operations other than listing directories are passed to the file system
+    def exists(self, path: PathType) -> bool:
+        return self.file_system.exists(path)
+
+    def isfile(self, path: PathType) -> bool:
+        return self.file_system.isfile(path)
+
+    def isdir(self, path: PathType) -> bool:
+        return self.file_system.isdir(path)
+
+    def create_dir(self, path: PathType) -> bool:
+        return self.file_system.create_dir(path)
+
+    def delete(self, path: PathType, recursive: bool = False) -> bool:
+        return self.file_system.delete(path, recursive)
+
+    def rename(self, from_path: PathType, to_path: PathType) -> bool:
+        return self.file_system.rename(from_path, to_path)
+
+    def copy(self, from_path: PathType, to_path: PathType, overwrite: bool = False) -> bool:
+        return self.file_system.copy(from_path, to_path, overwrite)
+
+    def copy_from_local(self, from_path: PathType, to_path: PathType, delete_source: bool = False) -> bool:
+        return self.file_system.copy_from_local(from_path, to_path, delete_source)
+
+    def copy_to_local(self, from_path: PathType, to_path: PathType) -> bool:
+        return self.file_system.copy_to_local(from_path, to_path)
+
+    def size(self, path: PathType) -> int:
+        return self.file_system.size(path)
+
+    def disk_space_consumed(self, path: PathType) -> int:
+        return self.file_system.disk_space_consumed(path)
+
+    def read_bytes(self, path: PathType, num_bytes: Optional[int] = None) -> bytes:
+        return self.file_system.read_bytes(path, num_bytes)
+
+    def write_bytes(self, path: PathType, content: bytes, overwrite: bool = False) -> bool:
+        return self.file_system.write_bytes(path, content, overwrite)
+
+    def md5(self, path: PathType) -> str:
+        return self.file_system.md5(path)
+
+    def get_status(self, path: PathType) -> Optional[FileInfo]:
+        return self.file_system.get_status(path)
+
+    def glob_status(self, path: PathType) -> List[FileInfo]:
+        return self.file_system.glob_status(path)
+
+    def list_directory(self, path: PathType) -> List[FileInfo]:
+        directory = self.file_system.get_status(path)
+        return self._list_cached_directory(directory)[0] if directory is not None else []
+
+    def _list_cached_directory(self, directory: FileInfo) -> Tuple[List[FileInfo], bool]:
+        """List a directory, returning whether the listing came from the cache."""
+        modification_time = directory.modification_time.timestamp()
+        with self._lock:
+            cached_listing = self._listings.get(directory.path)
+        if cached_listing is not None and cached_listing[0] == modification_time:
+            return cached_listing[1], True
+
+        file_infos = self.file_system.list_directory(directory.path)
+        with self._lock:
+            self._listings[directory.path] = (modification_time, file_infos)
+            self._modified = True
+        return file_infos, False
+
+    def _list_tree(self, directory: FileInfo, recursive: bool) -> List[FileInfo]:
+        file_infos = []
+        listed_file_infos, from_cache = self._list_cached_directory(directory)
+        for file_info in listed_file_infos:
+            file_infos.append(file_info)
+            if recursive and file_info.is_dir:
+                # a cached listing holds subdirectory modification times from when it was cached
+                subdirectory = self.file_system.get_status(file_info.path) if from_cache else file_info
+                if subdirectory is not None:
+                    file_infos.extend(self._list_tree(subdirectory, recursive))
+        return file_infos
+
+
+_file_catalogs: Dict[Tuple[str, Optional[str]], FileCatalog] = {}
+_table_item_sets: Dict[Tuple[str, str, Optional[str], Any], Set[str]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_file_catalog(path: PathType = "") -> Optional[FileCatalog]:
+    """
+    Get the file catalog for the file system of a path. Listings are persisted to the `file_catalog_cache_file` in
+    the storage config, if set, when `save_file_catalogs` is called.
+
+    Returns
+    -------
+    FileCatalog - or None if there is no file system backend available for the path
+    """
+    from survey_pipeline_template.pipeline.config import get_config
+
+    file_system = get_filesystem(path)
+    if file_system is None:
+        return None
+    cache_path = get_config().get("storage", {}).get("file_catalog_cache_file")
+    catalog_key = (type(file_system).__name__, cache_path)
+    with _cache_lock:
+        if catalog_key not in _file_catalogs:
+            _file_catalogs[catalog_key] = FileCatalog(file_system, cache_path)
+        return _file_catalogs[catalog_key]
+
+
+def save_file_catalogs():
+    """Write the cached listings of all file catalogs that have listed directories since they were last saved."""
+    with _cache_lock:
+        file_catalogs = list(_file_catalogs.values())
+    for file_catalog in file_catalogs:
+        file_catalog.save()
+
+
+def get_table_item_set(
+    table_name: str, item_column: str, condition_column: Optional[str] = None, condition_value: Any = None
+) -> Set[str]:
+    """
+    Get the distinct values of a column of a log table, such as the file paths in `processed_filenames`, as a set.
+    The set is read from the table once, and read again after `clear_table_item_sets` is called.
+
+    Parameters
+    ----------
+    table_name
+        name of the table, without the table prefix
+    condition_column
+        only include values from rows where this column is equal to the condition_value
+    """
+    from survey_pipeline_template.pipeline.load import extract_from_table
+
+    item_set_key = (table_name, item_column, condition_column, condition_value)
+    with _cache_lock:
+        if item_set_key in _table_item_sets:
+            return _table_item_sets[item_set_key]
+    columns = [item_column] if condition_column is None else [item_column, condition_column]
+    df = extract_from_table(table_name, columns=columns)
+    if condition_column is not None:
+        df = df.filter(F.col(condition_column) == condition_value)
+    item_set = {row[item_column] for row in df.select(item_column).distinct().collect()}
+    with _cache_lock:
+        _table_item_sets[item_set_key] = item_set
+    return item_set
+
+
+def clear_table_item_sets(table_name: Optional[str] = None):
+    """
+    Clear the sets of table values read by `get_table_item_set`, for one table or for all tables. Tables are named
+    without the table prefix, as in `get_table_item_set`.
+    """
+    with _cache_lock:
+        for item_set_key in list(_table_item_sets):
+            if table_name is None or item_set_key[0] == table_name:
+                del _table_item_sets[item_set_key]
@@ -0,0 +1,491 @@
+"""
+File system backends for local and Hadoop file systems.
+
+The Hadoop backend uses the FileSystem API of the active SparkContext's JVM, so file operations do not start a new
+JVM for each call like `hadoop fs` commands do.
+"""
+
+import glob
+import hashlib
+import os
+import shutil
+from abc import ABC
+from abc import abstractmethod
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+from typing import List
+from typing import Optional
+from typing import Union
+
+from py4j.protocol import Py4JJavaError
+from pyspark import SparkContext
+
+FileInfo = namedtuple("FileInfo", ["path", "is_dir", "size", "modification_time", "owner", "group", "permission"])
+FileInfo.__doc__ = """
+Details of a file or directory, as listed by `hadoop fs -ls`.
+`modification_time` is a datetime in local time and `permission` is the permission string, e.g. drwxr-xr-x.
+"""
+
+PathType = Union[str, Path]
+
+
+class FileSystem(ABC):
+    """
+    Common interface to a file system. Paths may be given as strings or Path objects.
+
+    Operations that change the file system return True when they succeed and False otherwise, as the `hadoop fs`
+    commands that they replace do.
+    """
+
+    @abstractmethod
+    def exists(self, path: PathType) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def isfile(self, path: PathType) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def isdir(self, path: PathType) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_dir(self, path: PathType) -> bool:
+        """Create a directory, including any missing parent directories."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, path: PathType, recursive: bool = False) -> bool:
+        """Delete a file, or a directory. Directories must be empty unless deleted recursively."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def rename(self, from_path: PathType, to_path: PathType) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def copy(self, from_path: PathType, to_path: PathType, overwrite: bool = False) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def copy_from_local(self, from_path: PathType, to_path: PathType, delete_source: bool = False) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def copy_to_local(self, from_path: PathType, to_path: PathType) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def size(self, path: PathType) -> int:
+        """Get the total size in bytes of a file or all files under a directory."""
+        raise NotImplementedError
+
+    def disk_space_consumed(self, path: PathType) -> int:
+        """Get the total disk space used by a file or directory, including replicas."""
+        return self.size(path)
+
+    @abstractmethod
+    def read_bytes(self, path: PathType, num_bytes: Optional[int] = None) -> bytes:
+        """Read a whole file, or only its first num_bytes."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_bytes(self, path: PathType, content: bytes, overwrite: bool = False) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def md5(self, path: PathType) -> str:
+        raise NotImplementedError
+
+    def checksum(self, path: PathType) -> Optional[str]:
+        """Get the checksum that the file system stores for a file, without reading it, or None if it has none."""
+        return None
+
+    @abstractmethod
+    def get_status(self, path: PathType) -> Optional[FileInfo]:
+        """Get the details of a file or directory, or None if it does not exist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def glob_status(self, path: PathType) -> List[FileInfo]:
+        """Get the details of the files and directories matching a path or glob pattern, sorted by path."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_directory(self, path: PathType) -> List[FileInfo]:
+        """Get the details of the files and directories in a directory, sorted by path."""
+        raise NotImplementedError
+
+    def list_status(self, path: PathType, recursive: bool = False) -> List[FileInfo]:
+        """
+        List the files and directories matching a path or glob pattern. The contents of matching directories are
+        listed instead of the directories themselves, recursively including the contents of subdirectories if set.
+        """
+        file_infos = []
+        for matched_file_info in self.glob_status(path):
+            if matched_file_info.is_dir:
+                file_infos.extend(self._list_tree(matched_file_info, recursive))
+            else:
+                file_infos.append(matched_file_info)
+        return file_infos
+
+    def _list_tree(self, directory: FileInfo, recursive: bool) -> List[FileInfo]:
+        file_infos = []
+        for file_info in self.list_directory(directory.path):
+            file_infos.append(file_info)
+            if recursive and file_info.is_dir:
+                file_infos.extend(self._list_tree(file_info, recursive))
+        return file_infos
+
+    def read_first_line(self, path: PathType, initial_num_bytes: int = 65536) -> str:
+        """Read the first line of a file, without its line ending, reading only as much of the file as needed."""
+        num_bytes = initial_num_bytes
+        while True:
+            content = self.read_bytes(path, num_bytes)
+            if b"\n" in content or len(content) < num_bytes:
+                break
+            num_bytes *= 4
+        return content.split(b"\n", 1)[0].decode("UTF-8")
+
+
+class LocalFileSystem(FileSystem):
+    """File system operations on the local file system of the driver."""
+
+    @staticmethod
+    def _local_path(path: PathType) -> str:
+        path = str(path)
+        if path.startswith("file://"):
+            return path[len("file://") :]
+        if path.startswith("file:"):
+            return path[len("file:") :]
+        return path
+
+    def exists(self, path: PathType) -> bool:
+        return os.path.exists(self._local_path(path))
+
+    def isfile(self, path: PathType) -> bool:
+        return os.path.isfile(self._local_path(path))
+
+    def isdir(self, path: PathType) -> bool:
+        return os.path.isdir(self._local_path(path))
+
+    def create_dir(self, path: PathType) -> bool:
+        try:
+            os.makedirs(self._local_path(path), exist_ok=True)
+        except OSError:
+            return False
+        return True
+
+    def delete(self, path: PathType, recursive: bool = False) -> bool:
+        path = self._local_path(path)
+        try:
+            if os.path.isdir(path):
+                if recursive:
+                    shutil.rmtree(path)
+                else:
+                    os.rmdir(path)
+            else:
+                os.remove(path)
+        except OSError:
+            return False
+        return True
+
+    def rename(self, from_path: PathType, to_path: PathType) -> bool:
+        from_path, to_path = self._local_path(from_path), self._local_path(to_path)
+        if os.path.isdir(to_path):
+            to_path = os.path.join(to_path, os.path.basename(from_path))
+        if os.path.exists(to_path):
+            return False
+        try:
+            shutil.move(from_path, to_path)
+        except OSError:
+            return False
+        return True
+
+    def copy(self, from_path: PathType, to_path: PathType, overwrite: bool = False) -> bool:
+        from_path, to_path = self._local_path(from_path), self._local_path(to_path)
+        if os.path.isdir(to_path):
+            to_path = os.path.join(to_path, os.path.basename(from_path))
+        if os.path.exists(to_path) and not overwrite:
+            return False
+        try:
+            if os.path.isdir(from_path):
+                if os.path.exists(to_path):
+                    shutil.rmtree(to_path)
+                shutil.copytree(from_path, to_path)
+            else:
+                shutil.copyfile(from_path, to_path)
+        except OSError:
+            return False
+        return True
+
+    def copy_from_local(self, from_path: PathType, to_path: PathType, delete_source: bool = False) -> bool:
+        if delete_source:
+            return self.rename(from_path, to_path)
+        return self.copy(from_path, to_path)
+
+    def copy_to_local(self, from_path: PathType, to_path: PathType) -> bool:
+        return self.copy(from_path, to_path, overwrite=True)
+
+    def size(self, path: PathType) -> int:
+        path = self._local_path(path)
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        return sum(
+            os.path.getsize(os.path.join(directory, file_name))
+            for directory, _, file_names in os.walk(path)
+            for file_name in file_names
+        )
+
+    def read_bytes(self, path: PathType, num_bytes: Optional[int] = None) -> bytes:
+        with open(self._local_path(path), "rb") as file:
+            return file.read() if num_bytes is None else file.read(num_bytes)
+
+    def write_bytes(self, path: PathType, content: bytes, overwrite: bool = False) -> bool:
+        try:
+            with open(self._local_path(path), "wb" if overwrite else "xb") as file:
+                file.write(content)
+        except OSError:
+            return False
+        return True
+
+    def md5(self, path: PathType) -> str:
+        md5 = hashlib.md5()
+        with open(self._local_path(path), "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    def _file_info(self, path: str) -> FileInfo:
+        stat = os.stat(path)
+        is_dir = os.path.isdir(path)
+        try:
+            import grp
+            import pwd
+
+            owner, group = pwd.getpwuid(stat.st_uid).pw_name, grp.getgrgid(stat.st_gid).gr_name
+        except (ImportError, KeyError):
+            owner, group = str(stat.st_uid), str(stat.st_gid)
+        permission = ("d" if is_dir else "-") + "".join(
+            character if stat.st_mode & (1 << (8 - i)) else "-" for i, character in enumerate("rwxrwxrwx")
+        )
+        return FileInfo(
+            path=path,
+            is_dir=is_dir,
+            size=0 if is_dir else stat.st_size,
+            modification_time=datetime.fromtimestamp(stat.st_mtime),
+            owner=owner,
+            group=group,
+            permission=permission,
+        )
+
+    def get_status(self, path: PathType) -> Optional[FileInfo]:
+        path = self._local_path(path)
+        return self._file_info(path) if os.path.exists(path) else None
+
+    def glob_status(self, path: PathType) -> List[FileInfo]:
+        return [self._file_info(matched_path) for matched_path in sorted(glob.glob(self._local_path(path)))]
+
+    def list_directory(self, path: PathType) -> List[FileInfo]:
+        path = self._local_path(path)
+        return [self._file_info(os.path.join(path, child)) for child in sorted(os.listdir(path))]
+
+
+class HadoopFileSystem(FileSystem):
+    """File system operations using the Hadoop FileSystem API of a SparkContext's JVM."""
+
+    def __init__(self, spark_context: SparkContext):
+        self._jvm = spark_context._jvm
+        self._configuration = spark_context._jsc.hadoopConfiguration()
+
+    def _path(self, path: PathType):
+        return self._jvm.org.apache.hadoop.fs.Path(str(path))
+
+    def _file_system(self, hadoop_path):
+        return hadoop_path.getFileSystem(self._configuration)
+
+    def exists(self, path: PathType) -> bool:
+        hadoop_path = self._path(path)
+        return self._file_system(hadoop_path).exists(hadoop_path)
+
+    def _get_file_status(self, path: PathType):
+        hadoop_path = self._path(path)
+        try:
+            return self._file_system(hadoop_path).getFileStatus(hadoop_path)
+        except Py4JJavaError:  # FileNotFoundException
+            return None
+
+    def isfile(self, path: PathType) -> bool:
+        file_status = self._get_file_status(path)
+        return file_status is not None and file_status.isFile()
+
+    def isdir(self, path: PathType) -> bool:
+        file_status = self._get_file_status(path)
+        return file_status is not None and file_status.isDirectory()
+
+    def create_dir(self, path: PathType) -> bool:
+        hadoop_path = self._path(path)
+        try:
+            return self._file_system(hadoop_path).mkdirs(hadoop_path)
+        except Py4JJavaError:
+            return False
+
+    def delete(self, path: PathType, recursive: bool = False) -> bool:
+        hadoop_path = self._path(path)
+        try:
+            return self._file_system(hadoop_path).delete(hadoop_path, recursive)
+        except Py4JJavaError:  # non-empty directory deleted without recursive
+            return False
+
+    def rename(self, from_path: PathType, to_path: PathType) -> bool:
+        from_hadoop_path, to_hadoop_path = self._path(from_path), self._path(to_path)
+        try:
+            return self._file_system(from_hadoop_path).rename(from_hadoop_path, to_hadoop_path)
+        except Py4JJavaError:
+            return False
+
+    def copy(self, from_path: PathType, to_path: PathType, overwrite: bool = False) -> bool:
+        from_hadoop_path, to_hadoop_path = self._path(from_path), self._path(to_path)
+        to_file_system = self._file_system(to_hadoop_path)
+        if to_file_system.exists(to_hadoop_path) and to_file_system.getFileStatus(to_hadoop_path).isDirectory():
+            to_hadoop_path = self._jvm.org.apache.hadoop.fs.Path(to_hadoop_path, from_hadoop_path.getName())
+        try:
+            return self._jvm.org.apache.hadoop.fs.FileUtil.copy(
+                self._file_system(from_hadoop_path),
+                from_hadoop_path,
+                to_file_system,
+                to_hadoop_path,
+                False,
+                overwrite,
+                self._configuration,
+            )
+        except Py4JJavaError:  # target exists and overwrite is not set
+            return False
+
+    def copy_from_local(self, from_path: PathType, to_path: PathType, delete_source: bool = False) -> bool:
+        to_hadoop_path = self._path(to_path)
+        try:
+            self._file_system(to_hadoop_path).copyFromLocalFile(
+                delete_source, False, self._path(from_path), to_hadoop_path
+            )
+        except Py4JJavaError:
+            return False
+        return True
+
+    def copy_to_local(self, from_path: PathType, to_path: PathType) -> bool:
+        from_hadoop_path = self._path(from_path)
+        try:
+            # use the raw local file system, to avoid writing a checksum file alongside the copy
+            self._file_system(from_hadoop_path).copyToLocalFile(False, from_hadoop_path, self._path(to_path), True)
+        except Py4JJavaError:
+            return False
+        return True
+
+    def size(self, path: PathType) -> int:
+        hadoop_path = self._path(path)
+        return self._file_system(hadoop_path).getContentSummary(hadoop_path).getLength()
+
+    def disk_space_consumed(self, path: PathType) -> int:
+        hadoop_path = self._path(path)
+        return self._file_system(hadoop_path).getContentSummary(hadoop_path).getSpaceConsumed()
+
+    def read_bytes(self, path: PathType, num_bytes: Optional[int] = None) -> bytes:
+        hadoop_path = self._path(path)
+        input_stream = self._file_system(hadoop_path).open(hadoop_path)
+        try:
+            if num_bytes is not None:
+                input_stream = self._jvm.org.apache.commons.io.input.BoundedInputStream(input_stream, num_bytes)
+            return bytes(self._jvm.org.apache.commons.io.IOUtils.toByteArray(input_stream))
+        finally:
+            input_stream.close()
+
+    def write_bytes(self, path: PathType, content: bytes, overwrite: bool = False) -> bool:
+        hadoop_path = self._path(path)
+        try:
+            output_stream = self._file_system(hadoop_path).create(hadoop_path, overwrite)
+        except Py4JJavaError:  # file exists and overwrite is not set
+            return False
+        try:
+            output_stream.write(bytearray(content))
+        finally:
+            output_stream.close()
+        return True
+
+    def md5(self, path: PathType) -> str:
+        hadoop_path = self._path(path)
+        input_stream = self._file_system(hadoop_path).open(hadoop_path)
+        try:
+            return self._jvm.org.apache.commons.codec.digest.DigestUtils.md5Hex(input_stream)
+        finally:
+            input_stream.close()
+
+    def checksum(self, path: PathType) -> Optional[str]:
+        hadoop_path = self._path(path)
+        file_checksum = self._file_system(hadoop_path).getFileChecksum(hadoop_path)
+        return None if file_checksum is None else file_checksum.toString()
+
+    def _file_info(self, file_status, keep_scheme: bool) -> FileInfo:
+        path = file_status.getPath()
+        if not keep_scheme:
+            path = self._jvm.org.apache.hadoop.fs.Path.getPathWithoutSchemeAndAuthority(path)
+        return FileInfo(
+            path=path.toString(),
+            is_dir=file_status.isDirectory(),
+            size=file_status.getLen(),
+            modification_time=datetime.fromtimestamp(file_status.getModificationTime() / 1000),
+            owner=file_status.getOwner(),
+            group=file_status.getGroup(),
+            permission=("d" if file_status.isDirectory() else "-") + file_status.getPermission().toString(),
+        )
+
+    @staticmethod
+    def _has_scheme(hadoop_path) -> bool:
+        """Listed paths keep their scheme and authority only if the path they are listed from has one."""
+        return hadoop_path.toUri().getScheme() is not None
+
+    def get_status(self, path: PathType) -> Optional[FileInfo]:
+        file_status = self._get_file_status(path)
+        if file_status is None:
+            return None
+        return self._file_info(file_status, self._has_scheme(self._path(path)))
+
+    def glob_status(self, path: PathType) -> List[FileInfo]:
+        hadoop_path = self._path(path)
+        file_statuses = self._file_system(hadoop_path).globStatus(hadoop_path) or []
+        return sorted(
+            [self._file_info(file_status, self._has_scheme(hadoop_path)) for file_status in file_statuses],
+            key=lambda file_info: file_info.path,
+        )
+
+    def list_directory(self, path: PathType) -> List[FileInfo]:
+        hadoop_path = self._path(path)
+        file_statuses = self._file_system(hadoop_path).listStatus(hadoop_path)
+        return sorted(
+            [self._file_info(file_status, self._has_scheme(hadoop_path)) for file_status in file_statuses],
+            key=lambda file_info: file_info.path,
+        )
+
+
+def get_filesystem(path: PathType = "") -> Optional[FileSystem]:
+    """
+    Get the file system backend for a path, using the active SparkContext.
+
+    Paths with a `file:` scheme, and paths without a scheme when the default file system of the SparkContext is
+    local, use the local file system. Other paths use the Hadoop FileSystem API of the SparkContext.
+
+    Returns
+    -------
+    FileSystem - or None if there is no active SparkContext to get the Hadoop file system from
+    """
+    path = str(path)
+    if path.startswith("file:"):
+        return LocalFileSystem()
+    spark_context = SparkContext._active_spark_context
+    if spark_context is None:
+        return None
+    if "://" not in path:
+        default_file_system = spark_context._jsc.hadoopConfiguration().get("fs.defaultFS", "file:///")
+        if default_file_system.startswith("file:"):
+            return LocalFileSystem()
+    return HadoopFileSystem(spark_context)
@@ -1,9 +1,19 @@
-"""A collection of HDFS utils."""
+"""
+A collection of HDFS utils.
+
+Where there is an active SparkContext, these use the file system backends in `survey_pipeline_template.filesystem`.
+Otherwise they fall back to running `hadoop fs` commands.
+"""
+
+import hashlib
 import os
 import subprocess
 
 from pyspark.sql import SparkSession
 
+from survey_pipeline_template.filesystem import get_filesystem
+from survey_pipeline_template.filesystem import HadoopFileSystem
+
 
 def _perform(command, shell: bool = False, str_output: bool = False, ignore_error: bool = False, full_out=False):
     """
@@ -45,6 +55,9 @@ def isfile(path: str) -> bool:
     If checking that directory with partitioned files (i.e. csv, parquet)
     exists this will return false use isdir instead.
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return file_system.isfile(path)
     command = ["hadoop", "fs", "-test", "-f", path]
     return _perform(command)
 
@@ -57,6 +70,9 @@ def isdir(path: str) -> bool:
     -------
     True for successfully completed operation. Else False.
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return file_system.isdir(path)
     command = ["hadoop", "fs", "-test", "-d", path]
     return _perform(command)
 
@@ -70,6 +86,9 @@ def create_dir(path: str) -> bool:
     -------
     True for successfully completed operation. Else False.
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return file_system.create_dir(path)
     command = ["hadoop", "fs", "-mkdir", "-p", path]
     return _perform(command)
 
@@ -82,19 +101,25 @@ def delete_file(path: str):
     -------
     True for successfully completed operation. Else False.
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return file_system.isfile(path) and file_system.delete(path)
     command = ["hadoop", "fs", "-rm", path]
     return _perform(command)
 
 
-def delete_dir(path: str):
+def delete_dir(path: str, recursive: bool = False):
     """
-    Delete a directory. Uses 'hadoop fs -rmdir'.
+    Delete a directory. Uses 'hadoop fs -rmdir', or 'hadoop fs -rm -r' to delete a directory and its contents.
 
     Returns
     -------
     True for successfully completed operation. Else False.
     """
-    command = ["hadoop", "fs", "-rmdir", path]
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return file_system.isdir(path) and file_system.delete(path, recursive=recursive)
+    command = ["hadoop", "fs", "-rm", "-r", path] if recursive else ["hadoop", "fs", "-rmdir", path]
     return _perform(command)
 
 
@@ -110,6 +135,9 @@ def rename(from_path: str, to_path: str, overwrite=False) -> bool:
     if overwrite:
         delete_file(to_path)
 
+    file_system = get_filesystem(from_path)
+    if file_system is not None:
+        return file_system.rename(from_path, to_path)
     command = ["hadoop", "fs", "-mv", from_path, to_path]
     return _perform(command)
 
@@ -122,6 +150,9 @@ def copy(from_path, to_path, overwrite=False) -> bool:
     -------
     True for successfully completed operation. Else False.
     """
+    file_system = get_filesystem(from_path)
+    if file_system is not None:
+        return file_system.copy(from_path, to_path, overwrite=overwrite)
     if overwrite:
         return _perform(["hadoop", "fs", "-cp", "-f", from_path, to_path])
     else:
@@ -149,10 +180,35 @@ def copy_local_to_hdfs(from_path: str, to_path: str) -> bool:
 
     assert destination_path_creation is True, f"Unable to create destination path: {destination_path}"
 
+    file_system = get_filesystem(to_path)
+    if file_system is not None:
+        return file_system.copy_from_local(from_path, to_path)
     command = ["hadoop", "fs", "-copyFromLocal", from_path, to_path]
     return _perform(command)
 
 
+def copy_hdfs_to_local(from_path: str, to_path: str) -> bool:
+    """
+    Copy a file from HDFS to the local file system of the driver.
+
+    Parameters
+    ----------
+    from_path: str
+        path of file in HDFS
+    to_path: str
+        local path to copy the file to
+
+    Returns
+    -------
+    True for successfully completed operation. Else False.
+    """
+    file_system = get_filesystem(from_path)
+    if file_system is not None:
+        return file_system.copy_to_local(from_path, to_path)
+    command = ["hadoop", "fs", "-copyToLocal", from_path, to_path]
+    return _perform(command)
+
+
 def move_local_to_hdfs(from_path: str, to_path: str) -> bool:
     """
     Move a local file to HDFS.
@@ -168,6 +224,9 @@ def move_local_to_hdfs(from_path: str, to_path: str) -> bool:
     -------
     True for successfully completed operation. Else False.
     """
+    file_system = get_filesystem(to_path)
+    if file_system is not None:
+        return file_system.copy_from_local(from_path, to_path, delete_source=True)
     command = ["hadoop", "fs", "-moveFromLocal", from_path, to_path]
     return _perform(command)
 
@@ -184,14 +243,35 @@ def dir_size(path: str):
     -----
     Hadoop replicates data for resilience, disk space consumed is size x replication.
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return (
+            f"{_human_readable_size(file_system.size(path))}  "
+            f"{_human_readable_size(file_system.disk_space_consumed(path))}  {path}"
+        )
     command = ["hadoop", "fs", "-du", "-s", "-h", path]
     return _perform(command, str_output=True)
 
 
+def _human_readable_size(size: int) -> str:
+    """Format a size in bytes with a binary prefix, as output by 'hadoop fs -du -h'."""
+    if size < 1024:
+        return f"{size}"
+    scaled_size = float(size)
+    for prefix in ["K", "M", "G", "T"]:
+        scaled_size /= 1024
+        if scaled_size < 1024:
+            return f"{scaled_size:.1f} {prefix}"
+    return f"{scaled_size / 1024:.1f} P"
+
+
 def read_header(path: str):
     """
     Reads the first line of a file on HDFS
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return file_system.read_first_line(path)
     return _perform(f"hadoop fs -cat {path} | head -1", shell=True, str_output=True, ignore_error=True)
 
 
@@ -199,6 +279,9 @@ def write_string_to_file(content: bytes, path: str):
     """
     Writes a string into the specified file path
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return file_system.write_bytes(path, content)
     _write_string_to_file = subprocess.Popen(f"hadoop fs -put - {path}", stdin=subprocess.PIPE, shell=True)
     return _write_string_to_file.communicate(content)
 
@@ -207,6 +290,10 @@ def read_file_to_string(path: str, full_out: bool = False):
     """
     Reads file into a string
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        content = file_system.read_bytes(path)
+        return content if full_out else content.decode("UTF-8").strip("\n")
     command = ["hadoop", "fs", "-cat", path]
     return _perform(command, str_output=True, full_out=full_out)
 
@@ -215,6 +302,9 @@ def hdfs_stat_size(path: str):
     """
     Runs stat command on a file or directory to get the size in bytes.
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return str(file_system.size(path))
     command = ["hadoop", "fs", "-du", "-s", path]
     return _perform(command, str_output=True).split(" ")[0]
 
@@ -223,9 +313,43 @@ def hdfs_md5sum(path: str):
     """
     Get md5sum of a specific file on HDFS.
     """
+    file_system = get_filesystem(path)
+    if file_system is not None:
+        return file_system.md5(path)
     return _perform(f"hadoop fs -cat {path} | md5sum", shell=True, str_output=True, ignore_error=True).split(" ")[0]
 
 
+def get_path_fingerprint(path: str, use_checksums: bool = True):
+    """
+    Get a fingerprint of all files under a path, directory or glob pattern, using the file system backend for the path.
+    See `get_filesystem`.
+
+    Parameters
+    ----------
+    use_checksums
+        use file checksums where the file system provides them. Otherwise, or if they are not available,
+        file lengths and modification times are used
+
+    Returns
+    -------
+    str - md5 hex digest of the file details, or None if no files match the path
+    """
+    file_system = get_filesystem(path) or HadoopFileSystem(SparkSession.builder.getOrCreate().sparkContext)
+    if not file_system.glob_status(path):
+        return None
+
+    file_details = []
+    for file_info in file_system.list_status(path, recursive=True):
+        if file_info.is_dir:
+            continue
+        checksum = file_system.checksum(file_info.path) if use_checksums else None
+        if checksum is not None:
+            file_details.append(f"{file_info.path} {checksum}")
+        else:
+            file_details.append(f"{file_info.path} {file_info.size} {file_info.modification_time.isoformat()}")
+    return hashlib.md5("\n".join(sorted(file_details)).encode("UTF-8")).hexdigest()
+
+
 def cleanup_checkpoint_dir(spark: SparkSession):
     """Cleanup checkpoint files at the the end of the job
 
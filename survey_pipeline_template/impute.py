@@ -1,39 +1,148 @@
+import heapq
 import logging
+import random
 import sys
+import zlib
+from collections import namedtuple
 from datetime import datetime
+from functools import reduce
 from itertools import chain
+from itertools import groupby
+from operator import and_
 from typing import Callable
+from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import Union
 
+from pyspark.sql import Column
 from pyspark.sql import DataFrame
 from pyspark.sql import functions as F
-from pyspark.sql.types import ArrayType
 from pyspark.sql.types import DoubleType
-from pyspark.sql.types import StringType
+from pyspark.sql.types import MapType
 from pyspark.sql.window import Window
+from pyspark.sql.window import WindowSpec
 
 from survey_pipeline_template.derive import assign_random_day_in_month
 from survey_pipeline_template.expressions import any_column_not_null
-from survey_pipeline_template.merge import union_multiple_tables
-from survey_pipeline_template.pipeline.load import extract_from_table
-from survey_pipeline_template.pipeline.load import update_table
-from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+from survey_pipeline_template.pyspark_utils import spark_to_pandas
+
+KNNImputationDiagnostics = namedtuple(
+    "KNNImputationDiagnostics",
+    [
+        "input_count",
+        "impute_count",
+        "donor_count",
+        "imputation_group_count",
+        "no_donor_group_count",
+        "below_minimum_donor_group_count",
+        "output_count",
+        "missing_count",
+    ],
+)
+
+
+def _seeded_uniform(seed: int, *columns: str) -> Column:
+    """
+    Uniform random number in the open interval (0, 1), derived from a hash of a seed and the values of some columns, so
+    that it is reproducible regardless of how the data are partitioned.
+    """
+    return (F.hash(F.lit(seed), *columns).cast("double") + 2**31 + 0.5) / 2**32
 
 
-def generate_sample_proportional_to_size_udf(spark):
-    def sample_proportional_to_size(imputation_variables, expected_frequencies, number):
-        """UDF for sampling proportional to size."""
-        import numpy as np
+def sample_proportional_to_size(
+    df: DataFrame,
+    group_columns: List[str],
+    value_column: str,
+    size_column: str,
+    sample_count_column: str,
+    rng_seed: int,
+) -> DataFrame:
+    """
+    Sample rows without replacement with probability proportional to size, within each group.
 
-        results = np.random.choice(a=imputation_variables, p=expected_frequencies, replace=False, size=number).tolist()
-        return results
+    Uses the Efraimidis-Spirakis algorithm, which gives each row the key log(u) / size, for a uniform random number u,
+    and samples the rows with the largest keys in each group. This gives the same distribution as successively drawing
+    rows with probability proportional to size, as `numpy.random.choice` does without replacement.
 
-    spark.udf.register("sample_proportional_to_size_udf_reg", sample_proportional_to_size)
-    return F.udf(sample_proportional_to_size, ArrayType(StringType()))
+    Parameters
+    ----------
+    df
+    group_columns
+        columns identifying the groups to sample from
+    value_column
+        column of values to sample, unique within each group
+    size_column
+        column of positive sizes, proportional to the probability of sampling each value
+    sample_count_column
+        column of the number of values to sample from each group, constant within each group
+    rng_seed
+        random number generator seed. Random numbers are derived from the seed, group and value of each row
+    """
+    sampling_key = F.log(_seeded_uniform(rng_seed, *group_columns, value_column)) / F.col(size_column)
+    sampling_window = Window.partitionBy(*group_columns).orderBy(sampling_key.desc(), F.col(value_column))
+    return (
+        df.withColumn("_sampling_rank", F.row_number().over(sampling_window))
+        .filter(F.col("_sampling_rank") <= F.col(sample_count_column))
+        .drop("_sampling_rank")
+    )
 
 
-sample_proportional_to_size_udf = generate_sample_proportional_to_size_udf(get_or_create_spark_session())
+def deduplicate_target_events(
+    df: DataFrame,
+    target_date_column: str,
+    target_date_tolerance: int,
+    participant_id_column: str,
+    event_datetime_column: str,
+    event_id_column: str,
+) -> DataFrame:
+    """
+    Disambiguate target events by the earliest recorded expression of each event.
+
+    Taking each participant's records in order of event datetime, a record is kept as a distinct event if its target
+    date is not within the tolerance of the target date of an event that has already been kept. The records are
+    folded over in a single pass, with an array aggregate over each participant's sorted records.
+
+    Parameters
+    ----------
+    df
+        records with a target date on or before their event datetime
+    target_date_column
+        date of the target event
+    target_date_tolerance
+        maximum number of days between target dates of records that express the same event
+    participant_id_column
+    event_datetime_column
+    event_id_column
+        used to order records with the same event datetime
+    """
+    # the event datetime and id come first so that each participant's records are sorted by them
+    event_columns = [event_datetime_column, event_id_column]
+    event_columns += [column for column in df.columns if column not in [participant_id_column, *event_columns]]
+    event_struct = F.struct(*event_columns)
+    kept_events = F.expr(f"""
+        aggregate(
+            _events,
+            filter(_events, event -> false),
+            (kept_events, event) -> IF(
+                exists(
+                    kept_events,
+                    kept_event -> abs(datediff(kept_event.`{target_date_column}`, event.`{target_date_column}`))
+                        <= {target_date_tolerance}
+                ),
+                kept_events,
+                concat(kept_events, array(event))
+            )
+        )
+        """)
+    return (
+        df.groupBy(participant_id_column)
+        .agg(F.array_sort(F.collect_list(event_struct)).alias("_events"))
+        .select(participant_id_column, F.explode(kept_events).alias("_event"))
+        .select(participant_id_column, *[F.col("_event").getField(column).alias(column) for column in event_columns])
+    )
 
 
 def fill_forward_target_columns(
@@ -45,7 +154,6 @@ def fill_forward_target_columns(
     participant_id_column: str,
     event_datetime_column: str,
     event_id_column: str,
-    use_hdfs: bool = True,
 ):
     """
     Fill forwards all target columns assocaited with a target event.
@@ -65,10 +173,7 @@ def fill_forward_target_columns(
     event_id_column
     """
     event_columns = [target_date_column, target_indicator_column, *detail_columns]
-    ordering_window = Window.partitionBy(participant_id_column).orderBy(event_datetime_column)
     window = Window.partitionBy(participant_id_column, event_datetime_column, event_id_column).orderBy("VISIT_DIFF")
-    completed_sections = []
-    events_df = None
     # ~~ Pre process dataframe to remove unworkable rows ~~ #
     filtered_df = df.filter(
         (F.col(event_datetime_column).isNotNull())
@@ -78,46 +183,20 @@ def fill_forward_target_columns(
     null_df = df.filter(F.col(event_datetime_column).isNull())
     df = df.filter(F.col(event_datetime_column).isNotNull())
     # ~~ Normalise dates ~~ #
-    # create an expression for when a series of dates has been normalised
-    # gets the date difference between the first row by visit datetime in the filtered dataset
-    apply_logic = (
-        F.abs(F.datediff(F.first(F.col(target_date_column)).over(ordering_window), F.col(target_date_column)))
-        <= target_date_tolerance
-    )
-    # optimise the filtered_df schema and cache to improve spark plan creation / runtime
-    filtered_df = filtered_df.select(
-        participant_id_column, event_datetime_column, event_id_column, *event_columns
+    events_df = deduplicate_target_events(
+        filtered_df.select(participant_id_column, event_datetime_column, event_id_column, *event_columns),
+        target_date_column,
+        target_date_tolerance,
+        participant_id_column,
+        event_datetime_column,
+        event_id_column,
     ).cache()
-    # loops until there are no rows left to normalise getting the first row where that satisfies the `apply_logic` condition
-    i = 0
-    while filtered_df.count() > 0:
-        filtered_df = filtered_df.withColumn("LOGIC_APPLIED", apply_logic)
-        temp_df = filtered_df.withColumn("ROW", F.row_number().over(ordering_window))
-        if not use_hdfs:
-            completed_sections.append(temp_df.filter(F.col("LOGIC_APPLIED") & (F.col("ROW") == 1)).drop("ROW"))
-        else:
-            mode = "overwrite" if i == 0 else "append"
-            update_table(
-                temp_df.filter(F.col("LOGIC_APPLIED") & (F.col("ROW") == 1)).drop("ROW"),
-                f"{target_indicator_column}_temp_lookup",
-                mode,
-            )
-        filtered_df = filtered_df.filter(~F.col("LOGIC_APPLIED"))
-        i += 1
-    # combine the sections of normalised dates together and rejoin the null data
-    if not use_hdfs:
-        if len(completed_sections) >= 2:
-            events_df = union_multiple_tables(completed_sections)
-        elif len(completed_sections) == 1:
-            events_df = completed_sections[0]
-    else:
-        events_df = extract_from_table(f"{target_indicator_column}_temp_lookup", True)
 
     # ~~ Construct resultant dataframe by fill forwards ~~#
 
     # use this columns to override the original dataframe
 
-    if events_df is not None and events_df.count() > 0:
+    if events_df.count() > 0:
         df = (
             df.drop(*event_columns)
             .join(events_df.select(participant_id_column, *event_columns), on=participant_id_column, how="left")
@@ -276,6 +355,31 @@ def fill_forward_from_last_change(
     )
 
 
+def fill_using_windows(
+    df: DataFrame, fill_specifications: List[Tuple[List[str], WindowSpec, Callable[..., Column]]]
+) -> DataFrame:
+    """
+    Fill several lists of columns, each with a window and a window function that ignores nulls, such as `F.first` or
+    `F.last`. Columns are filled in a single select, so that Spark plans one window operator for each distinct window
+    rather than one projection per column. Where a column is in more than one of the specifications, it is filled again
+    in a following select using the values from the earlier fill.
+
+    Parameters
+    ----------
+    df
+    fill_specifications
+        list of tuples of the columns to fill, the window to fill them over and the window function to fill with
+    """
+    fill_expressions: Dict[str, Column] = {}
+    for columns, window, fill_function in fill_specifications:
+        if any(column in fill_expressions for column in columns):
+            df = df.select(*[fill_expressions.get(column, F.col(column)) for column in df.columns])
+            fill_expressions = {}
+        for column in columns:
+            fill_expressions[column] = fill_function(column, ignorenulls=True).over(window).alias(column)
+    return df.select(*[fill_expressions.get(column, F.col(column)) for column in df.columns])
+
+
 def fill_forward_only_to_nulls(
     df: DataFrame,
     id: str,
@@ -287,15 +391,7 @@ def fill_forward_only_to_nulls(
     """
 
     window = Window.partitionBy(id).orderBy(date)
-
-    for fill_forward_column in list_fill_forward:
-        df = df.withColumn(
-            fill_forward_column,
-            F.coalesce(
-                F.last(fill_forward_column, ignorenulls=True).over(window),
-            ),
-        )
-    return df
+    return fill_using_windows(df, [(list_fill_forward, window, F.last)])
 
 
 def fill_backwards_overriding_not_nulls(
@@ -325,12 +421,7 @@ def fill_backwards_overriding_not_nulls(
         .orderBy(F.col(dataset_column).desc(), F.col(ordering_column).desc())
         .rowsBetween(Window.unboundedPreceding, Window.currentRow)
     )
-    for column in column_list:
-        df = df.withColumn(
-            column,
-            F.first(F.col(column), ignorenulls=True).over(window),
-        )
-    return df
+    return fill_using_windows(df, [(column_list, window, F.first)])
 
 
 def impute_by_distribution(
@@ -646,6 +737,8 @@ def _validate_donor_group_variables(
         raise ValueError(message)
 
     df_dtypes = dict(df.dtypes)
+    bound_messages = []
+    bound_counts = []
     for var in donor_group_variable_conditions.keys():
         if len(donor_group_variable_conditions[var]) != 3:
             message = f"Missing boundary conditions for {var}. Needs to be in format [Min, Max, Dtype]"
@@ -658,17 +751,22 @@ def _validate_donor_group_variables(
                 logging.warning(f"{var} dtype is {df_dtypes[var]} and not the required {var_dtype}")
 
         if var_min is not None:
-            var_min_count = df.filter(F.col(var) > var_min).count()
-            if var_min_count > 0:
-                logging.warning(f"{var_min_count} rows have {var} below {var_min}" % (var_min_count, var, var_min))
+            bound_messages.append(f"rows have {var} below {var_min}")
+            bound_counts.append(F.sum((F.col(var) < var_min).cast("integer")))
 
         if var_max is not None:
-            var_max_count = df.filter(F.col(var) < var_max).count()
-            if var_max_count > 0:
-                logging.warning(f"{var_max_count} rows have {var} above {var_max}")
+            bound_messages.append(f"rows have {var} above {var_max}")
+            bound_counts.append(F.sum((F.col(var) > var_max).cast("integer")))
+
+    if bound_counts:
+        # count rows outside of all bounds in one pass over the data
+        bound_count_row = df.agg(*bound_counts).first()
+        for bound_message, bound_count in zip(bound_messages, bound_count_row):
+            if bound_count:
+                logging.warning(f"{bound_count} {bound_message}")
 
     logging.info("Summary statistics for donor group variables:")
-    logging.info(df.select(donor_group_columns).summary().toPandas())
+    logging.info(spark_to_pandas(df.select(donor_group_columns).summary()))
 
 
 def weighted_distance(df, group_id, donor_group_columns, donor_group_column_weights):
@@ -701,6 +799,104 @@ def weighted_distance(df, group_id, donor_group_columns, donor_group_column_weig
     return df
 
 
+def _iterate_mismatched_columns(weights: List[float]) -> Iterator[Tuple[float, Tuple[int, ...]]]:
+    """
+    Generate every set of column indexes with its total weight, in order of total weight, without enumerating the sets
+    up front. Each set is followed by the set with the next heavier column added, and the set with its heaviest column
+    replaced by the next heavier column, so that all sets are generated once. Weights must not be negative.
+    """
+    order = sorted(range(len(weights)), key=lambda i: weights[i])
+    heap: List[Tuple[float, Tuple[int, ...]]] = [(0.0, ())]
+    while heap:
+        distance, positions = heapq.heappop(heap)
+        yield distance, tuple(sorted(order[position] for position in positions))
+        next_position = positions[-1] + 1 if positions else 0
+        if next_position < len(order):
+            next_position_sets = [positions + (next_position,)]
+            if positions:
+                next_position_sets.append(positions[:-1] + (next_position,))
+            for next_positions in next_position_sets:
+                next_distance = sum(weights[order[position]] for position in next_positions)
+                heapq.heappush(heap, (next_distance, next_positions))
+
+
+def find_nearest_donor_groups(
+    imputing_df: DataFrame,
+    donor_df: DataFrame,
+    donor_group_columns: List[str],
+    donor_group_column_weights: List[float],
+    maximum_distance: Optional[float] = None,
+) -> DataFrame:
+    """
+    Find the donor groups with the minimum weighted distance to each imputation group, without pairing every
+    imputation group with every donor group.
+
+    The weighted distance between two groups is the sum of the weights of the donor group columns that they differ on,
+    so an imputation group is a distance of at most d from any donor group that exactly matches it on the columns
+    outside of a set of mismatched columns with total weight d. Mismatched column sets are tried in order of their
+    total weight, joining the imputation groups that have no donors yet to the donor groups on the remaining columns.
+    Each imputation group is resolved by the first set of mismatches that finds any donors for it, which gives the same
+    donor groups as `weighted_distance` over all pairs of groups. Sets of mismatches are generated as they are needed,
+    so no sets beyond the maximum distance, or the distance at which all imputation groups are resolved, are enumerated.
+
+    Parameters
+    ----------
+    imputing_df
+        unique imputation groups, with the donor group columns and `unique_imputation_group`
+    donor_df
+        unique donor groups, with the donor group columns prefixed with 'don_' and `unique_donor_group`
+    donor_group_columns
+    donor_group_column_weights
+        weight to apply to distance of each group column
+    maximum_distance
+        maximum weighted distance for a valid donor. Set to None for no maximum.
+
+    Returns
+    -------
+    DataFrame - `unique_imputation_group` and `unique_donor_group` of the nearest donor groups. Imputation groups with
+    no donor groups within the maximum distance are not included
+    """
+    remaining_df = imputing_df.select("unique_imputation_group", *donor_group_columns).cache()
+    nearest_dfs = []
+    mismatches = groupby(
+        _iterate_mismatched_columns(donor_group_column_weights), key=lambda mismatch: round(mismatch[0], 10)
+    )
+    for distance, distance_mismatches in mismatches:
+        if maximum_distance is not None and distance > maximum_distance:
+            break
+        matched_dfs = []
+        for _, mismatched_columns in distance_mismatches:
+            matched_columns = [var for i, var in enumerate(donor_group_columns) if i not in mismatched_columns]
+            if matched_columns:
+                matched_df = remaining_df.join(
+                    donor_df,
+                    on=reduce(and_, [F.col(var).eqNullSafe(F.col("don_" + var)) for var in matched_columns]),
+                )
+            else:
+                matched_df = remaining_df.crossJoin(donor_df)
+            matched_dfs.append(matched_df.select("unique_imputation_group", "unique_donor_group"))
+        distance_df = reduce(DataFrame.unionByName, matched_dfs).distinct().cache()
+        nearest_dfs.append(distance_df)
+
+        previous_remaining_df = remaining_df
+        remaining_df = remaining_df.join(distance_df, on="unique_imputation_group", how="left_anti").cache()
+        remaining_count = remaining_df.count()
+        previous_remaining_df.unpersist()
+        if remaining_count == 0:
+            break
+    remaining_df.unpersist()
+
+    if not nearest_dfs:
+        return (
+            imputing_df.crossJoin(donor_df).select("unique_imputation_group", "unique_donor_group").filter(F.lit(False))
+        )
+    # materialise the nearest donor groups once, so that the donor groups found at each distance can be released
+    nearest_df = reduce(DataFrame.unionByName, nearest_dfs).localCheckpoint()
+    for distance_df in nearest_dfs:
+        distance_df.unpersist()
+    return nearest_df
+
+
 def impute_by_k_nearest_neighbours(
     df: DataFrame,
     column_name_to_assign: str,
@@ -711,6 +907,9 @@ def impute_by_k_nearest_neighbours(
     donor_group_column_weights: list = None,
     donor_group_column_conditions: dict = None,
     maximum_distance: int = 4999,
+    rng_seed: Optional[int] = None,
+    return_diagnostics: bool = False,
+    record_id_columns: Optional[List[str]] = None,
 ):
     """
     Minimal PySpark implementation of RBEIS, for K-nearest neighbours imputation.
@@ -737,6 +936,20 @@ def impute_by_k_nearest_neighbours(
         minimum number of donors required in each imputation pool, must be >= 0
     maximum_distance
         maximum sum weighted distance for a valid donor. Set to None for no maximum.
+    rng_seed
+        random number generator seed for the selection of donor values, making the function deterministic. A random
+        seed is used and logged if not set.
+        Random numbers are also derived from the name of the reference column and each imputation group
+    return_diagnostics
+        return a `KNNImputationDiagnostics` of the record and donor pool counts along with the imputed dataframe
+    record_id_columns
+        columns identifying each record, from which the order that records are matched to selected donor values is
+        derived, so that each record is imputed the same value however the data are partitioned. All columns that can
+        be hashed are used if not set
+
+    Returns
+    -------
+    DataFrame - or a tuple of the DataFrame and its `KNNImputationDiagnostics` if return_diagnostics is set
 
     Note
     ----
@@ -752,6 +965,9 @@ def impute_by_k_nearest_neighbours(
         message = f"Imputation columns ({donor_group_columns}) are not all found in input dataset."
         raise ValueError(message)
 
+    if record_id_columns is None:
+        record_id_columns = [field.name for field in df.schema.fields if not isinstance(field.dataType, MapType)]
+
     to_impute_condition = F.col(reference_column).isNull()
     donor_df = df.filter(~to_impute_condition)
     donor_df = donor_df.withColumn("unique_donor_group", F.concat_ws("-", *donor_group_columns))
@@ -759,16 +975,15 @@ def impute_by_k_nearest_neighbours(
     df = df.withColumn("unique_imputation_group", F.when(to_impute_condition, F.concat_ws("-", *donor_group_columns)))
     imputing_df = df.filter(to_impute_condition)
 
-    input_df_length = df.count()
-    impute_count = imputing_df.count()
-    donor_count = donor_df.count()
-
-    assert (
-        impute_count + donor_count == input_df_length
-    ), "Donor and imputing records don't sum to the whole df length"  # noqa: E501
+    input_counts = df.agg(F.count("*"), F.sum(to_impute_condition.cast("integer"))).first()
+    input_df_length = input_counts[0]
+    impute_count = input_counts[1] or 0
+    donor_count = input_df_length - impute_count
 
     if impute_count == 0:
-        return df.withColumn(column_name_to_assign, F.lit(None).cast(df.schema[reference_column].dataType))
+        df = df.withColumn(column_name_to_assign, F.lit(None).cast(df.schema[reference_column].dataType))
+        diagnostics = KNNImputationDiagnostics(input_df_length, 0, donor_count, 0, 0, 0, input_df_length, 0)
+        return (df, diagnostics) if return_diagnostics else df
     _create_log(start_time=datetime.now(), log_path=log_file_path)
     logging.info(f"Function parameters:\n{locals()}")
 
@@ -793,6 +1008,12 @@ def impute_by_k_nearest_neighbours(
         df, reference_column, donor_group_columns, donor_group_column_weights, donor_group_column_conditions
     )
 
+    if rng_seed is None:
+        rng_seed = random.randrange(2**31)
+    logging.info(f"Random number generator seed: {rng_seed}")
+    # separate random numbers for each imputed column, when imputing several columns with the same seed
+    rng_seed = zlib.crc32(f"{rng_seed}-{reference_column}".encode("UTF-8"))
+
     imputing_df_unique = imputing_df.dropDuplicates(donor_group_columns).select(
         donor_group_columns + ["unique_imputation_group"]
     )
@@ -802,14 +1023,9 @@ def impute_by_k_nearest_neighbours(
         donor_df_unique = donor_df_unique.withColumnRenamed(var, "don_" + var)
         donor_df = donor_df.withColumnRenamed(var, "don_" + var)
 
-    joined_uniques = imputing_df_unique.crossJoin(donor_df_unique)
-    joined_uniques = joined_uniques.repartition("unique_imputation_group")
-
-    candidates = weighted_distance(
-        joined_uniques, "unique_imputation_group", donor_group_columns, donor_group_column_weights
-    ).select("unique_imputation_group", "unique_donor_group")
-    if maximum_distance is not None:
-        candidates = candidates.where(F.col("distance") <= maximum_distance)
+    candidates = find_nearest_donor_groups(
+        imputing_df_unique, donor_df_unique, donor_group_columns, donor_group_column_weights, maximum_distance
+    )
 
     frequencies = donor_df.groupby("unique_donor_group", "don_" + reference_column).agg(
         F.count("*").alias("donor_group_value_frequency")
@@ -820,14 +1036,35 @@ def impute_by_k_nearest_neighbours(
         on="unique_imputation_group",
     )
 
-    frequencies.cache().count()
+    frequencies.cache()
+
+    # count the donor pools with no donors or too few donors in one pass, which also fills the cache
+    donor_pool_counts = (
+        imputing_df_unique.select("unique_imputation_group")
+        .join(
+            frequencies.groupBy("unique_imputation_group").agg(
+                F.sum("donor_group_value_frequency").alias("total_donor_pool_size")
+            ),
+            on="unique_imputation_group",
+            how="left",
+        )
+        .agg(
+            F.count("*"),
+            F.sum(F.col("total_donor_pool_size").isNull().cast("integer")),
+            F.sum((F.col("total_donor_pool_size") < minimum_donors).cast("integer")),
+        )
+        .first()
+    )
+    imputation_group_count = donor_pool_counts[0]
+    no_donors_count = donor_pool_counts[1] or 0
+    below_minimum_donor_count_count = donor_pool_counts[2] or 0
 
-    no_donors = imputing_df_unique.join(frequencies, on="unique_imputation_group", how="left_anti")
-    no_donors_count = no_donors.count()
     if no_donors_count != 0:
         message = f"{no_donors_count} donor pools with no donors"
         logging.error(message)
-        logging.error(no_donors.toPandas())
+        logging.error(
+            spark_to_pandas(imputing_df_unique.join(frequencies, on="unique_imputation_group", how="left_anti"))
+        )
         raise ValueError(message)
 
     unique_imputation_group_window = Window.partitionBy("unique_imputation_group")
@@ -835,15 +1072,13 @@ def impute_by_k_nearest_neighbours(
         "total_donor_pool_size", F.sum("donor_group_value_frequency").over(unique_imputation_group_window)
     )
 
-    below_minimum_donor_count = frequencies.filter(F.col("total_donor_pool_size") < minimum_donors)
-    below_minimum_donor_count_count = below_minimum_donor_count.count()
     if below_minimum_donor_count_count > 0:
         message = (
             f"{below_minimum_donor_count_count} donor pools found with less than the required {minimum_donors} "
             "minimum donor(s)"
         )
         logging.error(message)
-        logging.error(frequencies.filter(F.col("donor_group_value_frequency") < minimum_donors).toPandas())
+        logging.error(spark_to_pandas(frequencies.filter(F.col("donor_group_value_frequency") < minimum_donors)))
         raise ValueError(message)
 
     frequencies = frequencies.withColumn(
@@ -871,8 +1106,7 @@ def impute_by_k_nearest_neighbours(
     )
     integer_part_donors = integer_part_donors.filter(F.col("expected_frequency_integer_part") >= 1)
     integer_part_donors = integer_part_donors.withColumn(
-        "expected_frequency_integer_part",
-        F.expr("explode(array_repeat(expected_frequency_integer_part, int(expected_frequency_integer_part)))"),
+        "donor_copy", F.explode(F.sequence(F.lit(1), F.col("expected_frequency_integer_part").cast("int")))
     )
 
     decimal_part_donors = frequencies.filter(F.col("expected_frequency_decimal_part") > 0).select(
@@ -882,65 +1116,128 @@ def impute_by_k_nearest_neighbours(
         "required_decimal_donor_count",
     )
 
-    rescale_window = Window.partitionBy("unique_imputation_group")
-
-    decimal_part_donors = decimal_part_donors.withColumn(
-        "expected_frequency_decimal_part_total", F.sum(F.col("expected_frequency_decimal_part")).over(rescale_window)
-    )
-    decimal_part_donors = decimal_part_donors.withColumn(
-        "expected_frequency_decimal_part",
-        F.col("expected_frequency_decimal_part") / F.col("expected_frequency_decimal_part_total"),
-    )
-
-    decimal_parts_grouped = decimal_part_donors.groupby("unique_imputation_group").agg(
-        F.collect_list("don_" + reference_column).alias("don_" + reference_column),
-        F.collect_list("expected_frequency_decimal_part").alias("expected_frequency_decimal_part"),
-        F.first("required_decimal_donor_count").alias("required_decimal_donor_count"),
+    decimal_part_donors = sample_proportional_to_size(
+        decimal_part_donors,
+        group_columns=["unique_imputation_group"],
+        value_column="don_" + reference_column,
+        size_column="expected_frequency_decimal_part",
+        sample_count_column="required_decimal_donor_count",
+        rng_seed=rng_seed,
+    ).withColumn("donor_copy", F.lit(0))
+
+    to_impute_df = integer_part_donors.select(
+        "unique_imputation_group", "don_" + reference_column, "donor_copy"
+    ).unionByName(decimal_part_donors.select("unique_imputation_group", "don_" + reference_column, "donor_copy"))
+    rand_uniques_window = Window.partitionBy("unique_imputation_group").orderBy(
+        _seeded_uniform(rng_seed, "unique_imputation_group", "don_" + reference_column, "donor_copy")
     )
-
-    decimals_to_impute = decimal_parts_grouped.withColumn(
-        "don_" + reference_column,
-        sample_proportional_to_size_udf(
-            "don_" + reference_column, "expected_frequency_decimal_part", "required_decimal_donor_count"
-        ),
-    )
-
-    decimals_to_impute = decimals_to_impute.select("unique_imputation_group", "don_" + reference_column)
-
-    decimal_part_donors = decimals_to_impute.withColumn(
-        "don_" + reference_column, F.explode(F.col("don_" + reference_column))
-    )
-
-    to_impute_df = integer_part_donors.select("unique_imputation_group", "don_" + reference_column).unionByName(
-        decimal_part_donors.select("unique_imputation_group", "don_" + reference_column)
-    )
-    rand_uniques_window = Window.partitionBy("unique_imputation_group").orderBy(F.rand())
     to_impute_df = to_impute_df.withColumn("donor_row_id", F.row_number().over(rand_uniques_window))
 
-    to_impute_df = to_impute_df.withColumnRenamed("don_" + reference_column, column_name_to_assign)
+    to_impute_df = to_impute_df.withColumnRenamed("don_" + reference_column, column_name_to_assign).drop("donor_copy")
 
-    unique_imputation_group_window = Window.partitionBy("unique_imputation_group").orderBy(F.lit(None))
+    unique_imputation_group_window = Window.partitionBy("unique_imputation_group").orderBy(
+        _seeded_uniform(rng_seed, *record_id_columns), *record_id_columns
+    )
     df = df.withColumn("donor_row_id", F.row_number().over(unique_imputation_group_window))
     df = df.join(to_impute_df, on=["unique_imputation_group", "donor_row_id"], how="left").drop(
         "unique_imputation_group", "donor_row_id"
     )
 
-    output_df_length = df.cache().count()
+    df.cache()
+    output_counts = df.agg(
+        F.count("*"),
+        F.sum((F.col(reference_column).isNull() & F.col(column_name_to_assign).isNull()).cast("integer")),
+    ).first()
+    output_df_length = output_counts[0]
+    missing_count = output_counts[1] or 0
     logging.info(
         f"Summary statistics for imputed values ({column_name_to_assign}) and donor values ({reference_column}):"
     )
-    logging.info(df.select(column_name_to_assign, reference_column).summary().toPandas())
+    logging.info(spark_to_pandas(df.select(column_name_to_assign, reference_column).summary()))
     if output_df_length != input_df_length:
         raise ValueError(
             f"{output_df_length} records are found in the output, which is not equal to {input_df_length} in the input."  # noqa: E501
         )
 
-    missing_count = df.filter(F.col(reference_column).isNull() & F.col(column_name_to_assign).isNull()).count()
     if missing_count != 0:
         raise ValueError(f"{missing_count} records still have missing '{reference_column}' after imputation.")
 
+    diagnostics = KNNImputationDiagnostics(
+        input_count=input_df_length,
+        impute_count=impute_count,
+        donor_count=donor_count,
+        imputation_group_count=imputation_group_count,
+        no_donor_group_count=no_donors_count,
+        below_minimum_donor_group_count=below_minimum_donor_count_count,
+        output_count=output_df_length,
+        missing_count=missing_count,
+    )
+    logging.info(f"KNN imputation diagnostics: {dict(diagnostics._asdict())}")
     logging.info("KNN imputation completed\n")
-    return df
+    return (df, diagnostics) if return_diagnostics else df
+
+
+def impute_columns_by_k_nearest_neighbours(
+    df: DataFrame,
+    column_names_to_assign: List[str],
+    reference_columns: List[str],
+    donor_group_columns: List[str],
+    log_file_path: str,
+    minimum_donors: int = 1,
+    donor_group_column_weights: list = None,
+    donor_group_column_conditions: dict = None,
+    maximum_distance: int = 4999,
+    rng_seed: Optional[int] = None,
+) -> DataFrame:
+    """
+    Impute several correlated columns jointly by K-nearest neighbours, in a single pass.
+    Each imputed record takes all of its values from the same donor, so the imputed values keep the joint distribution
+    of the donor values as well as the distribution of each column.
+
+    Records are imputed where any of the reference columns are missing, from donors that have all of the reference
+    columns. The imputed columns are null for records that are not imputed.
+
+    Parameters
+    ----------
+    df
+    column_names_to_assign
+        columns to store imputed values, in the order of the reference columns
+    reference_columns
+        columns that missing values should be imputed for
+    donor_group_columns
+    log_file_path
+    minimum_donors
+    donor_group_column_weights
+    donor_group_column_conditions
+    maximum_distance
+    rng_seed
+
+    See Also
+    --------
+    impute_by_k_nearest_neighbours - for a description of the remaining arguments of this function
+    """
+    if len(column_names_to_assign) != len(reference_columns):
+        raise ValueError("A column to assign is needed for each of the reference columns.")
+
+    df = df.withColumn(
+        "_joint_reference",
+        F.when(reduce(and_, [F.col(column).isNotNull() for column in reference_columns]), F.struct(*reference_columns)),
+    )
+    df = impute_by_k_nearest_neighbours(
+        df=df,
+        column_name_to_assign="_joint_imputed",
+        reference_column="_joint_reference",
+        donor_group_columns=donor_group_columns,
+        log_file_path=log_file_path,
+        minimum_donors=minimum_donors,
+        donor_group_column_weights=donor_group_column_weights,
+        donor_group_column_conditions=donor_group_column_conditions,
+        maximum_distance=maximum_distance,
+        rng_seed=rng_seed,
+    )
+    for column_name_to_assign, reference_column in zip(column_names_to_assign, reference_columns):
+        df = df.withColumn(column_name_to_assign, F.col("_joint_imputed").getField(reference_column))
+    return df.drop("_joint_reference", "_joint_imputed")
 
 
 def impute_date_by_k_nearest_neighbours(
@@ -953,6 +1250,8 @@ def impute_date_by_k_nearest_neighbours(
     donor_group_column_weights: list = None,
     donor_group_column_conditions: dict = None,
     maximum_distance: int = 4999,
+    rng_seed: Optional[int] = None,
+    joint: bool = False,
 ) -> DataFrame:
     """Impute dates by K-nearest neighbour
 
@@ -967,6 +1266,9 @@ def impute_date_by_k_nearest_neighbours(
     donor_group_column_weights
     donor_group_column_conditions
     maximum_distance
+    rng_seed
+    joint
+        impute the year and month together from the same donor in one pass, rather than imputing each separately
 
     See Also
     --------
@@ -976,6 +1278,21 @@ def impute_date_by_k_nearest_neighbours(
     df = df.withColumn("_month", F.month(reference_column))
     df = df.withColumn("_year", F.year(reference_column))
 
+    if joint:
+        df = impute_columns_by_k_nearest_neighbours(
+            df=df,
+            column_names_to_assign=["_IMPUTED_year", "_IMPUTED_month"],
+            reference_columns=["_year", "_month"],
+            donor_group_columns=donor_group_columns,
+            log_file_path=log_file_path,
+            minimum_donors=minimum_donors,
+            donor_group_column_weights=donor_group_column_weights,
+            donor_group_column_conditions=donor_group_column_conditions,
+            maximum_distance=maximum_distance,
+            rng_seed=rng_seed,
+        ).custom_checkpoint()
+        return _assign_imputed_date(df, column_name_to_assign)
+
     df = impute_by_k_nearest_neighbours(
         df=df,
         column_name_to_assign="_IMPUTED_month",
@@ -986,6 +1303,7 @@ def impute_date_by_k_nearest_neighbours(
         donor_group_column_weights=donor_group_column_weights,
         donor_group_column_conditions=donor_group_column_conditions,
         maximum_distance=maximum_distance,
+        rng_seed=rng_seed,
     ).custom_checkpoint()
 
     df = impute_by_k_nearest_neighbours(
@@ -998,8 +1316,13 @@ def impute_date_by_k_nearest_neighbours(
         donor_group_column_weights=donor_group_column_weights,
         donor_group_column_conditions=donor_group_column_conditions,
         maximum_distance=maximum_distance,
+        rng_seed=rng_seed,
     ).custom_checkpoint()
+    return _assign_imputed_date(df, column_name_to_assign)
+
 
+def _assign_imputed_date(df: DataFrame, column_name_to_assign: str) -> DataFrame:
+    """Assign a random day within the imputed month and year."""
     df = df.drop("_month", "_year")
 
     df = assign_random_day_in_month(
@@ -1,3 +1,7 @@
+from functools import reduce
+from operator import and_
+from typing import Callable
+from typing import List
 from typing import Optional
 
 import pyspark.sql.functions as F
@@ -25,6 +29,16 @@ from survey_pipeline_template.impute import impute_date_by_k_nearest_neighbours
 from survey_pipeline_template.impute import merge_previous_imputed_values
 from survey_pipeline_template.merge import left_join_keep_right
 from survey_pipeline_template.pipeline.config import get_config
+from survey_pipeline_template.pipeline.load import get_run_id
+
+IMPUTED_KEY_COLUMNS = ["ethnicity_white", "sex", "date_of_birth"]
+IMPUTATION_REFERENCE_COLUMNS = [
+    "ons_household_id",
+    "cis_area_code_20",
+    "region_code",
+    "people_in_household_count_group",
+    "work_status_group",
+]
 
 
 def demographic_transformations(
@@ -32,11 +46,18 @@ def demographic_transformations(
     geography_lookup_df: DataFrame,
     rural_urban_lookup_df: DataFrame,
     imputed_value_lookup_df: Optional[DataFrame] = None,
+    incremental_imputation: bool = False,
 ):
     """
     Modify the unioned survey response files by transforming the demographic data columns.
 
     call all functions in order necessary to update the demographic columns.
+
+    Parameters
+    ----------
+    incremental_imputation
+        only impute participants whose key imputation inputs are new or have changed since the imputed value lookup
+        was written, and return the updated lookup
     """
     log_directory: str = get_config()["imputation_log_directory"]
 
@@ -47,7 +68,15 @@ def demographic_transformations(
     df = fill_forwards_and_backwards(df).custom_checkpoint()
     df = ethnicity_transformations(df).custom_checkpoint()
     df = derive_people_in_household_count(df).custom_checkpoint()
-    imputed_demographic_columns_df = impute_key_columns(df, imputed_value_lookup_df, log_directory).custom_checkpoint()
+    # imputed values are reproducible within a run
+    imputed_demographic_columns_df = impute_key_columns(
+        df, imputed_value_lookup_df, log_directory, rng_seed=get_run_id(), incremental=incremental_imputation
+    ).custom_checkpoint()
+    if incremental_imputation:
+        imputed_value_lookup_df = imputed_demographic_columns_df
+        imputed_demographic_columns_df = imputed_demographic_columns_df.drop(
+            "imputation_input_hash", *IMPUTATION_REFERENCE_COLUMNS
+        )
     df = geography_dependent_transformations(
         df=df, imputed_demographic_columns_df=imputed_demographic_columns_df
     ).custom_checkpoint()
@@ -285,7 +314,59 @@ def derive_people_in_household_count(df) -> DataFrame:
     return df
 
 
-def impute_key_columns(df: DataFrame, imputed_value_lookup_df: DataFrame, log_directory: str) -> DataFrame:
+def impute_and_flag_with_donors(
+    df: DataFrame,
+    donor_df: Optional[DataFrame],
+    donor_pool_columns: List[str],
+    imputation_function: Callable,
+    reference_column: str,
+    **kwargs,
+) -> DataFrame:
+    """
+    Impute and flag the records of df, as `impute_and_flag`, with records from donor_df used as donors only.
+
+    Donors are limited to those that share the values of the donor pool columns with a record to be imputed, so these
+    should be columns that a donor must match to be used. Nothing is imputed if no records are missing the reference
+    column, so donors are only read when they are needed.
+
+    Parameters
+    ----------
+    df
+        records to impute
+    donor_df
+        records with values that are not changed, with the same columns as df. All records are imputed together if
+        not set
+    donor_pool_columns
+        columns that donors must match a record to be imputed on. All donors are used if empty
+    """
+    if donor_df is None:
+        return impute_and_flag(df, imputation_function, reference_column, **kwargs)
+    to_impute_df = df.filter(F.col(reference_column).isNull())
+    if to_impute_df.limit(1).count() == 0:
+        return df
+
+    donor_df = donor_df.filter(F.col(reference_column).isNotNull())
+    if donor_pool_columns:
+        donor_pool_df = to_impute_df.select(*[F.col(col).alias(f"_pool_{col}") for col in donor_pool_columns])
+        donor_df = donor_df.join(
+            donor_pool_df.distinct(),
+            on=reduce(and_, [F.col(col).eqNullSafe(F.col(f"_pool_{col}")) for col in donor_pool_columns]),
+            how="left_semi",
+        )
+    df = df.withColumn("_is_donor", F.lit(False)).unionByName(
+        donor_df.select(*df.columns).withColumn("_is_donor", F.lit(True))
+    )
+    df = impute_and_flag(df, imputation_function, reference_column, **kwargs)
+    return df.filter(~F.col("_is_donor")).drop("_is_donor")
+
+
+def impute_key_columns(
+    df: DataFrame,
+    imputed_value_lookup_df: DataFrame,
+    log_directory: str,
+    rng_seed: Optional[int] = None,
+    incremental: bool = False,
+) -> DataFrame:
     """
     Impute missing values for key variables that are required for weight calibration.
     Most imputations require geographic data being joined onto the response records.
@@ -304,6 +385,16 @@ def impute_key_columns(df: DataFrame, imputed_value_lookup_df: DataFrame, log_di
     - region_code
     - people_in_household_count_group
     - work_status_group
+
+    Parameters
+    ----------
+    rng_seed
+        random number generator seed for the KNN imputations
+    incremental
+        only impute participants whose edited and reference columns are new or have changed since the imputed value
+        lookup was written. Other participants keep their values from the lookup, and are used as donors for the
+        donor pools of the participants being imputed. The output includes the reference columns and a hash of the
+        imputation inputs, to be written as the new lookup
     """
     unique_id_column = "participant_id"
 
@@ -315,27 +406,54 @@ def impute_key_columns(df: DataFrame, imputed_value_lookup_df: DataFrame, log_di
         .drop("ROW_NUMBER")
     )
 
+    unchanged_df = None
+    if incremental:
+        imputation_input_columns = IMPUTATION_REFERENCE_COLUMNS + IMPUTED_KEY_COLUMNS
+        deduplicated_df = deduplicated_df.select(unique_id_column, *imputation_input_columns).withColumn(
+            "imputation_input_hash", F.sha2(F.to_json(F.struct(*imputation_input_columns)), 256)
+        )
+        if imputed_value_lookup_df is not None and "imputation_input_hash" in imputed_value_lookup_df.columns:
+            unchanged_df = imputed_value_lookup_df.join(
+                deduplicated_df.select(unique_id_column, "imputation_input_hash"),
+                on=[unique_id_column, "imputation_input_hash"],
+                how="inner",
+            )
+            deduplicated_df = deduplicated_df.join(
+                unchanged_df.select(unique_id_column), on=unique_id_column, how="left_anti"
+            )
+
     if imputed_value_lookup_df is not None:
         deduplicated_df = merge_previous_imputed_values(deduplicated_df, imputed_value_lookup_df, unique_id_column)
 
-    deduplicated_df = impute_and_flag(
+    if unchanged_df is not None:
+        unchanged_df = unchanged_df.select(*deduplicated_df.columns).custom_checkpoint()
+
+    deduplicated_df = impute_and_flag_with_donors(
         deduplicated_df,
+        unchanged_df,
+        ["ons_household_id"],
         imputation_function=impute_by_mode,
         reference_column="ethnicity_white",
         group_by_column="ons_household_id",
     ).custom_checkpoint()
 
-    deduplicated_df = impute_and_flag(
+    # donors further than the maximum distance of 4999 are not used, so must match on the area code
+    deduplicated_df = impute_and_flag_with_donors(
         deduplicated_df,
+        unchanged_df,
+        ["cis_area_code_20"],
         impute_by_k_nearest_neighbours,
         reference_column="ethnicity_white",
         donor_group_columns=["cis_area_code_20"],
         donor_group_column_weights=[5000],
         log_file_path=log_directory,
+        rng_seed=rng_seed,
     ).custom_checkpoint()
 
-    deduplicated_df = impute_and_flag(
+    deduplicated_df = impute_and_flag_with_donors(
         deduplicated_df,
+        unchanged_df,
+        ["ethnicity_white", "region_code"],
         imputation_function=impute_by_distribution,
         reference_column="sex",
         group_by_columns=["ethnicity_white", "region_code"],
@@ -343,20 +461,30 @@ def impute_key_columns(df: DataFrame, imputed_value_lookup_df: DataFrame, log_di
         second_imputation_value="Male",
     ).custom_checkpoint()
 
-    deduplicated_df = impute_and_flag(
+    # the nearest donor groups may differ on any of the donor group columns, so all donors are used
+    deduplicated_df = impute_and_flag_with_donors(
         deduplicated_df,
+        unchanged_df,
+        [],
         impute_date_by_k_nearest_neighbours,
         reference_column="date_of_birth",
         donor_group_columns=["region_code", "people_in_household_count_group", "work_status_group"],
         log_file_path=log_directory,
+        rng_seed=rng_seed,
+        joint=True,
     )
 
-    return deduplicated_df.select(
+    deduplicated_df = deduplicated_df.select(
         unique_id_column,
-        *["ethnicity_white", "sex", "date_of_birth"],
+        *IMPUTED_KEY_COLUMNS,
         *[col for col in deduplicated_df.columns if col.endswith("_imputation_method")],
         *[col for col in deduplicated_df.columns if col.endswith("_is_imputed")],
+        *(IMPUTATION_REFERENCE_COLUMNS + ["imputation_input_hash"] if incremental else []),
     )
+    if unchanged_df is not None:
+        # participants with unchanged inputs keep their previous values
+        deduplicated_df = deduplicated_df.unionByName(unchanged_df.select(*deduplicated_df.columns))
+    return deduplicated_df
 
 
 def geography_dependent_transformations(
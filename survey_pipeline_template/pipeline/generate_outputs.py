@@ -1,4 +1,3 @@
-import subprocess
 import sys
 from pathlib import Path
 from typing import Any
@@ -15,7 +14,10 @@ from survey_pipeline_template.edit import rename_column_names
 from survey_pipeline_template.edit import update_column_values_from_map
 from survey_pipeline_template.extract import list_contents
 from survey_pipeline_template.hdfs_utils import create_dir
+from survey_pipeline_template.hdfs_utils import delete_dir
+from survey_pipeline_template.hdfs_utils import rename
 from survey_pipeline_template.pipeline.config import get_config
+from survey_pipeline_template.pyspark_utils import spark_to_pandas
 
 
 def generate_sample(
@@ -60,7 +62,7 @@ def generate_sample(
 
     if "strat" in sample_type:
         df = df.withColumn("sampling_strata", F.concat_ws("-", *[F.col(col) for col in cols]))
-        summary_df = (
+        summary_df = spark_to_pandas(
             df.groupBy("sampling_strata")
             .agg(
                 F.countDistinct("participant_id").alias("n_distinct_participants"),
@@ -72,7 +74,6 @@ def generate_sample(
             .withColumn("n_sample_required", F.lit(rows_per_file))
             .withColumn("percentage_sample_required", F.col("n_sample_required") / F.col("n_records"))
             .orderBy("sampling_strata")
-            .toPandas()
         )
 
         sampling_fractions = {
@@ -223,7 +224,8 @@ def write_csv_rename(df: DataFrame, file_path: Path, sep: str = "|", extension:
     partitions = [part for part in partitions if part.endswith(".csv")]  # spark writes them as .csv regardless of sep
 
     # move temp file to target location and rename
-    subprocess.check_call(["hadoop", "fs", "-mv", (temp_path / partitions[0]), file_path.as_posix() + extension])
+    if not rename((temp_path / partitions[0]).as_posix(), file_path.as_posix() + extension):
+        raise OSError(f"Failed to move {temp_path / partitions[0]} to {file_path.as_posix() + extension}")
 
     # remove original subfolder inc tmp
-    subprocess.call(["hadoop", "fs", "-rm", "-r", file_path], stdout=subprocess.DEVNULL)
+    delete_dir(file_path.as_posix(), recursive=True)
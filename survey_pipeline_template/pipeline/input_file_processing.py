@@ -1,18 +1,17 @@
 from pathlib import Path
 from typing import Callable
+from typing import Dict
 from typing import List
 from typing import Union
 
-import pandas as pd
 from pyspark.sql import DataFrame
 from pyspark.sql import functions as F
 
 from survey_pipeline_template.derive import assign_filename_column
 from survey_pipeline_template.edit import cast_columns_from_string
-from survey_pipeline_template.edit import convert_columns_to_timestamps
 from survey_pipeline_template.edit import rename_column_names
 from survey_pipeline_template.edit import update_from_lookup_df
-from survey_pipeline_template.hdfs_utils import read_file_to_string
+from survey_pipeline_template.extract import read_excel_to_pyspark_df
 from survey_pipeline_template.merge import union_multiple_tables
 from survey_pipeline_template.pipeline.config import get_config
 from survey_pipeline_template.pipeline.config import get_secondary_config
@@ -21,13 +20,81 @@ from survey_pipeline_template.pipeline.validation_schema import validation_schem
 from survey_pipeline_template.pyspark_utils import convert_array_to_array_strings
 from survey_pipeline_template.pyspark_utils import convert_cerberus_schema_to_pyspark
 from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+from survey_pipeline_template.pyspark_utils import get_staging_directory
 from survey_pipeline_template.validate import validate_files
 
+STAGED_RAW_PREFIX = "_staged_raw_"
+STAGED_TIMESTAMP_PREFIX = "_staged_timestamp_"
+
 
 class InvalidFileError(Exception):
     pass
 
 
+def stage_input_data(df: DataFrame, dataset_name: str, datetime_map: Dict[str, List[str]]) -> DataFrame:
+    """
+    Parse input data once, by writing it to parquet in the checkpoint directory and reading it back, so that the
+    tables written from it do not each read and parse the input files again.
+
+    Alongside the input columns, the staged data holds a copy of the raw string of each datetime column and its value
+    converted to a timestamp, for use by `convert_staged_columns_to_timestamps`. These are dropped by
+    `drop_staged_columns`. The data is returned unstaged if no checkpoint directory is set.
+
+    Parameters
+    ----------
+    datetime_map
+        format of datetime string and associated list of column names to which it applies
+    """
+    staging_path = get_staging_directory(f"input_staging/{dataset_name}")
+    if staging_path is None:
+        return df
+
+    staged_columns = []
+    for format, columns_list in datetime_map.items():
+        for column_name in columns_list:
+            if column_name in df.columns and f"{STAGED_RAW_PREFIX}{column_name}" not in staged_columns:
+                staged_columns.extend([f"{STAGED_RAW_PREFIX}{column_name}", f"{STAGED_TIMESTAMP_PREFIX}{column_name}"])
+                df = df.withColumn(f"{STAGED_RAW_PREFIX}{column_name}", F.col(column_name)).withColumn(
+                    f"{STAGED_TIMESTAMP_PREFIX}{column_name}", F.to_timestamp(F.col(column_name), format=format)
+                )
+
+    df.write.parquet(staging_path)
+    return get_or_create_spark_session().read.parquet(staging_path)
+
+
+def drop_staged_columns(df: DataFrame) -> DataFrame:
+    """Drop the columns added to input data by `stage_input_data`."""
+    return df.drop(*[col for col in df.columns if col.startswith((STAGED_RAW_PREFIX, STAGED_TIMESTAMP_PREFIX))])
+
+
+def convert_staged_columns_to_timestamps(df: DataFrame, column_format_map: Dict[str, List[str]]) -> DataFrame:
+    """
+    Convert string columns to timestamp given format, as `convert_columns_to_timestamps`, using the timestamps parsed
+    by `stage_input_data` where the string has not been edited since the data was staged.
+
+    Parameters
+    ----------
+    df
+        staged DataFrame to process
+    column_format_map
+        format of datetime string and associated list of column names to which it applies
+    """
+    converted_columns = set()
+    for format, columns_list in column_format_map.items():
+        for column_name in columns_list:
+            if column_name not in df.columns:
+                continue
+            timestamp = F.to_timestamp(F.col(column_name), format=format)
+            if f"{STAGED_TIMESTAMP_PREFIX}{column_name}" in df.columns and column_name not in converted_columns:
+                timestamp = F.when(
+                    F.col(column_name).eqNullSafe(F.col(f"{STAGED_RAW_PREFIX}{column_name}")),
+                    F.col(f"{STAGED_TIMESTAMP_PREFIX}{column_name}"),
+                ).otherwise(timestamp)
+            df = df.withColumn(column_name, timestamp)
+            converted_columns.add(column_name)
+    return drop_staged_columns(df)
+
+
 def extract_lookup_csv(
     lookup_file_path: str, validation_schema: dict, column_name_map: dict = None, drop_not_found: bool = False
 ):
@@ -122,11 +189,14 @@ def extract_validate_transform_input_data(
     dataset_version = "" if dataset_version is None else "_" + dataset_version
     df = convert_array_to_array_strings(df)
     if include_hadoop_read_write:
-        update_table(df, f"raw_{dataset_name}{dataset_version}", write_mode, survey_table=survey_table)
+        df = stage_input_data(df, dataset_name, datetime_map)
+        update_table(
+            drop_staged_columns(df), f"raw_{dataset_name}{dataset_version}", write_mode, survey_table=survey_table
+        )
         filter_ids = []
         if extraction_config is not None and dataset_name in extraction_config:
             filter_ids = extraction_config[dataset_name]
-        filtered_df = df.filter(F.col(id_column).isin(filter_ids))
+        filtered_df = drop_staged_columns(df.filter(F.col(id_column).isin(filter_ids)))
         update_table(filtered_df, f"extracted_{dataset_name}{dataset_version}", write_mode)
         df = df.filter(~F.col(id_column).isin(filter_ids))
 
@@ -136,7 +206,7 @@ def extract_validate_transform_input_data(
             )
             df = update_from_lookup_df(df, editing_lookup_df, dataset_name=dataset_name)
 
-    df = convert_columns_to_timestamps(df, datetime_map)
+    df = convert_staged_columns_to_timestamps(df, datetime_map)
     df = cast_columns_from_string(df, cast_to_double_columns_list, "double")
 
     for transformation_function in transformation_functions:
@@ -183,11 +253,10 @@ def extract_input_data(
             sep=sep,
         )
     if xl_file_paths:
-        spark = get_or_create_spark_session()
         dfs = [
-            spark.createDataFrame(
-                data=pd.read_excel(read_file_to_string(file, True), engine="openpyxl"), schema=spark_schema
-            ).withColumn(source_file_column, (F.regexp_replace(F.lit(file), r"(?<=:\/{2})(\w+|\d+)(?=\/{1})", "")))
+            read_excel_to_pyspark_df(file, spark_schema).withColumn(
+                source_file_column, (F.regexp_replace(F.lit(file), r"(?<=:\/{2})(\w+|\d+)(?=\/{1})", ""))
+            )
             for file in xl_file_paths
         ]
         if df is None:
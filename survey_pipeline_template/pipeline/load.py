@@ -1,20 +1,95 @@
 import functools
 import json
+import os
+import re
+import threading
+from collections import Counter
 from datetime import datetime
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
 
 import pkg_resources
 import pyspark.sql.functions as F
 from pyspark.sql import DataFrame
-
+from pyspark.sql.types import ArrayType
+from pyspark.sql.types import ByteType
+from pyspark.sql.types import DataType
+from pyspark.sql.types import DateType
+from pyspark.sql.types import DecimalType
+from pyspark.sql.types import DoubleType
+from pyspark.sql.types import FloatType
+from pyspark.sql.types import IntegerType
+from pyspark.sql.types import LongType
+from pyspark.sql.types import MapType
+from pyspark.sql.types import NullType
+from pyspark.sql.types import ShortType
+from pyspark.sql.types import StringType
+from pyspark.sql.types import StructType
+from pyspark.sql.types import TimestampType
+
+from survey_pipeline_template.file_catalog import clear_table_item_sets
+from survey_pipeline_template.hdfs_utils import get_path_fingerprint
 from survey_pipeline_template.pipeline.config import get_config
 from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+from survey_pipeline_template.pyspark_utils import spark_to_pandas
 
 
 class TableNotFoundError(Exception):
     pass
 
 
+_fused_table_names: List[str] = []
+_fused_tables: Dict[str, DataFrame] = {}
+_fused_survey_table_names: Set[str] = set()
+
+
+def set_fused_tables(table_names: Iterable[str]):
+    """
+    Set the tables to be kept in memory for the rest of the run, rather than written to HIVE between stages.
+    Overwrites of these tables are held as checkpointed DataFrames that `extract_from_table` returns in their place,
+    until they are written by `write_fused_tables`.
+    """
+    _fused_table_names[:] = list(table_names)
+    _fused_tables.clear()
+    _fused_survey_table_names.clear()
+
+
+def clear_fused_tables():
+    """Remove all tables held in memory for the current run."""
+    set_fused_tables([])
+
+
+def _fuse_table(df: DataFrame, table_name: str, survey_table: bool = False) -> DataFrame:
+    """Checkpoint a DataFrame to truncate its lineage and hold it in place of a HIVE table."""
+    if get_config().get("fused_checkpoint_type", "reliable") == "local":
+        df = df.localCheckpoint()
+    else:
+        df = df.custom_checkpoint()
+    _fused_tables[table_name] = df
+    if survey_table:
+        _fused_survey_table_names.add(table_name)
+    print(f"    - kept {table_name} in memory")  # functional
+    return df
+
+
+def write_fused_tables():
+    """
+    Write the tables held in memory for the current run to HIVE, so that they are up to date outside of the run.
+    Tables are written from their checkpoints, so are not recomputed. Must be called before checkpoints are removed.
+    """
+    fused_tables = dict(_fused_tables)
+    fused_survey_table_names = set(_fused_survey_table_names)
+    clear_fused_tables()
+    for table_name, df in fused_tables.items():
+        update_table(df, table_name, "overwrite", survey_table=table_name in fused_survey_table_names)
+
+
 def delete_tables(
     prefix: str = None,
     pattern: str = None,
@@ -50,13 +125,16 @@ def delete_tables(
             else:
                 print(f"dropping table: {storage_config['database']}.{table_name}")  # functional
                 spark_session.sql(f"DROP TABLE IF EXISTS {storage_config['database']}.{table_name}")
+                if table_name.startswith(table_prefix):
+                    # item sets are read from tables with the configured prefix, so are keyed without it
+                    clear_table_item_sets(table_name[len(table_prefix) :])
                 update_processed_file_log(dataset_name=table_name, currently_processed=False)
 
     protected_tables = [f"{table_prefix}{table_name}" for table_name in protected_tables]
 
     if len(table_names) > 0:
         if type(table_names) != list:
-            table_names = [table_names]  # type:ignore
+            table_names = [table_names]  # type: ignore
         table_names = [f"{table_prefix}{table_name}" for table_name in table_names]
         drop_tables(table_names)
         return
@@ -69,22 +147,16 @@ def delete_tables(
         else:
             pattern = f"{table_prefix}_{prefix}"
 
-        tables = (
-            spark_session.sql(f"SHOW TABLES IN {storage_config['database']} LIKE '{pattern}*'")
-            .select("tableName")
-            .toPandas()["tableName"]
-            .tolist()
-        )
+        tables = spark_to_pandas(
+            spark_session.sql(f"SHOW TABLES IN {storage_config['database']} LIKE '{pattern}*'").select("tableName")
+        )["tableName"].tolist()
         drop_tables(tables)
         return
 
     if pattern is not None:
-        tables = (
-            spark_session.sql(f"SHOW TABLES IN {storage_config['database']} LIKE '*{pattern}*'")
-            .select("tableName")
-            .toPandas()["tableName"]
-            .tolist()
-        )
+        tables = spark_to_pandas(
+            spark_session.sql(f"SHOW TABLES IN {storage_config['database']} LIKE '*{pattern}*'").select("tableName")
+        )["tableName"].tolist()
         if not ignore_table_prefix:
             tables = [t for t in tables if t.startswith(table_prefix)]
         drop_tables(tables)
@@ -96,7 +168,29 @@ def extract_from_table(
     alternate_prefix: str = None,
     alternate_database: str = None,
     latest_table: bool = False,
+    partition_filter: str = None,
+    columns: Optional[List[str]] = None,
 ) -> DataFrame:
+    """
+    Read a HIVE table.
+
+    Columns that are derived for partitioning the table, as set in its storage layout, are dropped after reading,
+    unless they are selected in `columns`.
+
+    Parameters
+    ----------
+    partition_filter
+        SQL expression to filter the table by, applied before derived partition columns are dropped. Filters on the
+        table's partition columns only read the matching partitions
+    columns
+        columns to read from the table. Only these columns are read from columnar storage, and only these are
+        checkpointed when breaking lineage. All columns are read by default
+    """
+    if table_name in _fused_tables and (alternate_prefix, alternate_database, latest_table) == (None, None, False):
+        df = _fused_tables[table_name]
+        if partition_filter is not None:
+            df = df.filter(partition_filter)
+        return df.select(*columns) if columns is not None else df
     spark_session = get_or_create_spark_session()
     check_table_exists(
         table_name,
@@ -105,13 +199,20 @@ def extract_from_table(
         alternate_database=alternate_database,
         latest_table=latest_table,
     )
-    if break_lineage:
-        return spark_session.sql(
-            f"SELECT * FROM {get_full_table_name(table_name, alternate_prefix, alternate_database, latest_table)}"
-        ).checkpoint()
-    return spark_session.sql(
-        f"SELECT * FROM {get_full_table_name(table_name, alternate_prefix, alternate_database, latest_table)}"
+    select_expression = "*" if columns is None else ", ".join(f"`{column}`" for column in columns)
+    query = (
+        f"SELECT {select_expression} "
+        f"FROM {get_full_table_name(table_name, alternate_prefix, alternate_database, latest_table)}"
     )
+    if partition_filter is not None:
+        query += f" WHERE {partition_filter}"
+    df = spark_session.sql(query)
+    if break_lineage:
+        df = df.checkpoint()
+    if columns is not None:
+        return df
+    derived_partition_columns = get_table_layout(table_name).get("partition_columns", {})
+    return df.drop(*[column for column in derived_partition_columns if column in df.columns])
 
 
 def update_table(
@@ -122,27 +223,315 @@ def update_table(
     survey_table=False,
     error_if_cols_differ: bool = True,
     latest_table: bool = False,
+    schema_evolution: bool = False,
 ):
+    """
+    Write a DataFrame to a HIVE table and log the write in the table log.
+
+    The table is written using its storage layout from the config, if it has one. See `get_table_layout`. Appends to an
+    existing table use its existing bucketing and partitioning, which only change when the table is overwritten.
+
+    When appending to an existing table, the DataFrame columns are compared to the table schema from the catalog,
+    without reading the table, regardless of their order. Columns with differing types are reported, as they will be
+    cast to the table's types, and a ValueError is raised if any cannot be cast without losing values. See
+    `_can_up_cast`.
+
+    Parameters
+    ----------
+    write_mode
+        "overwrite", "append", or "overwrite_partitions" to only replace the partitions of a partitioned table that
+        the DataFrame has rows for. The whole table is written if it does not exist yet
+    error_if_cols_differ
+        raise an error when appending columns that differ from the table's columns. If False, the existing table
+        is read and unioned with the DataFrame, and the result overwrites the table
+    schema_evolution
+        when appending columns that differ from the table's columns, add any new columns to the table's metadata
+        and fill any columns missing from the DataFrame with nulls, instead of raising an error or overwriting
+    """
     from survey_pipeline_template.merge import union_multiple_tables
 
-    if write_mode == "append":
-        if check_table_exists(table_name):
-            check = extract_from_table(table_name, break_lineage=True, latest_table=latest_table)
-            if check.columns != df.columns:
-                msg = f"Trying to append to {table_name} but columns differ"  # functional
-                if error_if_cols_differ:
-                    raise ValueError(msg)
-                    return
-                else:
-                    print(f"    - {msg}")  # functional
-                    df = union_multiple_tables([check, df])
-                    df = df.distinct()
-                    write_mode = "overwrite"
-    df.write.mode(write_mode).saveAsTable(get_full_table_name(table_name, latest_table=latest_table))
+    if table_name in _fused_table_names and write_mode == "overwrite" and not archive and not latest_table:
+        _fuse_table(df, table_name, survey_table)
+        return
+    table_layout = get_table_layout(table_name)
+    derived_partition_columns = table_layout.get("partition_columns", {})
+    if write_mode == "overwrite_partitions" and not check_table_exists(table_name, latest_table=latest_table):
+        write_mode = "overwrite"
+    if write_mode == "append" and check_table_exists(table_name, latest_table=latest_table):
+        table_layout = _get_append_table_layout(table_name, table_layout, latest_table)
+        table_schema = get_table_schema(table_name, latest_table=latest_table)
+        derived_partition_columns = {
+            column_name: expression
+            for column_name, expression in derived_partition_columns.items()
+            if column_name in table_schema.names
+        }
+        table_schema = StructType(
+            [field for field in table_schema.fields if field.name not in derived_partition_columns]
+        )
+        table_column_types = {field.name: field.dataType for field in table_schema.fields}
+        type_differences = [
+            (field.name, field.dataType, table_column_types[field.name])
+            for field in df.schema.fields
+            if field.name in table_column_types and field.dataType != table_column_types[field.name]
+        ]
+        type_difference_strings = [
+            f"{column_name} ({from_type.simpleString()} to {to_type.simpleString()})"
+            for column_name, from_type, to_type in type_differences
+        ]
+        unsafe_type_differences = [
+            type_difference
+            for type_difference, (_, from_type, to_type) in zip(type_difference_strings, type_differences)
+            if not _can_up_cast(from_type, to_type)
+        ]
+        if unsafe_type_differences:
+            raise ValueError(
+                f"Trying to append to {table_name} with column types that cannot be safely cast: "
+                f"{', '.join(unsafe_type_differences)}"
+            )
+        if type_differences:
+            print(
+                f"    - Appending to {table_name} with column types that will be cast: "
+                f"{', '.join(type_difference_strings)}"
+            )  # functional
+
+        if set(table_schema.names) == set(df.columns):
+            # columns that a table is partitioned by are moved to the end of its schema
+            df = df.select(*table_schema.names)
+        else:
+            msg = f"Trying to append to {table_name} but columns differ"  # functional
+            if schema_evolution:
+                print(f"    - {msg}, updating table schema")  # functional
+                df = _evolve_table_schema(df, table_name, table_schema, latest_table)
+            elif error_if_cols_differ:
+                raise ValueError(msg)
+            else:
+                print(f"    - {msg}")  # functional
+                check = extract_from_table(table_name, break_lineage=True, latest_table=latest_table)
+                df = union_multiple_tables([check, df])
+                df = df.distinct()
+                write_mode = "overwrite"
+    for column_name, expression in derived_partition_columns.items():
+        df = df.withColumn(column_name, F.expr(expression))
+    if write_mode == "overwrite_partitions":
+        table_columns = get_table_schema(table_name, latest_table=latest_table).names
+        if set(table_columns) != set(df.columns):
+            raise ValueError(f"Trying to overwrite partitions of {table_name} but columns differ")
+        df = df.select(*table_columns)
+    _write_table(df, get_full_table_name(table_name, latest_table=latest_table), write_mode, table_layout)
+    clear_table_item_sets(table_name)
     add_table_log_entry(table_name, survey_table, write_mode)
     if archive:
         now = datetime.strftime(datetime.now(), "%Y%m%d_%H%M%S")
-        df.write.mode(write_mode).saveAsTable(f"{get_full_table_name(table_name)}_{now}")
+        archive_write_mode = "overwrite" if write_mode == "overwrite_partitions" else write_mode
+        _write_table(df, f"{get_full_table_name(table_name)}_{now}", archive_write_mode, table_layout)
+
+
+def get_table_layout(table_name: str) -> dict:
+    """
+    Get the storage layout of a table from the `table_layouts` section of the storage config.
+
+    Bucketing a table by the column that stages partition their windows and joins by, such as `participant_id`,
+    means these no longer need to shuffle the table when it is read. Partitioning a table means that reads filtered
+    on the partition columns only read the matching files.
+
+    Example
+    -------
+    storage:
+        table_layouts:
+            survey_responses:
+                bucket_by: [participant_id]
+                num_buckets: 200
+                sort_by: [visit_datetime]
+                partition_by: [visit_month]
+                partition_columns:
+                    visit_month: date_format(visit_datetime, 'yyyy-MM')
+
+    Parameters in a layout
+    ----------------------
+    bucket_by
+        columns to bucket the table by
+    num_buckets
+        number of buckets, defaults to 200
+    sort_by
+        columns to sort rows by within each bucket, or within each file if the table is not bucketed
+    partition_by
+        columns to partition the table by
+    partition_columns
+        columns to derive for partitioning, mapped to SQL expressions. These are added when writing the table and
+        dropped when it is read with `extract_from_table`
+    """
+    return get_config()["storage"].get("table_layouts", {}).get(table_name, {})
+
+
+def _get_existing_table_layout(table_name: str, latest_table: bool = False) -> dict:
+    """Get the bucketing and partitioning of an existing HIVE table from the catalog."""
+    spark_session = get_or_create_spark_session()
+    full_table_name = get_full_table_name(table_name, latest_table=latest_table)
+    database, table = full_table_name.split(".", 1)
+    table_details = {
+        row["col_name"]: row["data_type"]
+        for row in spark_session.sql(f"DESCRIBE FORMATTED {full_table_name}").collect()
+    }
+    table_layout: Dict[str, Any] = {
+        "partition_by": [
+            column.name for column in spark_session.catalog.listColumns(table, database) if column.isPartition
+        ]
+    }
+    bucket_by = re.findall(r"`([^`]+)`", table_details.get("Bucket Columns", ""))
+    if bucket_by:
+        table_layout["bucket_by"] = bucket_by
+        table_layout["num_buckets"] = int(table_details["Num Buckets"])
+        table_layout["sort_by"] = re.findall(r"`([^`]+)`", table_details.get("Sort Columns", ""))
+    return table_layout
+
+
+def _get_append_table_layout(table_name: str, table_layout: dict, latest_table: bool = False) -> dict:
+    """
+    Get the layout to append to an existing table with. Spark can only append to a table with its existing bucketing
+    and partitioning, so these are used where they differ from the configured layout, until the table is overwritten.
+    """
+    existing_table_layout = _get_existing_table_layout(table_name, latest_table)
+    configured_table_layout: Dict[str, Any] = {"partition_by": table_layout.get("partition_by", [])}
+    if table_layout.get("bucket_by", []):
+        configured_table_layout["bucket_by"] = table_layout["bucket_by"]
+        configured_table_layout["num_buckets"] = table_layout.get("num_buckets", 200)
+        configured_table_layout["sort_by"] = table_layout.get("sort_by", [])
+    if configured_table_layout == existing_table_layout:
+        return table_layout
+    print(
+        f"    - Appending to {table_name} with its existing layout, as it differs from the configured layout:"
+        f" {existing_table_layout}"
+    )  # functional
+    table_layout = {key: value for key, value in table_layout.items() if key not in ["bucket_by", "num_buckets"]}
+    table_layout.update(existing_table_layout)
+    return table_layout
+
+
+def _insert_overwrite_partitions(df: DataFrame, full_table_name: str):
+    """
+    Insert a DataFrame into an existing table by position, replacing only the partitions that it has rows for.
+
+    `insertInto` ignores writer options, and the session config would apply to writes from concurrent stages, so
+    dynamic partition overwrite is set as a storage property of the table for this write only. The table's previous
+    setting, or the session's setting if it had none, is restored afterwards.
+    """
+    spark_session = get_or_create_spark_session()
+    storage_properties = {
+        row["col_name"]: row["data_type"]
+        for row in spark_session.sql(f"DESCRIBE FORMATTED {full_table_name}").collect()
+    }.get("Storage Properties", "")
+    previous_mode = dict(re.findall(r"([^\[\]=, ]+)=([^\[\]=, ]*)", storage_properties)).get(
+        "partitionOverwriteMode", spark_session.conf.get("spark.sql.sources.partitionOverwriteMode", "static")
+    )
+    spark_session.sql(f"ALTER TABLE {full_table_name} SET SERDEPROPERTIES ('partitionOverwriteMode'='dynamic')")
+    try:
+        # the table's relation is cached with its previous storage properties
+        spark_session.catalog.refreshTable(full_table_name)
+        df.write.insertInto(full_table_name, overwrite=True)
+    finally:
+        spark_session.sql(
+            f"ALTER TABLE {full_table_name} SET SERDEPROPERTIES ('partitionOverwriteMode'='{previous_mode}')"
+        )
+        spark_session.catalog.refreshTable(full_table_name)
+
+
+def _write_table(df: DataFrame, full_table_name: str, write_mode: str, table_layout: dict):
+    """
+    Write a DataFrame to a HIVE table, bucketed, sorted and partitioned as set in the table layout. When overwriting
+    partitions, the DataFrame is inserted into the existing table by position.
+    """
+    if write_mode == "overwrite_partitions":
+        _insert_overwrite_partitions(df, full_table_name)
+        return
+    bucket_by = table_layout.get("bucket_by", [])
+    sort_by = table_layout.get("sort_by", [])
+    partition_by = table_layout.get("partition_by", [])
+
+    if bucket_by:
+        num_buckets = table_layout.get("num_buckets", 200)
+        # each task writes a single bucket, so that each partition has one file per bucket
+        df = df.repartition(num_buckets, *bucket_by)
+        writer = df.write.mode(write_mode).bucketBy(num_buckets, *bucket_by)
+        if sort_by:
+            writer = writer.sortBy(*sort_by)
+    else:
+        if sort_by:
+            df = df.sortWithinPartitions(*sort_by)
+        writer = df.write.mode(write_mode)
+    if partition_by:
+        writer = writer.partitionBy(*partition_by)
+    writer.saveAsTable(full_table_name)
+
+
+def get_table_schema(table_name: str, latest_table: bool = False) -> StructType:
+    """
+    Get the schema of a HIVE table from the catalog, without reading the table. The schema of a table held in memory
+    for the current run is taken from its DataFrame.
+    """
+    if table_name in _fused_tables and not latest_table:
+        return _fused_tables[table_name].schema
+    spark_session = get_or_create_spark_session()
+    return spark_session.table(get_full_table_name(table_name, latest_table=latest_table)).schema
+
+
+_NUMERIC_PRECEDENCE = [ByteType, ShortType, IntegerType, LongType, FloatType, DoubleType]
+_INTEGRAL_DIGITS = {ByteType: 3, ShortType: 5, IntegerType: 10, LongType: 20}
+
+
+def _can_up_cast(from_type: DataType, to_type: DataType) -> bool:
+    """
+    Whether values of one type can be cast to another without losing information, following Spark's up cast rules.
+    Numeric types can only be widened, dates can be cast to timestamps and any atomic type can be cast to a string.
+    The nullability of nested types is not checked, as table columns are nullable.
+    """
+    if from_type == to_type or isinstance(from_type, NullType):
+        return True
+    if type(from_type) in _NUMERIC_PRECEDENCE and type(to_type) in _NUMERIC_PRECEDENCE:
+        return _NUMERIC_PRECEDENCE.index(type(from_type)) < _NUMERIC_PRECEDENCE.index(type(to_type))
+    if isinstance(to_type, DecimalType):
+        if isinstance(from_type, DecimalType):
+            return (
+                to_type.scale >= from_type.scale
+                and to_type.precision - to_type.scale >= from_type.precision - from_type.scale
+            )
+        if type(from_type) in _INTEGRAL_DIGITS:
+            return to_type.precision - to_type.scale >= _INTEGRAL_DIGITS[type(from_type)]
+        return False
+    if isinstance(from_type, DateType) and isinstance(to_type, TimestampType):
+        return True
+    if isinstance(to_type, StringType):
+        return not isinstance(from_type, (ArrayType, MapType, StructType))
+    if isinstance(from_type, ArrayType) and isinstance(to_type, ArrayType):
+        return _can_up_cast(from_type.elementType, to_type.elementType)
+    if isinstance(from_type, MapType) and isinstance(to_type, MapType):
+        return _can_up_cast(from_type.keyType, to_type.keyType) and _can_up_cast(from_type.valueType, to_type.valueType)
+    if isinstance(from_type, StructType) and isinstance(to_type, StructType):
+        return len(from_type.fields) == len(to_type.fields) and all(
+            _can_up_cast(from_field.dataType, to_field.dataType)
+            for from_field, to_field in zip(from_type.fields, to_type.fields)
+        )
+    return False
+
+
+def _evolve_table_schema(df: DataFrame, table_name: str, table_schema: StructType, latest_table: bool = False):
+    """
+    Add columns that are in the DataFrame but not the table to the table's metadata, and add null columns to the
+    DataFrame for columns that are only in the table. Returns the DataFrame with its columns in the table's order.
+    """
+    spark_session = get_or_create_spark_session()
+    new_fields = [field for field in df.schema.fields if field.name not in table_schema.names]
+    if new_fields:
+        new_columns = ", ".join(f"`{field.name}` {field.dataType.simpleString()}" for field in new_fields)
+        spark_session.sql(
+            f"ALTER TABLE {get_full_table_name(table_name, latest_table=latest_table)} ADD COLUMNS ({new_columns})"
+        )
+    return df.select(
+        *[
+            F.col(field.name) if field.name in df.columns else F.lit(None).cast(field.dataType).alias(field.name)
+            for field in table_schema.fields
+        ],
+        *[field.name for field in new_fields],
+    )
 
 
 def check_table_exists(
@@ -152,6 +541,8 @@ def check_table_exists(
     alternate_database: str = None,
     latest_table: bool = False,
 ):
+    if table_name in _fused_tables and (alternate_prefix, alternate_database, latest_table) == (None, None, False):
+        return True
     spark_session = get_or_create_spark_session()
     full_table_name = get_full_table_name(table_name, alternate_prefix, alternate_database, latest_table)
     table_exists = spark_session.catalog._jcatalog.tableExists(full_table_name)
@@ -160,13 +551,55 @@ def check_table_exists(
     return table_exists
 
 
+ERROR_FILE_LOG_SCHEMA = "run_id integer, run_datetime timestamp, file_path string, error string"
+INCREMENTAL_FILE_LOG_SCHEMA = (
+    "run_id integer, output_table string, source_file string, file_status string, log_datetime timestamp"
+)
+TABLE_LOG_SCHEMA = "run_id integer, table_name string, survey_table string, write_mode string"
+RUN_LOG_SCHEMA = """
+    run_id integer,
+    run_datetime timestamp,
+    pipeline_name string,
+    pipeline_version string,
+    config string
+"""
+
+
 def add_error_file_log_entry(file_path: str, error_text: str):
     """
     Log the state of the current file to the lookup table
     """
     run_id = get_run_id()
     file_log_entry = _create_error_file_log_entry(run_id, file_path, error_text)
-    update_table(file_log_entry, "error_file_log", "append")
+    _append_log_entry("error_file_log", ERROR_FILE_LOG_SCHEMA, file_log_entry)
+
+
+def add_error_file_log_entries(file_errors: Dict[str, str]):
+    """
+    Log the errors of several files to the lookup table in a single append
+
+    Parameters
+    ----------
+    file_errors
+        file paths mapped to their error text
+    """
+    run_id = get_run_id()
+    file_log_entries = [
+        _create_error_file_log_entry(run_id, file_path, error_text) for file_path, error_text in file_errors.items()
+    ]
+    _append_log_entries("error_file_log", ERROR_FILE_LOG_SCHEMA, file_log_entries)
+
+
+def add_incremental_file_log_entries(output_table: str, source_files: List[str], file_status: str):
+    """
+    Log the status of source files processed into a table incrementally: "pending" when they are selected for
+    processing, and "merged" once their responses have been merged into the table.
+    """
+    run_id = get_run_id()
+    incremental_file_log_entries = [
+        [run_id, output_table, source_file, file_status, datetime.now()] for source_file in source_files
+    ]
+    _append_log_entries("incremental_file_log", INCREMENTAL_FILE_LOG_SCHEMA, incremental_file_log_entries)
 
 
 def add_table_log_entry(table_name: str, survey_table: bool, write_mode: str):
@@ -174,8 +607,8 @@ def add_table_log_entry(table_name: str, survey_table: bool, write_mode: str):
     Log the state of the updated table to the table log
     """
     run_id = get_run_id()
-    file_log_entry = _create_table_log_entry(run_id, table_name, survey_table, write_mode)
-    file_log_entry.write.mode("append").saveAsTable(get_full_table_name("table_log"))  # Always append
+    table_log_entry = _create_table_log_entry(run_id, table_name, survey_table, write_mode)
+    _append_log_entry("table_log", TABLE_LOG_SCHEMA, table_log_entry)
 
 
 def add_run_log_entry(run_datetime: datetime):
@@ -188,23 +621,130 @@ def add_run_log_entry(run_datetime: datetime):
     run_id = get_run_id()
 
     run_log_entry = _create_run_log_entry(run_datetime, run_id, pipeline_version, pipeline_name)
-    update_table(run_log_entry, "run_log", "append")
+    _append_log_entry("run_log", RUN_LOG_SCHEMA, run_log_entry)
     return run_id
 
 
+def add_stage_log_entry(
+    run_id: int,
+    stage_name: str,
+    stage_status: str,
+    fingerprint: Optional[str] = None,
+    stage_result: Optional[dict] = None,
+    output_table_versions: Optional[Dict[str, Optional[str]]] = None,
+):
+    """
+    Append a record to the stage log, with the stage status, the fingerprint of its inputs and the versions of its
+    output tables.
+    """
+    schema = """
+        run_id integer,
+        stage_name string,
+        stage_status string,
+        fingerprint string,
+        stage_result string,
+        output_table_versions string,
+        log_datetime timestamp
+    """
+    stage_log_entry = [
+        run_id,
+        stage_name,
+        stage_status,
+        fingerprint,
+        json.dumps(stage_result, default=str) if isinstance(stage_result, dict) else None,
+        json.dumps(output_table_versions, sort_keys=True) if output_table_versions is not None else None,
+        datetime.now(),
+    ]
+    _append_log_entry("stage_log", schema, stage_log_entry)
+
+
+def add_run_metrics_entry(run_id: int, stage_name: str, metrics: Dict[str, Optional[float]]):
+    """Append a record of the Spark metrics collected for a stage to the run metrics table."""
+    schema = """
+        run_id integer,
+        stage_name string,
+        metrics_datetime timestamp,
+        duration_seconds double,
+        job_count long,
+        spark_stage_count long,
+        task_count long,
+        failed_task_count long,
+        executor_run_time_ms long,
+        input_bytes long,
+        input_records long,
+        output_bytes long,
+        output_records long,
+        shuffle_read_bytes long,
+        shuffle_read_records long,
+        shuffle_write_bytes long,
+        shuffle_write_records long,
+        memory_bytes_spilled long,
+        disk_bytes_spilled long,
+        gc_time_ms long,
+        peak_executor_memory_bytes long
+    """
+    metric_names = [field.split()[0] for field in schema.split(",")][3:]
+    run_metrics_entry = [run_id, stage_name, datetime.now(), *[metrics.get(name) for name in metric_names]]
+    _append_log_entry("run_metrics", schema, run_metrics_entry)
+
+
+def get_table_versions(table_names: Iterable[str]) -> Dict[str, Optional[str]]:
+    """
+    Get a version identifier for each table, which changes whenever the table is written to.
+
+    Uses the number of writes to the table recorded in the table log. For tables that are not in the table log,
+    such as those written outside of the pipeline, the modification times of the table files are used.
+    Tables that do not exist, or are only held in memory for the current run, have no version.
+    """
+    table_names = list(table_names)
+    table_writes: Counter = Counter()
+    if check_table_exists("table_log"):
+        table_writes.update(
+            {
+                row["table_name"]: row["count"]
+                for row in extract_from_table("table_log")
+                .filter(F.col("table_name").isin(table_names))
+                .groupBy("table_name")
+                .count()
+                .collect()
+            }
+        )
+    if _log_buffer is not None:
+        table_writes.update(table_log_entry[1] for table_log_entry in _log_buffer.get_entries("table_log"))
+
+    table_versions: Dict[str, Optional[str]] = {}
+    for table_name in table_names:
+        if table_name in _fused_tables or not check_table_exists(table_name):
+            table_versions[table_name] = None
+        elif table_name in table_writes:
+            table_versions[table_name] = f"writes:{table_writes[table_name]}"
+        else:
+            table_versions[table_name] = f"files:{get_path_fingerprint(_get_table_location(table_name), False)}"
+    return table_versions
+
+
+def _get_table_location(table_name: str) -> str:
+    """Get the storage location of a HIVE table from the catalog."""
+    spark_session = get_or_create_spark_session()
+    table_details = spark_session.sql(f"DESCRIBE FORMATTED {get_full_table_name(table_name)}").collect()
+    return [row["data_type"] for row in table_details if row["col_name"] == "Location"][0]
+
+
 @functools.lru_cache(maxsize=1)
 def get_run_id():
     """
     Get the current run ID.
-    Adds 1 to the latest ID in the ID log and caches this result for this run.
-    Returns 1 if the run log table doesn't yet exist.
+    Adds 1 to the latest ID in the ID log, including run log entries that are buffered but not yet written, and
+    caches this result for this run. Returns 1 if the run log table doesn't yet exist.
     """
-    run_id = 1
+    previous_run_ids = []
     if check_table_exists("run_log"):
         spark_session = get_or_create_spark_session()
         log_table = get_full_table_name(table_short_name="run_log")
-        run_id += spark_session.read.table(log_table).select(F.max("run_id")).first()[0]
-    return run_id
+        previous_run_ids.append(spark_session.read.table(log_table).select(F.max("run_id")).first()[0])
+    if _log_buffer is not None:
+        previous_run_ids.extend(run_log_entry[0] for run_log_entry in _log_buffer.get_entries("run_log"))
+    return max([run_id for run_id in previous_run_ids if run_id is not None], default=0) + 1
 
 
 def get_full_table_name(
@@ -239,43 +779,165 @@ def _create_error_file_log_entry(run_id: int, file_path: str, error_text: str):
     """
     Creates an entry (row) to be inserted into the file log
     """
-    spark_session = get_or_create_spark_session()
-    schema = "run_id integer, run_datetime timestamp, file_path string, error string"
-
-    file_log_entry = [[run_id, datetime.now(), file_path, error_text]]
-
-    return spark_session.createDataFrame(file_log_entry, schema)
+    return [run_id, datetime.now(), file_path, error_text]
 
 
 def _create_table_log_entry(run_id: int, table_name: str, survey_table: bool, write_mode: str):
     """
     Creates an entry (row) to be inserted into the table log
     """
-    spark_session = get_or_create_spark_session()
-    schema = "run_id integer, table_name string, survey_table string, write_mode string"
-
-    table_log_entry = [[run_id, table_name, survey_table, write_mode]]
-
-    return spark_session.createDataFrame(table_log_entry, schema)
+    return [run_id, table_name, survey_table, write_mode]
 
 
 def _create_run_log_entry(run_datetime: datetime, run_id: int, version: str, pipeline: str):
     """
     Creates an entry (row) to be inserted into the run log.
     """
-    spark_session = get_or_create_spark_session()
     config = get_config()
-    schema = """
-        run_id integer,
-        run_datetime timestamp,
-        pipeline_name string,
-        pipeline_version string,
-        config string
+    return [run_id, run_datetime, pipeline, version, json.dumps(config, default=str)]
+
+
+def _append_log_entry(table_name: str, schema: str, log_entry: list):
+    """Append an entry (row) to a pipeline log table, through the log buffer if one has been started for the run."""
+    _append_log_entries(table_name, schema, [log_entry])
+
+
+def _append_log_entries(table_name: str, schema: str, log_entries: List[list]):
+    """Append entries (rows) to a pipeline log table, through the log buffer if one has been started for the run."""
+    if not log_entries:
+        return
+    if _log_buffer is not None:
+        _log_buffer.add_entries(table_name, schema, log_entries)
+    else:
+        _write_log_entries(table_name, schema, log_entries)
+
+
+def _write_log_entries(table_name: str, schema: str, log_entries: List[list]):
+    """Write entries (rows) to a pipeline log table in a single append."""
+    spark_session = get_or_create_spark_session()
+    df = spark_session.createDataFrame(log_entries, schema)
+    if table_name == "table_log":
+        df.write.mode("append").saveAsTable(get_full_table_name("table_log"))  # Always append
+    else:
+        update_table(df, table_name, "append")
+
+
+def _serialise_log_value(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.strftime("%Y-%m-%dT%H:%M:%S.%f")}
+    return str(value)
+
+
+def _deserialise_log_value(value: dict):
+    if "__datetime__" in value:
+        return datetime.strptime(value["__datetime__"], "%Y-%m-%dT%H:%M:%S.%f")
+    return value
+
+
+class PipelineLogBuffer:
     """
+    Buffers entries for the pipeline log tables during a run, so that each log table is written with a single append
+    per flush rather than once per entry.
 
-    run_log_entry = [[run_id, run_datetime, pipeline, version, json.dumps(config, default=str)]]
+    Entries are also written to a local journal file as they are buffered, and removed from it once they have been
+    written to their log table. Entries left in the journal by a run that ended before they were written are
+    recovered by the next buffer that uses the same journal file.
+    """
+
+    def __init__(self, journal_path: str):
+        self.journal_path = Path(journal_path)
+        self._schemas: Dict[str, str] = {}
+        self._entries: Dict[str, List[list]] = {}
+        self._lock = threading.RLock()
+        self._recover_journal()
+
+    def _recover_journal(self):
+        if not self.journal_path.is_file():
+            return
+        with self.journal_path.open() as journal:
+            for line in journal:
+                if line.strip():
+                    journal_entry = json.loads(line, object_hook=_deserialise_log_value)
+                    self._buffer(journal_entry["table_name"], journal_entry["schema"], journal_entry["log_entry"])
+        recovered_entry_count = sum(len(entries) for entries in self._entries.values())
+        if recovered_entry_count > 0:
+            print(f"Recovered {recovered_entry_count} unwritten log entries from {self.journal_path}")  # functional
+
+    def _buffer(self, table_name: str, schema: str, log_entry: Sequence[Any]):
+        self._schemas[table_name] = schema
+        self._entries.setdefault(table_name, []).append(list(log_entry))
+
+    def _write_journal(self, journal_entries: List[dict], mode: str):
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.journal_path.open(mode) as journal:
+            for journal_entry in journal_entries:
+                journal.write(json.dumps(journal_entry, default=_serialise_log_value) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def add(self, table_name: str, schema: str, log_entry: list):
+        """Buffer an entry for a log table and record it in the journal."""
+        self.add_entries(table_name, schema, [log_entry])
+
+    def add_entries(self, table_name: str, schema: str, log_entries: List[list]):
+        """Buffer entries for a log table and record them in the journal with a single write."""
+        journal_entries = [
+            {"table_name": table_name, "schema": schema, "log_entry": log_entry} for log_entry in log_entries
+        ]
+        # round trip through JSON, so that buffered and recovered entries are identical
+        journal_entries = json.loads(
+            json.dumps(journal_entries, default=_serialise_log_value), object_hook=_deserialise_log_value
+        )
+        with self._lock:
+            self._write_journal(journal_entries, "a")
+            for journal_entry in journal_entries:
+                self._buffer(table_name, schema, journal_entry["log_entry"])
+
+    def get_entries(self, table_name: str) -> List[list]:
+        """Get the entries buffered for a log table."""
+        with self._lock:
+            return list(self._entries.get(table_name, []))
+
+    def flush(self):
+        """Write all buffered entries, with one append per log table. The table log is written last."""
+        with self._lock:
+            while self._entries:
+                table_name = next((name for name in self._entries if name != "table_log"), "table_log")
+                _write_log_entries(table_name, self._schemas[table_name], self._entries[table_name])
+                del self._entries[table_name]
+                self._write_journal(
+                    [
+                        {"table_name": name, "schema": self._schemas[name], "log_entry": log_entry}
+                        for name, entries in self._entries.items()
+                        for log_entry in entries
+                    ],
+                    "w",
+                )
+
+
+_log_buffer: Optional[PipelineLogBuffer] = None
+
+
+def start_log_buffer(journal_path: str):
+    """
+    Start buffering pipeline log entries, until `stop_log_buffer` is called. Entries are only written to the log tables
+    when `flush_log_buffer` is called.
+    """
+    global _log_buffer
+    _log_buffer = PipelineLogBuffer(journal_path)
+
+
+def flush_log_buffer():
+    """Write any buffered pipeline log entries to their log tables."""
+    if _log_buffer is not None:
+        _log_buffer.flush()
 
-    return spark_session.createDataFrame(run_log_entry, schema)
+
+def stop_log_buffer():
+    """Write any buffered pipeline log entries and stop buffering."""
+    global _log_buffer
+    flush_log_buffer()
+    _log_buffer = None
 
 
 def add_run_status(
@@ -292,12 +954,8 @@ def add_run_status(
         error_stage string,
         run_error string
     """
-    run_status_entry = [[run_id, datetime.now(), run_status, error_stage, run_error]]
-
-    spark_session = get_or_create_spark_session()
-
-    df = spark_session.createDataFrame(run_status_entry, schema)
-    update_table(df, "run_status", "append")
+    run_status_entry = [run_id, datetime.now(), run_status, error_stage, run_error]
+    _append_log_entry("run_status", schema, run_status_entry)
 
 
 def update_table_and_log_source_files(
@@ -337,7 +995,7 @@ def create_processed_file_log_entry(df: DataFrame, filename_column: str, dataset
         for filename, row_count in zip(newly_processed_files, file_lengths)
     ]
     df = spark_session.createDataFrame(entry, schema)
-    update_table(df, "processed_filenames", "append", error_if_cols_differ=False)
+    update_table(df, "processed_filenames", "append", error_if_cols_differ=False, schema_evolution=True)
 
 
 def update_processed_file_log(dataset_name: str, currently_processed: bool):
@@ -2,13 +2,14 @@ import pyspark.sql.functions as F
 
 from survey_pipeline_template.pipeline.load import extract_from_table
 from survey_pipeline_template.pipeline.load import get_run_id
+from survey_pipeline_template.pyspark_utils import spark_to_pandas
 
 
 def check_survey_table_lengths():
     tables_df = extract_from_table("table_log").filter(
         (F.col("survey_table") == True) & (F.col("run_id") == get_run_id())  # noqa
     )
-    table_names = tables_df.toPandas()["table_name"].to_list()
+    table_names = spark_to_pandas(tables_df)["table_name"].to_list()
     lengths = [extract_from_table(table).count() for table in table_names]
     table_lengths_string = "\n".join(
         f"- {table_name}: {table_length}" for table_name, table_length in zip(table_names, lengths)
@@ -47,12 +47,15 @@ from survey_pipeline_template.pipeline.input_file_processing import extract_look
 from survey_pipeline_template.pipeline.input_file_processing import extract_validate_transform_input_data
 from survey_pipeline_template.pipeline.job_transformations import job_transformations
 from survey_pipeline_template.pipeline.lab_transformations import lab_transformations
-from survey_pipeline_template.pipeline.load import add_error_file_log_entry
+from survey_pipeline_template.pipeline.load import add_error_file_log_entries
+from survey_pipeline_template.pipeline.load import add_incremental_file_log_entries
 from survey_pipeline_template.pipeline.load import check_table_exists
 from survey_pipeline_template.pipeline.load import delete_tables
 from survey_pipeline_template.pipeline.load import extract_from_table
 from survey_pipeline_template.pipeline.load import get_full_table_name
 from survey_pipeline_template.pipeline.load import get_run_id
+from survey_pipeline_template.pipeline.load import get_table_layout
+from survey_pipeline_template.pipeline.load import get_table_schema
 from survey_pipeline_template.pipeline.load import update_table
 from survey_pipeline_template.pipeline.load import update_table_and_log_source_files
 from survey_pipeline_template.pipeline.lookup_and_regex_transformations import blood_past_positive_transformations
@@ -80,8 +83,9 @@ from survey_pipeline_template.pipeline.validation_schema import soc_schema
 from survey_pipeline_template.pipeline.validation_schema import validation_schemas
 from survey_pipeline_template.pipeline.visit_transformations import visit_transformations
 from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+from survey_pipeline_template.pyspark_utils import spark_to_pandas
 from survey_pipeline_template.validate import check_lookup_table_joined_columns_unique
-from survey_pipeline_template.validate import normalise_schema
+from survey_pipeline_template.validate import normalise_schemas
 from survey_pipeline_template.validate import validate_processed_files
 
 # from cishouseholds.validate import validate_files
@@ -362,7 +366,6 @@ def process_soc_deltas(
     join_on_columns = ["work_main_job_title", "work_main_job_role"]
     inconsistencies_resolution_df = extract_from_table(inconsistencies_resolution_table)
 
-    dfs: List[DataFrame] = []
     file_list = get_files_to_be_processed(
         resource_path=soc_file_pattern,
         latest_only=latest_only,
@@ -373,14 +376,11 @@ def process_soc_deltas(
         date_from_filename=False,
     )
 
-    for file_path in file_list:
-        error_message, df = normalise_schema(file_path, soc_schema, soc_regex_map)
-        if error_message is None:
-            df = assign_filename_column(df, source_file_column)
-            dfs.append(df)
-        else:
-            add_error_file_log_entry(file_path, error_message)  # type: ignore
-            print(error_message)  # functional
+    file_errors, file_dfs = normalise_schemas(file_list, soc_schema, soc_regex_map)
+    for error_message in file_errors.values():
+        print(error_message)  # functional
+    add_error_file_log_entries(file_errors)
+    dfs = [assign_filename_column(df, source_file_column) for df in file_dfs.values()]
 
     if len(dfs) > 0:
         soc_lookup_df = union_multiple_tables(dfs)
@@ -520,24 +520,175 @@ def generate_input_processing_function(
 
 
 @register_pipeline_stage("union_survey_response_files")
-def union_survey_response_files(tables_to_process: List, output_survey_table: str):
+def union_survey_response_files(
+    tables_to_process: List,
+    output_survey_table: str,
+    incremental_output_table: Optional[str] = None,
+    source_file_column: str = "survey_response_source_file",
+    participant_id_column: str = "participant_id",
+    household_id_column: str = "ons_household_id",
+):
     """
     Union list of tables_to_process, and write to table.
 
+    In incremental mode, only the responses of households that have responses from source files that have not yet
+    been merged into the incremental output table are written. All responses of the participants in these households
+    are kept, so that derivations over each participant's and each household's responses are complete. The source
+    files are logged as pending in the incremental file log, and the results of the later stages are merged into the
+    incremental output table by the `merge_incremental_survey_responses` stage.
+
     Parameters
     ----------
     tables_to_process
         input tables for extracting each of the transformed survey responses tables
     output_survey_table
         output table name for the combine file of all unioned survey responses
+    incremental_output_table
+        table that responses are merged into at the end of the incremental run. If not set, all responses are written.
+        If the table does not exist yet, all responses are written and all source files are logged as pending
+    source_file_column
+        column containing the source file of each response
+    participant_id_column
+        column used to find all responses of the participants with new responses
+    household_id_column
+        column used to find all participants in the households with new responses
     """
     df_list = [extract_from_table(table) for table in tables_to_process]
 
     df = union_multiple_tables(df_list)
+    if incremental_output_table is not None:
+        unmerged_files = get_unmerged_source_files(tables_to_process, incremental_output_table)
+        print(f"    - {len(unmerged_files)} source files to be merged into {incremental_output_table}")  # functional
+        if check_table_exists(incremental_output_table):
+            df = filter_to_unmerged_households(
+                df, unmerged_files, source_file_column, participant_id_column, household_id_column
+            )
+        add_incremental_file_log_entries(incremental_output_table, unmerged_files, "pending")
     update_table(df, output_survey_table, "overwrite", survey_table=True)
     return {"output_survey_table": output_survey_table}
 
 
+def get_unmerged_source_files(tables_to_process: List[str], incremental_output_table: str) -> List[str]:
+    """
+    Get the source files that are recorded as processed into the tables_to_process, but are not yet logged as merged
+    into the incremental output table. Files are logged as merged even if none of their responses are in the output
+    table, such as when all of them are invalid, so that they are not processed again.
+    """
+    processed_files = (
+        extract_from_table("processed_filenames")
+        .filter(F.col("table_name").isin(tables_to_process) & F.col("currently_processed"))
+        .select(F.col("processed_filename").alias("source_file"))
+        .distinct()
+    )
+    if check_table_exists("incremental_file_log"):
+        merged_files = extract_from_table("incremental_file_log").filter(
+            (F.col("output_table") == incremental_output_table) & (F.col("file_status") == "merged")
+        )
+        processed_files = processed_files.join(merged_files, on="source_file", how="left_anti")
+    return [row["source_file"] for row in processed_files.collect()]
+
+
+def filter_to_unmerged_households(
+    df: DataFrame,
+    unmerged_files: List[str],
+    source_file_column: str,
+    participant_id_column: str,
+    household_id_column: str,
+):
+    """
+    Filter survey responses to all responses of the participants that have responses from the unmerged source files,
+    and of all other participants in their households.
+    """
+    affected_participants = (
+        df.filter(F.col(source_file_column).isin(unmerged_files)).select(participant_id_column).distinct()
+    )
+    affected_households = (
+        df.join(F.broadcast(affected_participants), on=participant_id_column, how="left_semi")
+        .select(household_id_column)
+        .distinct()
+    )
+    household_participants = (
+        df.join(F.broadcast(affected_households), on=household_id_column, how="left_semi")
+        .select(participant_id_column)
+        .union(affected_participants)
+        .distinct()
+    )
+    return df.join(F.broadcast(household_participants), on=participant_id_column, how="left_semi")
+
+
+@register_pipeline_stage("merge_incremental_survey_responses")
+def merge_incremental_survey_responses(
+    input_survey_table: str,
+    output_survey_table: str,
+    id_column: str = "participant_completion_window_id",
+):
+    """
+    Merge the survey responses processed in an incremental run into the output table, replacing any existing
+    responses with the same id. The source files logged as pending for the output table in this run, by
+    `union_survey_response_files` with the output table as its `incremental_output_table`, are logged as merged.
+
+    If the output table is partitioned in its table layout, only the partitions holding the processed responses, or
+    the responses they replace, are rewritten. Otherwise the whole table is rewritten. Partitioning by a hash of the
+    participant id keeps the number of partitions rewritten small, as all responses of a participant are processed
+    together:
+
+    storage:
+        table_layouts:
+            survey_responses:
+                partition_by: [participant_partition]
+                partition_columns:
+                    participant_partition: pmod(hash(participant_id), 100)
+
+    Parameters
+    ----------
+    input_survey_table
+        table of responses processed in this run
+    output_survey_table
+        table holding all processed responses
+    id_column
+        column uniquely identifying each response
+    """
+    df = extract_from_table(input_survey_table)
+    write_mode = "overwrite"
+    if check_table_exists(output_survey_table):
+        table_layout = get_table_layout(output_survey_table)
+        partition_by = table_layout.get("partition_by", [])
+        existing_df = extract_from_table(
+            output_survey_table, columns=get_table_schema(output_survey_table).names if partition_by else None
+        )
+        if partition_by:
+            for column_name, expression in table_layout.get("partition_columns", {}).items():
+                df = df.withColumn(column_name, F.expr(expression))
+            rewritten_partitions = (
+                existing_df.join(df.select(id_column), on=id_column, how="left_semi")
+                .select(*partition_by)
+                .union(df.select(*partition_by))
+                .distinct()
+            )
+            existing_df = existing_df.join(F.broadcast(rewritten_partitions), on=partition_by, how="left_semi")
+            write_mode = "overwrite_partitions"
+        existing_df = existing_df.checkpoint()
+        unchanged_df = existing_df.join(df.select(id_column), on=id_column, how="left_anti")
+        df = union_multiple_tables([unchanged_df, df])
+    update_table(df, output_survey_table, write_mode, survey_table=True)
+
+    if check_table_exists("incremental_file_log"):
+        pending_files = (
+            extract_from_table("incremental_file_log")
+            .filter(
+                (F.col("output_table") == output_survey_table)
+                & (F.col("run_id") == get_run_id())
+                & (F.col("file_status") == "pending")
+            )
+            .select("source_file")
+            .distinct()
+        )
+        add_incremental_file_log_entries(
+            output_survey_table, [row["source_file"] for row in pending_files.collect()], "merged"
+        )
+    return {"output_survey_table": output_survey_table}
+
+
 @register_pipeline_stage("union_historical_visits")
 def union_historical_visits(tables_to_process: List, output_survey_table: str):
     """
@@ -610,8 +761,14 @@ def execute_demographic_transformations(
     imputed_value_lookup_table: str,
     rural_urban_lookup_table: str,
     geography_lookup_table: str,
+    incremental_imputation: bool = False,
 ):
-    """"""
+    """
+    Parameters
+    ----------
+    incremental_imputation
+        only impute participants whose imputation inputs have changed since the imputed value lookup was written
+    """
     df = extract_from_table(input_survey_table)
     geography_lookup_df = extract_from_table(geography_lookup_table)
     rural_urban_lookup_df = extract_from_table(rural_urban_lookup_table)
@@ -623,6 +780,7 @@ def execute_demographic_transformations(
         imputed_value_lookup_df=imputed_value_lookup_df,
         geography_lookup_df=geography_lookup_df,
         rural_urban_lookup_df=rural_urban_lookup_df,
+        incremental_imputation=incremental_imputation,
     )
     update_table(df, output_survey_table, "overwrite")
     update_table(imputed_value_lookup_df, imputed_value_lookup_table, "overwrite")
@@ -700,6 +858,7 @@ def join_lookup_table(
     post_join_transformations: List[str] = [],
     output_table_name_key: str = "output_survey_table",
     latest_lookup_table: bool = False,
+    lookup_columns: Optional[List[str]] = None,
     **kwargs: dict,
 ):
     """
@@ -727,6 +886,8 @@ def join_lookup_table(
         can be altered to ensure that the output is not detected as an input_survey_table
     latest_lookup_table: bool
         will get the latest lookup table name if the table_name has several versions with a datetime suffix
+    lookup_columns: list
+        columns to read from the lookup table, in addition to the join_on_columns. All columns are read by default
     """
     transformations_dict: Dict[str, Any]
     transformations_dict = {
@@ -737,7 +898,9 @@ def join_lookup_table(
         "participant_extract_phm": clean_participant_extract_phm,
     }
 
-    lookup_df = extract_from_table(lookup_table_name, latest_table=latest_lookup_table)
+    if lookup_columns is not None:
+        lookup_columns = list(dict.fromkeys([*join_on_columns, *lookup_columns]))
+    lookup_df = extract_from_table(lookup_table_name, latest_table=latest_lookup_table, columns=lookup_columns)
     for transformation in lookup_transformations:
         lookup_df = transformations_dict[transformation](lookup_df, **kwargs)
 
@@ -782,12 +945,13 @@ def create_vaccine_regex_lookup(input_survey_table: str, regex_lookup_table: Opt
     else:
         lookup_df = None
 
-    df = extract_from_table(input_survey_table)
+    vaccine_type_columns = [
+        "cis_covid_vaccine_type_other" if vaccine_number == 0 else f"cis_covid_vaccine_type_other_{vaccine_number}"
+        for vaccine_number in range(0, 7)
+    ]
+    df = extract_from_table(input_survey_table, columns=vaccine_type_columns)
 
-    for vaccine_number in range(0, 7):
-        vaccine_type_col = (
-            "cis_covid_vaccine_type_other" if vaccine_number == 0 else f"cis_covid_vaccine_type_other_{vaccine_number}"
-        )
+    for vaccine_type_col in vaccine_type_columns:
 
         df = df.filter(F.col(vaccine_type_col).isNotNull())
 
@@ -966,17 +1130,36 @@ def report(
     output_directory
         output folder location to store the report
     """
-    valid_df = extract_from_table(valid_survey_responses_table)
-    invalid_df = extract_from_table(invalid_survey_responses_table)
+    vaccine_type_columns = [
+        col for col in get_table_schema(valid_survey_responses_table).names if col.startswith("cis_covid_vaccine_type")
+    ]
+    valid_df = extract_from_table(
+        valid_survey_responses_table,
+        columns=list(
+            dict.fromkeys(
+                [
+                    unique_id_column,
+                    duplicate_count_column_name,
+                    "standard_occupational_classification_code",
+                    "visit_id",
+                    "visit_datetime",
+                    *vaccine_type_columns,
+                ]
+            )
+        ),
+    )
+    invalid_df = extract_from_table(invalid_survey_responses_table, columns=[unique_id_column])
 
     valid_df_errors = generate_error_table(valid_survey_responses_errors_table, error_priority_map)
     invalid_df_errors = generate_error_table(invalid_survey_responses_errors_table, error_priority_map)
     soc_uncode_count = count_variable_option(valid_df, "standard_occupational_classification_code", "uncodeable")
-    processed_file_log = extract_from_table("processed_filenames")
+    processed_file_log = extract_from_table(
+        "processed_filenames", columns=["dataset_name", "processed_filename", "file_row_count"]
+    )
 
     invalid_files_count = 0
     if check_table_exists("error_file_log"):
-        invalid_files_log = extract_from_table("error_file_log")
+        invalid_files_log = extract_from_table("error_file_log", columns=["run_id"])
         invalid_files_count = invalid_files_log.filter(F.col("run_id") == get_run_id()).count()
 
     valid_survey_responses_count = valid_df.count()
@@ -1012,7 +1195,7 @@ def report(
     select_cols = [
         "visit_id",
         "visit_datetime",
-        *[col for col in valid_df.columns if col.startswith("cis_covid_vaccine_type")],
+        *vaccine_type_columns,
     ]
     other_vaccine_df = (
         valid_df.filter(F.col("cis_covid_vaccine_type") == "Don't know type").select(*select_cols).limit(50000)
@@ -1022,12 +1205,11 @@ def report(
     datasets = list(processed_file_log.select("dataset_name").distinct().rdd.flatMap(lambda x: x).collect())
     with pd.ExcelWriter(output) as writer:
         for dataset in datasets:
-            processed_files_df = (
+            processed_files_df = spark_to_pandas(
                 processed_file_log.filter(F.col("dataset_name") == dataset)
                 .select("processed_filename", "file_row_count")
                 .orderBy("processed_filename")
                 .distinct()
-                .toPandas()
             )
             processed_file_names = [name.split("/")[-1] for name in processed_files_df["processed_filename"]]
             processed_file_counts = processed_files_df["file_row_count"]
@@ -1035,12 +1217,12 @@ def report(
             name = f"{dataset}"
             individual_counts_df.to_excel(writer, sheet_name=name, index=False)
 
-        other_vaccine_df.toPandas().to_excel(writer, sheet_name="un-coded vaccines", index=False)
+        spark_to_pandas(other_vaccine_df).to_excel(writer, sheet_name="un-coded vaccines", index=False)
         counts_df.to_excel(writer, sheet_name="dataset totals", index=False)
-        valid_df_errors.toPandas().to_excel(writer, sheet_name="validation fails valid data", index=False)
-        invalid_df_errors.toPandas().to_excel(writer, sheet_name="validation fails invalid data", index=False)
-        duplicated_df.toPandas().to_excel(writer, sheet_name="duplicated record summary", index=False)
-        soc_uncode_count.toPandas().to_excel(writer, sheet_name="'uncodeable' soc code count", index=False)
+        spark_to_pandas(valid_df_errors).to_excel(writer, sheet_name="validation fails valid data", index=False)
+        spark_to_pandas(invalid_df_errors).to_excel(writer, sheet_name="validation fails invalid data", index=False)
+        spark_to_pandas(duplicated_df).to_excel(writer, sheet_name="duplicated record summary", index=False)
+        spark_to_pandas(soc_uncode_count).to_excel(writer, sheet_name="'uncodeable' soc code count", index=False)
 
     write_string_to_file(
         output.getbuffer(), f"{output_directory}/report_output_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.xlsx"
@@ -1053,7 +1235,18 @@ def phm_output_report(
     output_directory: str,
 ) -> DataFrame:
     """Generate a completion report for PHM / CRIS showing completion rates by launch language"""
-    all_df = extract_from_table(input_survey_table)
+    all_df = extract_from_table(
+        input_survey_table,
+        columns=[
+            "participant_id",
+            "participant_completion_window_start_date",
+            "participant_completion_window_end_date",
+            "survey_completion_status",
+            "visit_datetime",
+            "language_preference",
+            "form_language_submitted",
+        ],
+    )
     welsh_preference_df = all_df.filter(F.col("language_preference") == "Welsh")
     welsh_submitted_df = all_df.filter(F.col("form_language_submitted") == "Welsh")
     report = ExcelReport(output_directory=output_directory, output_file_prefix="phm_report_output")
@@ -1091,7 +1284,7 @@ def phm_validation_report(
     output_directory: str,
 ) -> DataFrame:
     """Generate a validation report for PHM / CRIS"""
-    df = extract_from_table(input_survey_table)
+    df = extract_from_table(input_survey_table, columns=["survey_response_source_file"])
     report = ExcelReport(output_directory=output_directory, output_file_prefix="phm_validation_output")
     report.create_validated_file_list(df=df, source_file_column="survey_response_source_file", sheet_name_prefix="all")
     report.write_excel_output()
@@ -1166,17 +1359,18 @@ def tables_to_csv(
     config_file = get_secondary_config(tables_to_csv_config_file)
 
     for table in config_file["create_tables"]:
-        df = extract_from_table(table["table_name"])
+        columns_to_select = None
         if table.get("column_name_map"):
+            table_columns = get_table_schema(table["table_name"]).names
             if accept_missing:
-                columns_to_select = [element for element in table["column_name_map"].keys() if element in df.columns]
+                columns_to_select = [element for element in table["column_name_map"].keys() if element in table_columns]
             else:
                 columns_to_select = [element for element in table["column_name_map"].keys()]
-                missing_columns = set(columns_to_select) - set(df.columns)
+                missing_columns = set(columns_to_select) - set(table_columns)
                 if missing_columns:
                     raise ValueError(f"Columns missing in {table['table_name']}: {missing_columns}")
 
-            df = df.select(*columns_to_select)
+        df = extract_from_table(table["table_name"], columns=columns_to_select)
 
         if len(filter.keys()) > 0:
             filter = {key: val if type(val) == list else [val] for key, val in filter.items()}
@@ -1224,11 +1418,18 @@ def compare(
     select_columns
         optional subset of columns to evaluate
     """
-    base_df = extract_from_table(base_table_name)
+    read_columns = None
+    if len(select_columns) > 0:
+        read_columns = [
+            col
+            for col in dict.fromkeys(["visit_id", "participant_id", unique_id_column, *select_columns])
+            if col != "unique_participant_response_id"
+        ]
+    base_df = extract_from_table(base_table_name, columns=read_columns)
     base_df = assign_unique_id_column(
         base_df, "unique_participant_response_id", concat_columns=["visit_id", "participant_id"]
     )
-    compare_df = extract_from_table(table_name_to_compare)
+    compare_df = extract_from_table(table_name_to_compare, columns=read_columns)
     compare_df = assign_unique_id_column(
         compare_df, "unique_participant_response_id", concat_columns=["visit_id", "participant_id"]
     )
@@ -15,6 +15,8 @@ from survey_pipeline_template.hdfs_utils import write_string_to_file
 from survey_pipeline_template.pipeline.load import extract_from_table
 from survey_pipeline_template.pipeline.load import get_run_id
 from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+from survey_pipeline_template.pyspark_utils import iter_spark_to_pandas
+from survey_pipeline_template.pyspark_utils import pandas_to_spark
 from survey_pipeline_template.validate import validate_processed_files
 
 
@@ -52,6 +54,23 @@ def count_variable_option(df: DataFrame, column_inv: str, column_value: str):
     return output_df
 
 
+def write_excel_sheet(writer: pd.ExcelWriter, df: DataFrame, sheet_name: str, max_rows_per_chunk: int = 100000):
+    """
+    Write a Spark DataFrame to a sheet of an Excel workbook, collecting no more than `max_rows_per_chunk` rows to the
+    driver at a time.
+    """
+    start_row = None
+    for chunk in iter_spark_to_pandas(df, max_rows_per_chunk):
+        if start_row is None:
+            chunk.to_excel(writer, sheet_name=sheet_name, index=False)
+            start_row = len(chunk) + 1
+        else:
+            chunk.to_excel(writer, sheet_name=sheet_name, index=False, header=False, startrow=start_row)
+            start_row += len(chunk)
+    if start_row is None:
+        pd.DataFrame(columns=df.columns).to_excel(writer, sheet_name=sheet_name, index=False)
+
+
 def dfs_to_bytes_excel(sheet_df_map: Dict[str, DataFrame]) -> BytesIO:
     """
     Convert a dictionary of Spark DataFrames into an Excel Object.
@@ -66,7 +85,7 @@ def dfs_to_bytes_excel(sheet_df_map: Dict[str, DataFrame]) -> BytesIO:
     output = BytesIO()
     with pd.ExcelWriter(output) as writer:
         for sheet, df in sheet_df_map.items():
-            df.toPandas().to_excel(writer, sheet_name=sheet, index=False)
+            write_excel_sheet(writer, df, sheet)
     return output
 
 
@@ -212,7 +231,7 @@ class ExcelReport:
         output_file_prefix = output_file_prefix if output_file_prefix else self.output_file_prefix
         with pd.ExcelWriter(self.output) as writer:
             for df, sheet_name in self.sheets:
-                df.toPandas().to_excel(writer, sheet_name=sheet_name, index=False)
+                write_excel_sheet(writer, df, sheet_name)
 
         write_string_to_file(
             self.output.getbuffer(),
@@ -428,14 +447,15 @@ class ExcelReport:
         """
         Runs the validate_processed_files on the input df and creates dfs and then sheets to add to the report object
         """
-        spark_session = get_or_create_spark_session()
         processed_files, unprocessed_files, non_existent_files = validate_processed_files(df, source_file_column)
         if processed_files:
-            processed_df = spark_session.createDataFrame(pd.DataFrame(processed_files, columns=["file_path"]))
+            processed_df = pandas_to_spark(pd.DataFrame(processed_files, columns=["file_path"]), "file_path string")
             self.add_sheet(processed_df, f"{sheet_name_prefix} processed file paths")
         if unprocessed_files:
-            unprocessed_df = spark_session.createDataFrame(pd.DataFrame(unprocessed_files, columns=["file_path"]))
+            unprocessed_df = pandas_to_spark(pd.DataFrame(unprocessed_files, columns=["file_path"]), "file_path string")
             self.add_sheet(unprocessed_df, f"{sheet_name_prefix} unprocessed file paths")
         if non_existent_files:
-            non_existent_df = spark_session.createDataFrame(pd.DataFrame(non_existent_files, columns=["file_path"]))
+            non_existent_df = pandas_to_spark(
+                pd.DataFrame(non_existent_files, columns=["file_path"]), "file_path string"
+            )
             self.add_sheet(non_existent_df, f"{sheet_name_prefix} nonexistent file paths")
@@ -1,25 +1,50 @@
 import inspect
 import os
+import threading
 import time
 import traceback
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from contextlib import contextmanager
+from contextlib import ExitStack
 from datetime import datetime
+from pathlib import Path
 from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
 
 import survey_pipeline_template.pipeline.input_file_stages  # noqa: F401
 import survey_pipeline_template.pipeline.pipeline_stages  # noqa: F401
+from survey_pipeline_template.file_catalog import save_file_catalogs
 from survey_pipeline_template.hdfs_utils import cleanup_checkpoint_dir
 from survey_pipeline_template.log import SplunkLogger
 from survey_pipeline_template.pipeline.config import get_config
 from survey_pipeline_template.pipeline.load import add_run_log_entry
+from survey_pipeline_template.pipeline.load import add_run_metrics_entry
 from survey_pipeline_template.pipeline.load import add_run_status
+from survey_pipeline_template.pipeline.load import add_stage_log_entry
 from survey_pipeline_template.pipeline.load import check_table_exists
+from survey_pipeline_template.pipeline.load import clear_fused_tables
+from survey_pipeline_template.pipeline.load import flush_log_buffer
+from survey_pipeline_template.pipeline.load import get_table_versions
+from survey_pipeline_template.pipeline.load import set_fused_tables
+from survey_pipeline_template.pipeline.load import start_log_buffer
+from survey_pipeline_template.pipeline.load import stop_log_buffer
+from survey_pipeline_template.pipeline.load import write_fused_tables
 from survey_pipeline_template.pipeline.logging import check_survey_table_lengths
 from survey_pipeline_template.pipeline.pipeline_stages import pipeline_stages
+from survey_pipeline_template.pipeline.stage_cache import get_cached_stage_result
+from survey_pipeline_template.pipeline.stage_cache import get_restorable_stages
+from survey_pipeline_template.pipeline.stage_cache import get_stage_fingerprint
+from survey_pipeline_template.pipeline.stage_metrics import StageMetricsCollector
 from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
 from survey_pipeline_template.pyspark_utils import get_spark_application_id
 from survey_pipeline_template.pyspark_utils import get_spark_ui_url
+from survey_pipeline_template.pyspark_utils import thread_local_properties_supported
 from survey_pipeline_template.validate import validate_config_stages
 
 
@@ -118,6 +143,13 @@ def run_from_config():
     run_datetime = datetime.now()
     splunk_logger = SplunkLogger(config.get("splunk_log_directory"))
 
+    start_log_buffer(
+        config["storage"].get(
+            "log_journal_file", str(Path.home() / f".{config['storage']['table_prefix']}pipeline_log_journal.jsonl")
+        )
+    )
+    with spark_description_set("writing recovered log entries"):
+        flush_log_buffer()
     with spark_description_set("adding run log entry"):
         run_id = add_run_log_entry(run_datetime)
     print(f"Run ID: {run_id}")  # functional
@@ -131,6 +163,14 @@ def run_from_config():
         print(f"cishouseholds version number: {pipeline_version}")  # functional
         splunk_logger.log(status="start")
 
+        restored_stages = None
+        if config.get("resume_run_id") is not None:
+            with spark_description_set("checking resumed run"):
+                restored_stages = get_restorable_stages(config["resume_run_id"], stages_to_run)
+            print(
+                f"Resuming run {config['resume_run_id']}, restoring {len(restored_stages)} completed stage(s)"
+            )  # functional
+
         pipeline_error_count = run_pipeline_stages(
             stages_to_run,
             config["stages"],
@@ -138,7 +178,14 @@ def run_from_config():
             splunk_logger,
             config.get("retry_times_on_fail", 0),
             config.get("retry_wait_time_seconds", 0),
+            config.get("max_concurrent_stages", 1),
+            config.get("fused_execution", False),
+            config.get("stage_caching", False),
+            restored_stages,
+            config.get("capture_stage_metrics", False),
         )
+        with spark_description_set("writing fused tables"):
+            write_fused_tables()
     except Exception as e:
         exception_text = traceback.format_exc()
         with spark_description_set("adding run status"):
@@ -150,7 +197,11 @@ def run_from_config():
         )
         raise e
     finally:
+        with spark_description_set("writing log entries"):
+            stop_log_buffer()
+        save_file_catalogs()
         # clean up check-pointed files
+        clear_fused_tables()
         cleanup_checkpoint_dir(spark)
 
     run_time = (datetime.now() - run_datetime).total_seconds()
@@ -181,6 +232,11 @@ def run_pipeline_stages(
     splunk_logger: SplunkLogger,
     retry_count: int = 1,
     retry_wait_time: int = 1,
+    max_concurrent_stages: int = 1,
+    fused_execution: bool = False,
+    stage_caching: bool = False,
+    restored_stages: Optional[Dict[str, Optional[dict]]] = None,
+    capture_stage_metrics: bool = False,
 ):
     """
     Run each stage of the pipeline. Catches, prints and logs any errors, but continues the pipeline run.
@@ -188,6 +244,26 @@ def run_pipeline_stages(
     Whether a stage runs can also be set conditionally by using
     when, operator, condition configuration in the config file.
 
+    When `max_concurrent_stages` is greater than 1, stages are run on a thread pool sharing the Spark session.
+    A stage is started once all of the stages it depends on have finished, as determined by
+    `build_stage_dependency_graph`. Each stage submits its Spark jobs to a FAIR scheduler pool named after the stage.
+    Concurrent stages require Spark local properties to be bound to the Python thread that sets them (see
+    `thread_local_properties_supported`), so stages are run one at a time on Spark versions without pinned threads.
+
+    When `fused_execution` is True, output survey tables that are only passed on to the next stage are kept in memory
+    as checkpointed DataFrames instead of being written to HIVE between stages. See `get_fused_tables`. These tables
+    must be written with `write_fused_tables` once the stages have been run.
+
+    When `stage_caching` is True, a stage is skipped if the fingerprint of its inputs matches its last successful
+    run and its output tables have not been written to since. Skipped stages are recorded as "cached" in the run status.
+    Stages without output tables, or with `io_tables`, are always run. Set `cache: False` on a stage to always run it.
+
+    Stages in `restored_stages` are not run. Their results are restored from a previous run, as returned by
+    `get_restorable_stages`, and they are recorded as "restored" in the run status.
+
+    When `capture_stage_metrics` is True, the Spark metrics of each stage that is run are written to the run metrics
+    table and logged to Splunk. See `StageMetricsCollector`. Failures to capture metrics do not fail the stage.
+
     Example
     -------------
     - function: example
@@ -203,17 +279,36 @@ def run_pipeline_stages(
     -------------
     Ensure that the stages referenced in any condition do return a status.
     A status can be added by adding a return string to the stage function.
+    Stages that do not declare their `input_tables`, `io_tables` or `output_tables` are not run concurrently with
+    any other stage. Additional ordering can be enforced with a list of stage names in `depends_on`.
+    Buffered pipeline log entries and file catalog listings are written at the end of each stage.
     """
 
     number_of_stages = len(pipeline_stage_list)
     max_digits = len(str(number_of_stages))
     pipeline_error_count = 0
-    stage_responses: Dict[str, str] = {}
-    current_table = None
-
-    for n, stage_name in enumerate(pipeline_stage_list):
+    stage_responses: Dict[str, Optional[str]] = {}
+    stage_output_tables: Dict[int, str] = {}
+    status_lock = threading.Lock()
+    stages_to_restore: Dict[str, Optional[dict]] = restored_stages or {}
+
+    fused_tables: Set[str] = set()
+    if fused_execution:
+        fused_tables = get_fused_tables(pipeline_stage_list, stage_configs)
+        print(f"Keeping tables in memory between stages: {', '.join(sorted(fused_tables))}")  # functional
+        set_fused_tables(fused_tables)
+
+    def _record_result(n: int, stage_name: str, result: Optional[dict]):
+        if isinstance(result, dict):
+            with status_lock:
+                stage_responses[stage_name] = result.get("status")
+                if result.get("output_survey_table") is not None:
+                    stage_output_tables[n] = result["output_survey_table"]
+
+    def _run_stage(n: int, stage_name: str, current_table: Optional[str]):
+        nonlocal pipeline_error_count
         stage_config = stage_configs[stage_name]
-        stage_config = {} if stage_config is None else stage_config
+        stage_config = {} if stage_config is None else dict(stage_config)
         stage_function_name = stage_config.pop("function", stage_name)
         stage_function_args = inspect.getfullargspec(pipeline_stages[stage_function_name]).args
 
@@ -226,77 +321,299 @@ def run_pipeline_stages(
         stage_input_tables = stage_config.pop("input_tables", {})
         stage_io_tables = stage_config.pop("io_tables", {})
         stage_output_tables = stage_config.pop("output_tables", {})
+        stage_config.pop("depends_on", None)
+        stage_config.pop("persist_output", None)
+        use_stage_cache = stage_config.pop("cache", True)
 
         stage_config.update(stage_input_tables)
         stage_config.update(stage_io_tables)
         stage_config.update(stage_output_tables)
 
+        read_tables, written_tables = get_stage_tables(stage_name, stage_configs[stage_name])
+
         print(stage_text)  # functional
-        if check_conditions(stage_responses=stage_responses, stage_config=stage_config):
-            stage_config.pop("when", None)
-            if (  # try to add input survey table directly
-                current_table is not None
-                and "input_survey_table" in stage_function_args
-                and "input_survey_table" not in stage_config
-            ):  # automatically add input table name
-                stage_config["input_survey_table"] = current_table
-
-            elif (  # try to add input survey table from input stage
-                "input_stage" in stage_config
-                and stage_config["input_stage"] in stage_configs
-                and "output_tables" in stage_configs[stage_config["input_stage"]]
-                and "input_survey_table" in stage_function_args
-            ):
-                stage_config["input_survey_table"] = stage_configs[stage_config["input_stage"]]["output_tables"][
-                    "output_survey_table"
-                ]
-            if "input_stage" in stage_config:
-                del stage_config["input_stage"]
-
-            while not stage_success and attempt < retry_count + 1:
-                if attempt != 0:
-                    with spark_description_set("adding run status"):
-                        add_run_status(run_id, "retry", stage_text, "")
-                attempt_start = datetime.now()
-                try:
-                    with spark_description_set(stage_name):
-                        result = pipeline_stages[stage_function_name](**stage_config)
-                        if result is not None:
-                            stage_responses[stage_name] = result.get("status")
-                            current_table = result.get("output_survey_table", current_table)
-                    stage_success = True
-                    with spark_description_set("adding run status"):
-                        add_run_status(run_id, "success", stage_text, "")
-                except Exception as e:
-                    exception_text = traceback.format_exc()
-                    attempt_run_time = (datetime.now() - attempt_start).total_seconds()
-                    print(exception_text)  # functional
-                    print(
-                        f"    - attempt {attempt} ran for {attempt_run_time//60:.0f} minute(s) and {attempt_run_time%60:.1f} second(s)"  # noqa:E501
-                    )  # functional
-
-                    print(exception_text)  # functional
-                    with spark_description_set("adding run status"):
-                        add_run_status(run_id, "errored", stage_text, exception_text)
-                    splunk_logger.log(
-                        status="error",
-                        error_stage=stage_name,
-                        error_message=repr(e),
+        if stage_name in stages_to_restore:
+            _record_result(n, stage_name, stages_to_restore[stage_name])
+            with status_lock, spark_description_set("adding run status"):
+                add_run_status(run_id, "restored", stage_text, "")
+                add_stage_log_entry(
+                    run_id,
+                    stage_name,
+                    "restored",
+                    stage_result=stages_to_restore[stage_name],
+                    output_table_versions=get_table_versions(written_tables),
+                )
+            print("    - restored from resumed run")  # functional
+            return
+
+        with status_lock:
+            run_stage = check_conditions(stage_responses=stage_responses, stage_config=stage_config)
+        if not run_stage:
+            with status_lock, spark_description_set("adding stage log entry"):
+                add_stage_log_entry(run_id, stage_name, "skipped")
+            print("    - stage not run")  # functional
+            return
+
+        stage_config.pop("when", None)
+        if (  # try to add input survey table directly
+            current_table is not None
+            and "input_survey_table" in stage_function_args
+            and "input_survey_table" not in stage_config
+        ):  # automatically add input table name
+            stage_config["input_survey_table"] = current_table
+
+        elif (  # try to add input survey table from input stage
+            "input_stage" in stage_config
+            and stage_config["input_stage"] in stage_configs
+            and "output_tables" in stage_configs[stage_config["input_stage"]]
+            and "input_survey_table" in stage_function_args
+        ):
+            stage_config["input_survey_table"] = stage_configs[stage_config["input_stage"]]["output_tables"][
+                "output_survey_table"
+            ]
+        if "input_stage" in stage_config:
+            del stage_config["input_stage"]
+
+        fingerprint = None
+        if stage_caching and use_stage_cache:
+            if written_tables and not stage_io_tables and not written_tables & set(fused_tables):
+                if "input_survey_table" in stage_config:
+                    read_tables.add(stage_config["input_survey_table"])
+                with spark_description_set("checking stage cache"):
+                    fingerprint = get_stage_fingerprint(stage_name, stage_config, read_tables)
+                    cached_result = None
+                    if fingerprint is not None:
+                        cached_result = get_cached_stage_result(stage_name, fingerprint, written_tables)
+                if cached_result is not None:
+                    _record_result(n, stage_name, cached_result)
+                    with status_lock, spark_description_set("adding run status"):
+                        add_run_status(run_id, "cached", stage_text, "")
+                        add_stage_log_entry(
+                            run_id, stage_name, "cached", fingerprint, cached_result, get_table_versions(written_tables)
+                        )
+                    print("    - inputs unchanged, using outputs from a previous run")  # functional
+                    return
+
+        metrics_collector = StageMetricsCollector(run_id, stage_name) if capture_stage_metrics else None
+        while not stage_success and attempt < retry_count + 1:
+            if attempt != 0:
+                with status_lock, spark_description_set("adding run status"):
+                    add_run_status(run_id, "retry", stage_text, "")
+            attempt_start = datetime.now()
+            try:
+                with ExitStack() as stage_context:
+                    stage_context.enter_context(spark_description_set(stage_name))
+                    if metrics_collector is not None:
+                        stage_context.enter_context(metrics_collector)
+                    result = pipeline_stages[stage_function_name](**stage_config)
+                    _record_result(n, stage_name, result)
+                stage_success = True
+                with status_lock, spark_description_set("adding run status"):
+                    add_run_status(run_id, "success", stage_text, "")
+                    add_stage_log_entry(
+                        run_id, stage_name, "success", fingerprint, result, get_table_versions(written_tables)
                     )
-
-                attempt += 1
-                time.sleep(retry_wait_time)
-            if not stage_success:
+            except Exception as e:
+                exception_text = traceback.format_exc()
+                attempt_run_time = (datetime.now() - attempt_start).total_seconds()
+                print(exception_text)  # functional
+                print(
+                    f"    - attempt {attempt} ran for {attempt_run_time//60:.0f} minute(s) and {attempt_run_time%60:.1f} second(s)"  # noqa:E501
+                )  # functional
+
+                print(exception_text)  # functional
+                with status_lock, spark_description_set("adding run status"):
+                    add_run_status(run_id, "errored", stage_text, exception_text)
+                splunk_logger.log(
+                    status="error",
+                    error_stage=stage_name,
+                    error_message=repr(e),
+                )
+
+            attempt += 1
+            time.sleep(retry_wait_time)
+        if not stage_success:
+            with status_lock, spark_description_set("adding stage log entry"):
                 pipeline_error_count += 1
-                complete_status_string = "unsuccessfully"
-            stage_run_time = (datetime.now() - stage_start).total_seconds()
-            print(
-                f"    - completed {complete_status_string} in: {stage_run_time//60:.0f} minute(s) and {stage_run_time%60:.1f} second(s) in {attempt} attempt(s)"  # noqa:E501
-            )  # functional
-        else:
-            print("    - stage not run")  # functional
+                add_stage_log_entry(run_id, stage_name, "errored", fingerprint)
+            complete_status_string = "unsuccessfully"
+        stage_run_time = (datetime.now() - stage_start).total_seconds()
+        print(
+            f"    - completed {complete_status_string} in: {stage_run_time//60:.0f} minute(s) and {stage_run_time%60:.1f} second(s) in {attempt} attempt(s)"  # noqa:E501
+        )  # functional
+        if metrics_collector is not None:
+            _log_stage_metrics(stage_name, metrics_collector)
+
+    def _log_stage_metrics(stage_name: str, metrics_collector: StageMetricsCollector):
+        try:
+            metrics = metrics_collector.get_metrics()
+            with status_lock, spark_description_set("adding run metrics"):
+                add_run_metrics_entry(run_id, stage_name, metrics)
+            splunk_logger.log(status="stage_metrics", stage=stage_name, **metrics)
+        except Exception:
+            print(f"    - failed to capture stage metrics:\n{traceback.format_exc()}")  # functional
+
+    def _latest_output_table(n: int):
+        """Latest output survey table returned by a stage preceding stage `n` in the run list."""
+        previous_outputs = [stage_output_tables[i] for i in sorted(stage_output_tables) if i < n]
+        return previous_outputs[-1] if previous_outputs else None
+
+    if max_concurrent_stages > 1 and not thread_local_properties_supported():
+        print(
+            "WARNING: Spark local properties are shared between threads without pinned thread mode."
+            " Stages will be run one at a time."
+        )  # functional
+        max_concurrent_stages = 1
+
+    if max_concurrent_stages <= 1:
+        for n, stage_name in enumerate(pipeline_stage_list):
+            _run_stage(n, stage_name, _latest_output_table(n))
+            with spark_description_set("writing log entries"):
+                flush_log_buffer()
+            save_file_catalogs()
+        return pipeline_error_count
+
+    def _run_stage_in_pool(n: int, stage_name: str):
+        spark_context = get_or_create_spark_session().sparkContext
+        spark_context.setLocalProperty("spark.scheduler.pool", stage_name)
+        try:
+            _run_stage(n, stage_name, _latest_output_table(n))
+            with spark_description_set("writing log entries"):
+                flush_log_buffer()
+            save_file_catalogs()
+        finally:
+            spark_context.setLocalProperty("spark.scheduler.pool", None)
+
+    stage_dependencies = build_stage_dependency_graph(pipeline_stage_list, stage_configs)
+    stage_numbers = {stage_name: n for n, stage_name in enumerate(pipeline_stage_list)}
+    waiting_stages = list(pipeline_stage_list)
+    completed_stages: Set[str] = set()
+    running_stages: Dict[Future, str] = {}
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_stages) as executor:
+        while waiting_stages or running_stages:
+            ready_stages = [stage for stage in waiting_stages if stage_dependencies[stage].issubset(completed_stages)]
+            for stage_name in ready_stages:
+                waiting_stages.remove(stage_name)
+                running_stages[executor.submit(_run_stage_in_pool, stage_numbers[stage_name], stage_name)] = stage_name
+            finished_stages, _ = wait(running_stages, return_when=FIRST_COMPLETED)
+            for future in finished_stages:
+                completed_stages.add(running_stages.pop(future))
+                future.result()
     return pipeline_error_count
 
 
+def get_stage_tables(stage_name: str, stage_config: dict) -> Tuple[Set[str], Set[str]]:
+    """
+    Get the tables that a stage reads from and writes to, as declared in its configuration.
+
+    Tables are taken from `input_tables`, `io_tables`, `output_tables` and `tables_to_process`, the `table_name`
+    of any `file_operations` and the `transformed_` table of stages with a `dataset_name`.
+
+    Returns
+    -------
+    read_tables, written_tables
+    """
+    stage_config = {} if stage_config is None else stage_config
+    stage_function = pipeline_stages[stage_config.get("function", stage_name)]
+
+    io_tables = set(stage_config.get("io_tables", {}).values())
+    read_tables = set(stage_config.get("input_tables", {}).values()) | io_tables
+    read_tables.update(stage_config.get("tables_to_process", []))
+    written_tables = set(stage_config.get("output_tables", {}).values()) | io_tables
+    written_tables.update(
+        file_operation["table_name"]
+        for file_operation in stage_config.get("file_operations", [])
+        if "table_name" in file_operation
+    )
+
+    dataset_name_parameter = inspect.signature(stage_function).parameters.get("dataset_name")
+    dataset_name = stage_config.get("dataset_name", getattr(dataset_name_parameter, "default", None))
+    if dataset_name not in [None, inspect.Parameter.empty]:
+        written_tables.add(f"transformed_{dataset_name}")
+    return read_tables, written_tables
+
+
+def get_fused_tables(stages_to_run: List[str], stages_config: dict) -> Set[str]:
+    """
+    Get the output survey tables that can be passed directly to the next stage in memory, rather than being written
+    to and read back from HIVE before the next stage is run. These tables are written to HIVE at the end of the run.
+
+    A stage's `output_survey_table` is fused when the next stage to run unconditionally takes it as its
+    `input_survey_table` and the stage does not set `persist_output: True`. Set `persist_output` on any stage whose
+    output table must be written as soon as the stage has run, such as for auditing a failed run.
+    """
+    fused_tables = set()
+    for stage, next_stage in zip(stages_to_run, stages_to_run[1:]):
+        stage_config = {} if stages_config[stage] is None else stages_config[stage]
+        next_stage_config = {} if stages_config[next_stage] is None else stages_config[next_stage]
+        output_table = stage_config.get("output_tables", {}).get("output_survey_table")
+        if output_table is None or stage_config.get("persist_output", False) or "when" in next_stage_config:
+            continue
+
+        next_stage_function_args = inspect.getfullargspec(
+            pipeline_stages[next_stage_config.get("function", next_stage)]
+        ).args
+        next_stage_input_table = next_stage_config.get(
+            "input_survey_table",
+            {**next_stage_config.get("input_tables", {}), **next_stage_config.get("io_tables", {})}.get(
+                "input_survey_table", output_table
+            ),
+        )
+        if "input_survey_table" in next_stage_function_args and next_stage_input_table == output_table:
+            fused_tables.add(output_table)
+    return fused_tables
+
+
+def build_stage_dependency_graph(stages_to_run: List[str], stages_config: dict) -> Dict[str, Set[str]]:
+    """
+    Build the dependency graph of the stages to run, mapping each stage to the earlier stages it must wait for.
+
+    A stage depends on an earlier stage when:
+    - it reads a table written by the earlier stage, or writes a table that the earlier stage reads or writes
+    - it references the earlier stage in its `when` conditions, `input_stage` or `depends_on`
+    - it takes its `input_survey_table` implicitly and the earlier stage outputs an `output_survey_table`
+    - either stage declares no tables, so its inputs and outputs are unknown
+    """
+    stage_tables = {stage: get_stage_tables(stage, stages_config[stage]) for stage in stages_to_run}
+    stage_dependencies: Dict[str, Set[str]] = {}
+
+    for n, stage in enumerate(stages_to_run):
+        stage_config = {} if stages_config[stage] is None else stages_config[stage]
+        read_tables, written_tables = stage_tables[stage]
+
+        stage_function_args = inspect.getfullargspec(pipeline_stages[stage_config.get("function", stage)]).args
+        declared_arguments = set(stage_config).union(
+            *[stage_config.get(table_type, {}) for table_type in ["input_tables", "io_tables", "output_tables"]]
+        )
+        implicit_input_table = (
+            "input_survey_table" in stage_function_args and "input_survey_table" not in declared_arguments
+        )
+
+        named_dependencies = set(stage_config.get("depends_on", []))
+        named_dependencies.update(stage_config.get("when", {}).get("conditions", {}))
+        if "input_stage" in stage_config:
+            named_dependencies.add(stage_config["input_stage"])
+
+        stage_dependencies[stage] = set()
+        for previous_stage in stages_to_run[:n]:
+            previous_config = {} if stages_config[previous_stage] is None else stages_config[previous_stage]
+            previous_read_tables, previous_written_tables = stage_tables[previous_stage]
+            outputs_survey_table = "output_survey_table" in {
+                **previous_config.get("io_tables", {}),
+                **previous_config.get("output_tables", {}),
+            }
+            if (
+                previous_stage in named_dependencies
+                or not (read_tables or written_tables)
+                or not (previous_read_tables or previous_written_tables)
+                or read_tables & previous_written_tables
+                or written_tables & (previous_read_tables | previous_written_tables)
+                or (implicit_input_table and outputs_survey_table)
+            ):
+                stage_dependencies[stage].add(previous_stage)
+    return stage_dependencies
+
+
 if __name__ == "__main__":
     run_from_config()
@@ -0,0 +1,119 @@
+import hashlib
+import json
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+import pyspark.sql.functions as F
+
+import survey_pipeline_template
+from survey_pipeline_template.hdfs_utils import get_path_fingerprint
+from survey_pipeline_template.pipeline.load import check_table_exists
+from survey_pipeline_template.pipeline.load import extract_from_table
+from survey_pipeline_template.pipeline.load import get_table_versions
+
+PATH_PREFIXES = ("hdfs://", "file:", "/")
+RESTORABLE_STAGE_STATUSES = ["success", "cached", "restored", "skipped"]
+
+
+def _get_config_paths(stage_config: Any) -> List[str]:
+    """Recursively find all file system paths in a stage configuration."""
+    if isinstance(stage_config, str):
+        return [stage_config] if stage_config.startswith(PATH_PREFIXES) else []
+    if isinstance(stage_config, dict):
+        stage_config = list(stage_config.values())
+    if isinstance(stage_config, (list, tuple)):
+        return [path for value in stage_config for path in _get_config_paths(value)]
+    return []
+
+
+def get_stage_fingerprint(stage_name: str, stage_config: dict, input_tables: Iterable[str]) -> Optional[str]:
+    """
+    Get a fingerprint of everything that a stage's outputs depend on.
+
+    The fingerprint covers the stage configuration, the versions of the input tables, the contents of any files or
+    directories referenced in the configuration and the pipeline version.
+
+    Parameters
+    ----------
+    stage_name
+    stage_config
+        keyword arguments that the stage function will be called with
+    input_tables
+        names of the tables that the stage reads
+
+    Returns
+    -------
+    str - sha256 hex digest, or None if any of the input tables has no version
+    """
+    input_table_versions = get_table_versions(input_tables)
+    if None in input_table_versions.values():
+        return None
+
+    fingerprint_content = {
+        "stage_name": stage_name,
+        "stage_config": stage_config,
+        "input_table_versions": input_table_versions,
+        "input_files": {path: get_path_fingerprint(path) for path in _get_config_paths(stage_config)},
+        "pipeline_version": survey_pipeline_template.__version__,
+    }
+    return hashlib.sha256(json.dumps(fingerprint_content, sort_keys=True, default=str).encode("UTF-8")).hexdigest()
+
+
+def get_cached_stage_result(
+    stage_name: str, fingerprint: str, output_tables: Iterable[str]
+) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Get the result of the last successful run of a stage, if it had the same fingerprint and its output tables have
+    not been written to since.
+
+    Returns
+    -------
+    dict - the stage result, or None if the stage must be run
+    """
+    if not check_table_exists("stage_log"):
+        return None
+    last_stage_entry = (
+        extract_from_table("stage_log")
+        .filter((F.col("stage_name") == stage_name) & F.col("stage_status").isin(["success", "cached"]))
+        .orderBy(F.desc("run_id"), F.desc("log_datetime"))
+        .first()
+    )
+    if last_stage_entry is None or last_stage_entry["fingerprint"] != fingerprint:
+        return None
+    if get_table_versions(output_tables) != json.loads(last_stage_entry["output_table_versions"] or "{}"):
+        return None
+    return json.loads(last_stage_entry["stage_result"] or "{}")
+
+
+def get_restorable_stages(resume_run_id: int, stages_to_run: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Get the stages of a previous run that do not need to be run again when resuming it, with their results.
+
+    Stages are restored in run order, up to the first stage that did not complete in the previous run, or whose output
+    tables no longer exist or have been written to since.
+
+    Returns
+    -------
+    dict - stage names mapped to their results
+    """
+    stage_log_entries = {}
+    if check_table_exists("stage_log"):
+        stage_log = extract_from_table("stage_log").filter(F.col("run_id") == resume_run_id)
+        for row in stage_log.orderBy("log_datetime").collect():
+            stage_log_entries[row["stage_name"]] = row
+    if not stage_log_entries:
+        raise ValueError(f"Cannot resume run {resume_run_id}; no stages were logged for this run")
+
+    restorable_stages = {}
+    for stage_name in stages_to_run:
+        stage_log_entry = stage_log_entries.get(stage_name)
+        if stage_log_entry is None or stage_log_entry["stage_status"] not in RESTORABLE_STAGE_STATUSES:
+            break
+        output_table_versions = json.loads(stage_log_entry["output_table_versions"] or "{}")
+        if None in output_table_versions.values() or get_table_versions(output_table_versions) != output_table_versions:
+            break
+        restorable_stages[stage_name] = json.loads(stage_log_entry["stage_result"] or "null")
+    return restorable_stages
@@ -0,0 +1,133 @@
+from datetime import datetime
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from py4j.protocol import Py4JError
+
+from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+
+STAGE_DATA_METRICS = {
+    "executor_run_time_ms": "executorRunTime",
+    "input_bytes": "inputBytes",
+    "input_records": "inputRecords",
+    "output_bytes": "outputBytes",
+    "output_records": "outputRecords",
+    "shuffle_read_bytes": "shuffleReadBytes",
+    "shuffle_read_records": "shuffleReadRecords",
+    "shuffle_write_bytes": "shuffleWriteBytes",
+    "shuffle_write_records": "shuffleWriteRecords",
+    "memory_bytes_spilled": "memoryBytesSpilled",
+    "disk_bytes_spilled": "diskBytesSpilled",
+}
+
+
+class StageMetricsCollector:
+    """
+    Collects Spark metrics for the jobs run by a pipeline stage.
+
+    Jobs run within the context of the collector are tagged with a job group, which is used to find them in the Spark
+    status tracker. Task metrics are summed over all attempts of the Spark stages of these jobs, from the Spark status
+    store. GC time is the change in total executor GC time while the collector is in use, so includes any other stages
+    running concurrently. Peak executor memory is the highest JVM heap memory used by any executor over its lifetime,
+    which is only reported from Spark 3.0 onwards.
+
+    Metrics are only available for jobs that are still retained by the Spark UI, as set by `spark.ui.retainedJobs`
+    and `spark.ui.retainedStages`. GC time is None if it could not be read from the status store. The job group that
+    was set before entering the collector is restored on exit.
+
+    Example
+    -------
+    >>> metrics_collector = StageMetricsCollector(run_id=1, stage_name="example_stage")
+    >>> with metrics_collector:
+    ...     run_example_stage()
+    >>> metrics_collector.get_metrics()
+    """
+
+    def __init__(self, run_id: int, stage_name: str):
+        self.job_group = f"run_{run_id}_{stage_name}"
+        self.duration_seconds = 0.0
+        self.gc_time_ms: Optional[int] = 0
+        self._start_time: Optional[datetime] = None
+        self._start_gc_time_ms: Optional[int] = None
+        self._previous_job_group: Optional[str] = None
+
+    def __enter__(self):
+        spark_context = get_or_create_spark_session().sparkContext
+        self._previous_job_group = spark_context.getLocalProperty("spark.jobGroup.id")
+        spark_context.setLocalProperty("spark.jobGroup.id", self.job_group)
+        self._start_time = datetime.now()
+        try:
+            self._start_gc_time_ms = self._get_total_gc_time_ms()
+        except Py4JError:
+            self._start_gc_time_ms = None
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        spark_context = get_or_create_spark_session().sparkContext
+        spark_context.setLocalProperty("spark.jobGroup.id", self._previous_job_group)
+        self.duration_seconds += (datetime.now() - self._start_time).total_seconds()
+        if self.gc_time_ms is None or self._start_gc_time_ms is None:
+            self.gc_time_ms = None
+            return
+        try:
+            self.gc_time_ms += self._get_total_gc_time_ms() - self._start_gc_time_ms
+        except Py4JError:
+            self.gc_time_ms = None
+
+    @staticmethod
+    def _get_executor_summaries() -> List:
+        status_store = get_or_create_spark_session().sparkContext._jsc.sc().statusStore()
+        executor_summaries = status_store.executorList(False)
+        return [executor_summaries.apply(i) for i in range(executor_summaries.size())]
+
+    def _get_total_gc_time_ms(self) -> int:
+        return sum(executor_summary.totalGCTime() for executor_summary in self._get_executor_summaries())
+
+    def _get_peak_executor_memory_bytes(self) -> Optional[int]:
+        """Get the peak JVM heap memory used by any executor, where reported by the Spark version in use."""
+        peak_memory = []
+        try:
+            for executor_summary in self._get_executor_summaries():
+                peak_memory_metrics = executor_summary.peakMemoryMetrics()
+                if peak_memory_metrics.isDefined():
+                    peak_memory.append(peak_memory_metrics.get().getMetricValue("JVMHeapMemory"))
+        except Py4JError:
+            return None
+        return max(peak_memory) if peak_memory else None
+
+    def get_metrics(self) -> Dict[str, Optional[float]]:
+        """Get the metrics for the jobs run within the collector's context so far."""
+        spark_context = get_or_create_spark_session().sparkContext
+        status_tracker = spark_context.statusTracker()
+        status_store = spark_context._jsc.sc().statusStore()
+
+        job_ids = status_tracker.getJobIdsForGroup(self.job_group)
+        stage_ids = set()
+        for job_id in job_ids:
+            job_info = status_tracker.getJobInfo(job_id)
+            if job_info is not None:
+                stage_ids.update(job_info.stageIds)
+
+        metrics = {metric_name: 0 for metric_name in STAGE_DATA_METRICS}
+        metrics.update({"task_count": 0, "failed_task_count": 0})
+        for stage_id in stage_ids:
+            try:
+                stage_attempts = status_store.stageData(stage_id, False)
+            except Py4JError:  # stage no longer retained by the status store
+                continue
+            for i in range(stage_attempts.size()):
+                stage_attempt = stage_attempts.apply(i)
+                metrics["task_count"] += stage_attempt.numCompleteTasks() + stage_attempt.numFailedTasks()
+                metrics["failed_task_count"] += stage_attempt.numFailedTasks()
+                for metric_name, stage_data_field in STAGE_DATA_METRICS.items():
+                    metrics[metric_name] += getattr(stage_attempt, stage_data_field)()
+
+        return {
+            "duration_seconds": self.duration_seconds,
+            "job_count": len(job_ids),
+            "spark_stage_count": len(stage_ids),
+            **metrics,
+            "gc_time_ms": self.gc_time_ms,
+            "peak_executor_memory_bytes": self._get_peak_executor_memory_bytes(),
+        }
@@ -1,17 +1,38 @@
+import functools
 import os
 from typing import Any
 from typing import Dict
+from typing import Iterator
 from typing import Mapping
+from typing import Optional
+from typing import Union
+from uuid import uuid4
 
+import pandas as pd
+import pyspark
 import pyspark.sql.functions as F
 from pandas.core.frame import DataFrame
 from pyspark.context import SparkContext
 from pyspark.sql import DataFrame as DF
 from pyspark.sql import SparkSession
+from pyspark.sql.types import _parse_datatype_string
+from pyspark.sql.types import ArrayType
+from pyspark.sql.types import ByteType
+from pyspark.sql.types import DataType
+from pyspark.sql.types import FloatType
+from pyspark.sql.types import IntegerType
+from pyspark.sql.types import LongType
+from pyspark.sql.types import MapType
+from pyspark.sql.types import ShortType
+from pyspark.sql.types import StringType
 from pyspark.sql.types import StructType
+from pyspark.sql.types import TimestampType
 
 from survey_pipeline_template.pipeline.config import get_config
 
+ARROW_MAX_RECORDS_PER_BATCH = 10000
+ARROW_MINIMUM_PYARROW_VERSION = "0.8.0"
+
 session_options = {
     "test": {
         "spark.executor.memory": "32g",
@@ -113,7 +134,10 @@ def get_or_create_spark_session() -> SparkSession:
     config = get_config()
     session_size = config.get("pyspark_session_size", "xs")
     spark_session_options = session_options[session_size]
-    spark_session = (
+    if pyspark.__version__.startswith("2."):
+        # Spark 2.4 reads and writes the Arrow IPC format used before pyarrow 0.15
+        os.environ.setdefault("ARROW_PRE_0_15_IPC_FORMAT", "1")
+    spark_session_builder = (
         SparkSession.builder.config("spark.executor.memory", spark_session_options["spark.executor.memory"])
         # .config("spark.jars.packages", "com.crealytics:spark-excel_2.11:0.12.2")
         .config("spark.executor.cores", spark_session_options["spark.executor.cores"])
@@ -127,14 +151,160 @@ def get_or_create_spark_session() -> SparkSession:
         .config("spark.sql.adaptive.enabled", "true")
         .config("spark.task.cpus", spark_session_options["spark.task.cpus"])
         .config("spark.sql.session.timeZone", "UTC")
+        .config("spark.sql.execution.arrow.enabled", "true")
+        .config("spark.sql.execution.arrow.fallback.enabled", "true")
+        .config("spark.sql.execution.arrow.maxRecordsPerBatch", ARROW_MAX_RECORDS_PER_BATCH)
+        .config("spark.executorEnv.ARROW_PRE_0_15_IPC_FORMAT", os.environ.get("ARROW_PRE_0_15_IPC_FORMAT", "0"))
         .appName("cishouseholds")
         .enableHiveSupport()
-        .getOrCreate()
     )
+    if config.get("max_concurrent_stages", 1) > 1:
+        # share executors between stages that are run concurrently, rather than running their jobs first in first out
+        spark_session_builder = spark_session_builder.config("spark.scheduler.mode", "FAIR")
+    spark_session = spark_session_builder.getOrCreate()
 
     return spark_session
 
 
+def thread_local_properties_supported() -> bool:
+    """
+    Whether Spark local properties, such as the scheduler pool and job description, that are set from a Python thread
+    only apply to the jobs started from that thread. This requires py4j's pinned thread mode, which is the default
+    from Spark 3.2 and is not available before Spark 3.0.
+    """
+    try:
+        from py4j.clientserver import ClientServer
+    except ImportError:
+        return False
+    return isinstance(SparkContext.getOrCreate()._gateway, ClientServer)
+
+
+def get_staging_directory(name: str) -> Optional[str]:
+    """
+    Get a new directory path under the Spark checkpoint directory, for intermediate data that is removed along with
+    the checkpoint directory at the end of a run. Returns None if no checkpoint directory is set.
+    """
+    checkpoint_directory = get_or_create_spark_session().sparkContext._jsc.sc().getCheckpointDir()
+    if checkpoint_directory.isEmpty():
+        return None
+    return f"{checkpoint_directory.get()}/{name}/{uuid4().hex}"
+
+
+@functools.lru_cache(maxsize=1)
+def _pyarrow_available() -> bool:
+    """Whether a version of pyarrow that Spark can use for conversions is installed."""
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    version = tuple(int(part) for part in pyarrow.__version__.split(".")[:2] if part.isdigit())
+    return version >= tuple(int(part) for part in ARROW_MINIMUM_PYARROW_VERSION.split(".")[:2])
+
+
+def _arrow_supports_type(data_type: DataType) -> bool:
+    """Whether Spark 2.4 can convert a data type to and from pandas with Arrow."""
+    if isinstance(data_type, (MapType, StructType)):
+        return False
+    if isinstance(data_type, ArrayType):
+        return not isinstance(data_type.elementType, TimestampType) and _arrow_supports_type(data_type.elementType)
+    return True
+
+
+def _can_use_arrow(schema: Optional[StructType]) -> bool:
+    return _pyarrow_available() and (schema is None or all(_arrow_supports_type(f.dataType) for f in schema.fields))
+
+
+def _correct_pandas_dtypes(pandas_df: DataFrame, schema: StructType) -> DataFrame:
+    """Set the dtypes of a pandas DataFrame built from Spark rows to those used by `toPandas`."""
+    dtypes = {ByteType: "int8", ShortType: "int16", IntegerType: "int32", LongType: "int64", FloatType: "float32"}
+    for field in schema.fields:
+        dtype = dtypes.get(type(field.dataType))
+        if dtype is not None and not pandas_df[field.name].isnull().any():
+            pandas_df[field.name] = pandas_df[field.name].astype(dtype)
+        elif isinstance(field.dataType, TimestampType):
+            pandas_df[field.name] = pd.to_datetime(pandas_df[field.name])
+    return pandas_df
+
+
+def _coerce_pandas_to_schema(pandas_df: DataFrame, schema: StructType) -> DataFrame:
+    """
+    Convert the columns of a pandas DataFrame to values that can be converted to the types of a Spark schema, by
+    position. Integer columns that pandas has made floating point to hold nulls are converted back to integers.
+    """
+    pandas_df = pandas_df.copy()
+    for column, field in zip(pandas_df.columns, schema.fields):
+        series = pandas_df[column]
+        if isinstance(field.dataType, (ByteType, ShortType, IntegerType, LongType)) and series.dtype.kind == "f":
+            int_values = [None if pd.isnull(value) else int(value) for value in series]
+            pandas_df[column] = pd.Series(int_values, index=series.index, dtype=object)
+        elif isinstance(field.dataType, StringType) and series.dtype.kind != "O":
+            str_values = [None if pd.isnull(value) else str(value) for value in series]
+            pandas_df[column] = pd.Series(str_values, index=series.index, dtype=object)
+        elif isinstance(field.dataType, TimestampType) and series.dtype.kind != "M":
+            pandas_df[column] = pd.to_datetime(series)
+    return pandas_df
+
+
+def _rows_to_pandas(rows: list, schema: StructType) -> DataFrame:
+    """Build a pandas DataFrame from collected Spark rows, with the dtypes used by `toPandas`."""
+    return _correct_pandas_dtypes(pd.DataFrame.from_records(rows, columns=schema.names), schema)
+
+
+def spark_to_pandas(df: DF) -> DataFrame:
+    """
+    Collect a Spark DataFrame to pandas, using Arrow where the schema's types are supported by it, and row by row
+    conversion otherwise.
+
+    Arrow is enabled for the session by `get_or_create_spark_session`, so the choice is made for each call by
+    bypassing `toPandas` for unsupported schemas, rather than by changing the session's configuration while other
+    stages may be converting data.
+    """
+    if _can_use_arrow(df.schema):
+        return df.toPandas()
+    return _rows_to_pandas(df.collect(), df.schema)
+
+
+def iter_spark_to_pandas(df: DF, max_rows_per_chunk: int = 100000) -> Iterator[DataFrame]:
+    """
+    Collect a Spark DataFrame to pandas in chunks of no more than `max_rows_per_chunk` rows. Rows are collected one
+    partition at a time, so driver memory is bounded by the largest partition and chunk, rather than the whole
+    DataFrame.
+    """
+    chunk = []
+    for row in df.toLocalIterator():
+        chunk.append(row)
+        if len(chunk) >= max_rows_per_chunk:
+            yield _rows_to_pandas(chunk, df.schema)
+            chunk = []
+    if chunk:
+        yield _rows_to_pandas(chunk, df.schema)
+
+
+def pandas_to_spark(pandas_df: DataFrame, schema: Union[StructType, str, None] = None) -> DF:
+    """
+    Create a Spark DataFrame from a pandas DataFrame, using Arrow where the schema's types are supported by it, and
+    row by row conversion otherwise.
+
+    Parameters
+    ----------
+    pandas_df
+    schema
+        schema or DDL schema string, applied to the pandas columns by position. Inferred from the pandas dtypes if not
+        set
+    """
+    spark_session = get_or_create_spark_session()
+    if isinstance(schema, str):
+        schema = _parse_datatype_string(schema)
+    if schema is not None:
+        pandas_df = _coerce_pandas_to_schema(pandas_df, schema)
+    if _can_use_arrow(schema):
+        return spark_session.createDataFrame(pandas_df, schema=schema)
+    rows = pandas_df.astype(object).where(pandas_df.notnull(), None).values.tolist()
+    return spark_session.createDataFrame(
+        rows, schema=schema if schema is not None else list(map(str, pandas_df.columns))
+    )
+
+
 def column_to_list(df: DataFrame, column_name: str):
     """Fast collection of all records in a column to a standard list."""
     return [row[column_name] for row in df.collect()]
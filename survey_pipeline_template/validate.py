@@ -4,9 +4,13 @@ import re
 from collections import Counter
 from io import StringIO
 from pathlib import Path
+from typing import Any
 from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import Union
+from urllib.parse import urlparse
 
 from pyspark import RDD
 from pyspark.sql import DataFrame
@@ -14,9 +18,268 @@ from pyspark.sql import functions as F
 from pyspark.sql import Window
 
 from survey_pipeline_template.extract import list_contents
-from survey_pipeline_template.pipeline.load import add_error_file_log_entry
+from survey_pipeline_template.filesystem import get_filesystem
+from survey_pipeline_template.pipeline.load import add_error_file_log_entries
 from survey_pipeline_template.pyspark_utils import column_to_distinct_list
 from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+from survey_pipeline_template.pyspark_utils import spark_to_pandas
+
+CSV_LINE_CHECKS = ["invalid_field_count", "carriage_return_within_line", "unbalanced_quote", "encoding_error"]
+
+
+def read_csv_lines(file_path: str) -> RDD:
+    """
+    Read the lines of a text file, split on line feeds only, so that any carriage returns before each line feed are
+    kept at the end of the line.
+    """
+    spark_session = get_or_create_spark_session()
+    # the input path is set directly, as paths passed to Spark are split on commas
+    return spark_session.sparkContext.newAPIHadoopRDD(
+        "org.apache.hadoop.mapreduce.lib.input.TextInputFormat",
+        "org.apache.hadoop.io.LongWritable",
+        "org.apache.hadoop.io.Text",
+        conf={
+            "mapreduce.input.fileinputformat.inputdir": _escape_hadoop_path(str(file_path)),
+            "textinputformat.record.delimiter": "\n",
+        },
+    ).values()
+
+
+def _escape_hadoop_path(file_path: str) -> str:
+    """Escape a path for a comma separated list of Hadoop input paths."""
+    return file_path.replace("\\", "\\\\").replace(",", "\\,")
+
+
+def _summarise_csv_partition(partition_index: int, lines, delimiter: str, max_sample_lines: int):
+    """Summarise the structure of the lines of one partition of a csv file, for `get_csv_structure_report`."""
+    summary: Dict[str, Any] = {
+        "partition_index": partition_index,
+        "line_count": 0,
+        "header": None,
+        "field_counts": {},
+        "crlf_line_count": 0,
+        **{check: [0, []] for check in CSV_LINE_CHECKS if check != "invalid_field_count"},
+    }
+
+    def add_line(check, line_index):
+        summary[check][0] += 1
+        if len(summary[check][1]) < max_sample_lines:
+            summary[check][1].append(line_index)
+
+    for line_index, line in enumerate(lines):
+        summary["line_count"] += 1
+        if line.endswith("\r"):
+            summary["crlf_line_count"] += 1
+            line = line[:-1]
+        if "\r" in line:
+            add_line("carriage_return_within_line", line_index)
+        if "\ufffd" in line:
+            add_line("encoding_error", line_index)
+        if line.count('"') % 2 != 0:
+            add_line("unbalanced_quote", line_index)
+
+        fields = next(csv.reader([line], delimiter=delimiter), [])
+        if partition_index == 0 and line_index == 0:
+            summary["header"] = fields
+        elif len(line) > 2:
+            field_count_lines = summary["field_counts"].setdefault(len(fields), [0, []])
+            field_count_lines[0] += 1
+            if len(field_count_lines[1]) < max_sample_lines:
+                field_count_lines[1].append(line_index)
+    yield summary
+
+
+def get_csv_structure_report(
+    text_file: RDD, delimiter: str = ",", expected_header: List[str] = None, max_sample_lines: int = 10
+) -> dict:
+    """
+    Check the structure of a csv file in a single pass over its lines.
+
+    Checks that each row has the same number of fields as the header, ignoring rows of 2 characters or fewer,
+    that quotes are balanced within each line, that lines are terminated consistently and that the file could be
+    decoded as UTF-8.
+
+    Parameters
+    ----------
+    text_file : RDD
+        lines of a csv file. Carriage returns at the end of lines are only detected if the lines were split on line
+        feeds only, as by `read_csv_lines`
+    delimiter : str
+        Delimiter used in csv file, default as ','
+    expected_header : List[str]
+        header expected in the csv file. The header is not checked if not given
+    max_sample_lines : int
+        maximum number of line numbers to report for each check
+
+    Returns
+    -------
+    dict
+        report of the header, line and field counts, and for each of the CSV_LINE_CHECKS the number of lines failing
+        the check (`<check>_count`) and a sample of their 1-based line numbers (`<check>_lines`). `valid` is True if
+        the header is as expected and all rows have the same number of fields as the header. The other checks are
+        reported, but do not make a file invalid.
+    """
+    partition_summaries = sorted(
+        text_file.mapPartitionsWithIndex(
+            lambda partition_index, lines: _summarise_csv_partition(partition_index, lines, delimiter, max_sample_lines)
+        ).collect(),
+        key=lambda summary: summary["partition_index"],
+    )
+    return _combine_csv_partition_summaries(partition_summaries, expected_header, max_sample_lines)
+
+
+def _combine_csv_partition_summaries(
+    partition_summaries: List[dict], expected_header: Optional[List[str]], max_sample_lines: int
+) -> dict:
+    """Combine the summaries of the partitions of a csv file, in file order, into a report of the whole file."""
+    report: Dict[str, Any] = {
+        "header": None,
+        "line_count": 0,
+        "field_counts": Counter(),
+        "crlf_line_count": 0,
+        **{f"{check}_count": 0 for check in CSV_LINE_CHECKS},
+        **{f"{check}_lines": [] for check in CSV_LINE_CHECKS},
+    }
+
+    def add_lines(check, line_count, line_indexes, first_line_number):
+        report[f"{check}_count"] += line_count
+        line_numbers = report[f"{check}_lines"] + [first_line_number + line_index for line_index in line_indexes]
+        report[f"{check}_lines"] = sorted(line_numbers)[:max_sample_lines]
+
+    if partition_summaries and partition_summaries[0]["line_count"] > 0:
+        report["header"] = partition_summaries[0]["header"]
+    expected_field_count = None if report["header"] is None else len(report["header"])
+
+    for summary in partition_summaries:
+        first_line_number = report["line_count"] + 1
+        report["line_count"] += summary["line_count"]
+        report["crlf_line_count"] += summary["crlf_line_count"]
+        for check in CSV_LINE_CHECKS:
+            if check != "invalid_field_count":
+                line_count, line_indexes = summary[check]
+                add_lines(check, line_count, line_indexes, first_line_number)
+        for field_count, (line_count, line_indexes) in summary["field_counts"].items():
+            report["field_counts"][field_count] += line_count
+            if field_count != expected_field_count:
+                add_lines("invalid_field_count", line_count, line_indexes, first_line_number)
+
+    report["mixed_line_terminators"] = 0 < report["crlf_line_count"] < report["line_count"]
+    report["valid_header"] = expected_header is None or report["header"] == expected_header
+    report["valid"] = report["valid_header"] and report["invalid_field_count_count"] == 0
+    return report
+
+
+def _split_csv_file_content(content: str):
+    """Split the content of a file into lines on line feeds, keeping any carriage returns before them."""
+    lines = content.split("\n")
+    return lines[:-1] if lines[-1] == "" else lines
+
+
+def _normalise_file_path(file_path: str) -> str:
+    """Remove any scheme and authority from a file path, so that paths given and listed by Spark can be matched."""
+    return urlparse(file_path).path
+
+
+def get_csv_structure_reports(
+    file_paths: List[str],
+    delimiter: str = ",",
+    expected_header: List[str] = None,
+    max_sample_lines: int = 10,
+    max_batch_file_bytes: int = 128 * 1024 * 1024,
+) -> Dict[str, dict]:
+    """
+    Check the structure of several csv files, as by `get_csv_structure_report`.
+
+    Files no larger than max_batch_file_bytes are read together with `wholeTextFiles` and checked in a single Spark
+    job, with each file checked by a single task. Larger files, and paths that are not single files, are checked
+    separately so that their lines can be split across tasks. Paths containing commas are also checked separately,
+    as `wholeTextFiles` takes a comma separated list of paths.
+
+    Returns
+    -------
+    dict
+        file paths mapped to their reports
+    """
+    batch_file_paths = []
+    for file_path in file_paths:
+        file_system = get_filesystem(file_path)
+        file_status = file_system.get_status(file_path) if file_system is not None else None
+        if (
+            file_status is not None
+            and not file_status.is_dir
+            and file_status.size <= max_batch_file_bytes
+            and "," not in file_path
+        ):
+            batch_file_paths.append(file_path)
+
+    reports = {}
+    if batch_file_paths:
+        spark_session = get_or_create_spark_session()
+        file_summaries = (
+            spark_session.sparkContext.wholeTextFiles(",".join(batch_file_paths))
+            .mapValues(
+                lambda content: list(
+                    _summarise_csv_partition(0, _split_csv_file_content(content), delimiter, max_sample_lines)
+                )
+            )
+            .collect()
+        )
+        batch_file_path_map = {_normalise_file_path(file_path): file_path for file_path in batch_file_paths}
+        for listed_file_path, partition_summaries in file_summaries:
+            batch_file_path = batch_file_path_map.get(_normalise_file_path(listed_file_path))
+            if batch_file_path is not None:
+                reports[batch_file_path] = _combine_csv_partition_summaries(
+                    partition_summaries, expected_header, max_sample_lines
+                )
+
+    for file_path in file_paths:
+        if file_path not in reports:
+            reports[file_path] = get_csv_structure_report(
+                read_csv_lines(file_path), delimiter, expected_header, max_sample_lines
+            )
+    return reports
+
+
+def describe_csv_structure_report(file_path: str, report: dict, expected_header: List[str]) -> Tuple[str, str]:
+    """
+    Describe the problems found in a csv file by `get_csv_structure_report`.
+
+    Returns
+    -------
+    str, str
+        errors that make the file invalid and warnings of other problems, or empty strings if there are none
+    """
+    error = ""
+    warning = ""
+    if not report["valid_header"]:
+        actual_header = report["header"] or []
+        error += (
+            f"Invalid file header:{file_path}\n"
+            f"Expected:     {expected_header}\n"
+            f"Actual:       {actual_header}\n"
+            f"Missing:      {set(expected_header) - set(actual_header)}\n"
+            f"Additional:   {set(actual_header) - set(expected_header)}\n"
+        )
+    if report["invalid_field_count_count"] > 0:
+        error += (
+            f"\nInvalid file: Number of fields in {file_path} "
+            "row(s) does not match expected number of columns from header"
+            f"\n{report['invalid_field_count_count']} row(s) affected, including lines "
+            f"{report['invalid_field_count_lines']}. Row field counts: {dict(report['field_counts'])}"
+        )
+    for check, description in [
+        ("unbalanced_quote", "unbalanced quotes"),
+        ("carriage_return_within_line", "carriage returns within the line"),
+        ("encoding_error", "characters that are not valid UTF-8"),
+    ]:
+        if report[f"{check}_count"] > 0:
+            warning += (
+                f"\nWARNING: {report[f'{check}_count']} row(s) in {file_path} contain {description}, "
+                f"including lines {report[f'{check}_lines']}"
+            )
+    if report["mixed_line_terminators"]:
+        warning += f"\nWARNING: {report['crlf_line_count']} of {report['line_count']} lines in {file_path} end in CRLF"
+    return error, warning
 
 
 def validate_csv_fields(text_file: RDD, delimiter: str = ","):
@@ -36,34 +299,154 @@ def validate_csv_fields(text_file: RDD, delimiter: str = ","):
         True if all rows have the expected number of columns or False
         if any rows exist with a different number of fields.
     """
-
-    def count_fields_in_row(delimiter, row):
-        """
-        Return the number of fields for a given row, as separated by the given delimiter.
-        """
-        f = StringIO(row)
-        reader = csv.reader(f, delimiter=delimiter)
-        n_fields = len(next(reader))
-        return n_fields
-
-    def check_field(delimiter, row, number_of_columns):
-        """
-        Check whether number of fields on a given row matches expected number of columns.
-        Return True boolean if numbers match and return False if not the case.
-        """
-        if len(row) > 2 and count_fields_in_row(delimiter, row) != number_of_columns:
-            return True
-        return False
-
-    header = text_file.first()
-    number_of_columns = count_fields_in_row(delimiter, header)
-    error_rows = text_file.filter(lambda row: check_field(delimiter, row, number_of_columns)).collect()
-    row_counts = text_file.map(lambda row: count_fields_in_row(delimiter, row)).collect()
-    print("Row counts: ", Counter(row_counts))  # functional
+    report = get_csv_structure_report(text_file, delimiter=delimiter)
+    print("Row counts: ", dict(report["field_counts"]))  # functional
     print(
-        f"There were {len(error_rows)} erroneous rows out of {text_file.count()} total rows: {error_rows}"
+        f"There were {report['invalid_field_count_count']} erroneous rows out of {report['line_count']} total "
+        f"rows, including lines: {report['invalid_field_count_lines']}"
     )  # functional
-    return True if len(error_rows) == 0 else False
+    return report["invalid_field_count_count"] == 0
+
+
+def sniff_csv_header(
+    file_path: str, min_header_fields: int, max_lines: int = 100, initial_num_bytes: int = 64 * 1024
+) -> Tuple[List[str], List[str]]:
+    """
+    Find the header of a csv file that may have lines before its header, reading only the start of the file.
+
+    The header is the first line with at least `min_header_fields` non-empty fields, within the first `max_lines`
+    distinct lines. The start of the file is read through the file system backend, reading more of the file only if
+    the first `initial_num_bytes` do not contain enough lines.
+
+    Returns
+    -------
+    header
+        the fields of the header, or of the last line checked if no header was found
+    skip_lines
+        the distinct lines up to and including the header, which should not be read as data
+    """
+    file_system = get_filesystem(file_path)
+    if file_system is None:
+        lines = get_or_create_spark_session().sparkContext.textFile(file_path).take(max_lines)
+        truncated = False
+    num_bytes = initial_num_bytes
+    while True:
+        if file_system is not None:
+            content = file_system.read_bytes(file_path, num_bytes)
+            truncated = len(content) >= num_bytes
+            lines = re.split(r"\r\n|\r|\n", content.decode("UTF-8", errors="replace"))
+            # the last line is incomplete if the file was truncated, or empty if the file ends with a line ending
+            lines = lines[:-1]
+
+        header: List[str] = []
+        skip_lines: List[str] = []
+        for line in lines:
+            if line in skip_lines:
+                continue
+            skip_lines.append(line)
+            header = next(csv.reader([line], delimiter=","), [])
+            if len([field for field in header if field != ""]) >= min_header_fields or len(skip_lines) >= max_lines:
+                return header, skip_lines
+        if not truncated:
+            return header, skip_lines
+        num_bytes *= 4
+
+
+def _resolve_normalised_schema(
+    actual_header: List[str], reference_validation_schema: dict, regex_schema: dict
+) -> Tuple[Optional[List[List[str]]], List[str]]:
+    """
+    Map the columns of a csv header to normalised column names and types, returning None as the schema if any of the
+    reference columns are not matched, and the names of any columns that should be dropped.
+    """
+    if actual_header == list(reference_validation_schema.keys()):
+        return [[col, _type] for col, _type in reference_validation_schema.items()], []
+
+    validation_schema = []
+    dont_drop_list = []
+    for actual_col in actual_header:
+        actual_col = "DROP" if actual_col == "" else actual_col.replace(" ", "_")
+        actual_col = re.sub(r"[^a-zA-Z0-9_]", "", actual_col)
+        matched = False
+        for regex, normalised_column in regex_schema.items():
+            if re.search(rf"{regex}", actual_col):
+                validation_schema.append([normalised_column, reference_validation_schema[normalised_column]["type"]])
+                dont_drop_list.append(actual_col)
+                matched = True
+                break
+        if not matched:
+            validation_schema.append([actual_col, "string"])
+    if not all([col in [col_name[0] for col_name in validation_schema] for col in reference_validation_schema.keys()]):
+        return None, []
+    drop = [
+        *[
+            "".join(filter(lambda x: x not in r"./\|", col.replace(" ", "_")))
+            for col in actual_header
+            if col not in dont_drop_list
+        ],
+        "DROP",
+    ]
+    return validation_schema, drop
+
+
+def _read_normalised_csv(file_path: str, skip_lines: List[str], validation_schema: List[List[str]], drop: List[str]):
+    """
+    Read a csv file with a resolved schema, excluding the lines before and including its header. Columns to be dropped
+    are read under placeholder names, so that they do not clash with each other.
+    """
+    spark_session = get_or_create_spark_session()
+    skip_line_set = set(skip_lines)
+    lines = spark_session.sparkContext.textFile(file_path).filter(lambda line: line not in skip_line_set)
+
+    read_columns = [col if col not in drop else f"_drop_{i}" for i, (col, _type) in enumerate(validation_schema)]
+    schema = ", ".join(f"`{col}` {_type}" for col, (_, _type) in zip(read_columns, validation_schema))
+    df = spark_session.read.csv(lines, schema=schema, sep=",", quote='"', escape='"')
+    # empty fields are read as nulls, but have always been kept as empty strings
+    return df.select(*[F.col(f"`{col}`") for col in read_columns if not col.startswith("_drop_")]).fillna("")
+
+
+def normalise_schemas(
+    file_paths: List[str], reference_validation_schema: dict, regex_schema: dict, header_sniff_bytes: int = 64 * 1024
+) -> Tuple[Dict[str, str], Dict[str, DataFrame]]:
+    """
+    Normalise the schemas of a batch of csv files, as in `normalise_schema`.
+
+    Headers are found and mapped on the driver, by reading the start of each file through the file system backend, so
+    no Spark jobs are run until the returned DataFrames are used. The DataFrames can then be unioned and read in a
+    single job.
+
+    Parameters
+    ----------
+    file_paths
+        file paths of the input data files
+    reference_validation_schema
+        normalised column names mapped to their validation schema, including their `type`
+    regex_schema
+        regex patterns mapped to the normalised column names of the columns they match
+    header_sniff_bytes
+        number of bytes to initially read from the start of each file when looking for its header
+
+    Returns
+    -------
+    errors
+        file paths mapped to error messages, for files with unrecognised columns
+    dfs
+        file paths mapped to DataFrames of their data, for files with recognised columns
+    """
+    errors = {}
+    dfs = {}
+    for file_path in file_paths:
+        actual_header, skip_lines = sniff_csv_header(
+            file_path, len(reference_validation_schema.keys()), initial_num_bytes=header_sniff_bytes
+        )
+        validation_schema, drop = _resolve_normalised_schema(actual_header, reference_validation_schema, regex_schema)
+        if validation_schema is None:
+            errors[file_path] = (
+                f"{file_path} is invalid as header({actual_header} contained unrecognisable columns"  # functional
+            )
+        else:
+            dfs[file_path] = _read_normalised_csv(file_path, skip_lines, validation_schema, drop)
+    return errors, dfs
 
 
 def normalise_schema(file_path: str, reference_validation_schema: dict, regex_schema: dict):
@@ -76,73 +459,20 @@ def normalise_schema(file_path: str, reference_validation_schema: dict, regex_sc
     file_path: str
         File path to input data file.
     reference_validation_schema: dict
-        ???
+        Normalised column names mapped to their validation schema, including their `type`.
     regex_schema: dict
-        ???
+        Regex patterns mapped to the normalised column names of the columns they match.
 
     Returns
     -------
     str or DataFrame
         If validation check failed and unrcognised columns are found, returns custom error message. Otherwise,
-        returns dataframe of ???
+        returns dataframe of the file's data, with normalised column names.
     """
-    spark_session = get_or_create_spark_session()
-
-    file = spark_session.sparkContext.textFile(file_path)
-    found = False
-    count = 0
-    used = []
-    while not found and count < 100:
-        first = file.first()
-        header = next(csv.reader(StringIO(first), delimiter=","))
-        used.append(first)
-        file = file.filter(lambda line: line not in used)
-        if len([x for x in header if x != ""]) >= len(reference_validation_schema.keys()):
-            found = True
-        count += 1
-
-    actual_header = header
-    validation_schema = []
-    dont_drop_list = []
-    if actual_header != list(reference_validation_schema.keys()):
-        for actual_col in actual_header:
-            actual_col = "DROP" if actual_col == "" else actual_col.replace(" ", "_")
-            actual_col = re.sub(r"[^a-zA-Z0-9_]", "", actual_col)
-            matched = False
-            for regex, normalised_column in regex_schema.items():
-                if re.search(rf"{regex}", actual_col):
-                    validation_schema.append(
-                        [normalised_column, reference_validation_schema[normalised_column]["type"]]
-                    )
-                    dont_drop_list.append(actual_col)
-                    matched = True
-                    break
-            if not matched:
-                validation_schema.append([actual_col, "string"])
-        if not all(
-            [col in [col_name[0] for col_name in validation_schema] for col in reference_validation_schema.keys()]
-        ):
-            error_message = (
-                f"{file_path} is invalid as header({actual_header} contained unrecognisable columns"  # functional
-            )
-            return error_message, None
-        drop = [
-            *[
-                "".join(filter(lambda x: x not in r"./\|", col.replace(" ", "_")))
-                for col in actual_header
-                if col not in dont_drop_list
-            ],
-            "DROP",
-        ]
-    else:
-        validation_schema = [[col, _type] for col, _type in reference_validation_schema.items()]
-        drop = []
-    df = (
-        file.mapPartitions(lambda line: csv.reader(line, delimiter=",", quotechar='"'))
-        .toDF(",".join([f"{col[0]} {col[1]}" for col in validation_schema]))
-        .drop(*drop)
-    )
-    return None, df
+    errors, dfs = normalise_schemas([file_path], reference_validation_schema, regex_schema)
+    if file_path in errors:
+        return errors[file_path], None
+    return None, dfs[file_path]
 
 
 def validate_csv_header(text_file: RDD, expected_header: List[str], delimiter: str = ","):
@@ -173,6 +503,7 @@ def validate_csv_header(text_file: RDD, expected_header: List[str], delimiter: s
 def validate_files(file_paths: Union[str, List[str]], validation_schema: dict, sep: str = ","):
     """
     Validate the header and field count of one or more CSV files on HDFS.
+    Files are checked together where possible, see `get_csv_structure_reports`, and errors are logged in one append.
 
     Parameters
     ----------
@@ -197,7 +528,6 @@ def validate_files(file_paths: Union[str, List[str]], validation_schema: dict, s
     """
     if file_paths is None or file_paths == "":
         raise FileNotFoundError("No file path specified")
-    spark_session = get_or_create_spark_session()
     if file_paths is None or file_paths in ["", []]:
         raise FileNotFoundError("No file path specified")
     if not isinstance(file_paths, list):
@@ -205,41 +535,25 @@ def validate_files(file_paths: Union[str, List[str]], validation_schema: dict, s
 
     expected_header_row = list(validation_schema.keys())
 
+    csv_file_paths = [file_path for file_path in file_paths if Path(file_path).suffix not in [".xlsx"]]
+    reports = get_csv_structure_reports(csv_file_paths, delimiter=sep, expected_header=expected_header_row)
+
     valid_files = []
+    file_errors = {}
     for file_path in file_paths:
         if Path(file_path).suffix in [".xlsx"]:  # TODO: add validation of xl files using pandas reading to get the
             valid_files.append(file_path)
             continue
-        error = ""
-        text_file = spark_session.sparkContext.textFile(file_path)
-        valid_csv_header = validate_csv_header(text_file, expected_header_row, delimiter=sep)
-        valid_csv_fields = validate_csv_fields(text_file, delimiter=sep)
-
-        if not valid_csv_header:
-            actual_header = text_file.first()
-            buffer = StringIO(actual_header)
-            reader = csv.reader(buffer, delimiter=sep)
-            actual_header = next(reader)
-            expected_header = list(validation_schema.keys())
-            error += (
-                f"Invalid file header:{file_path}\n"
-                f"Expected:     {expected_header}\n"
-                f"Actual:       {actual_header}\n"
-                f"Missing:      {set(expected_header) - set(actual_header)}\n"
-                f"Additional:   {set(actual_header) - set(expected_header)}\n"
-            )
-
-        if not valid_csv_fields:
-            error += (
-                f"\nInvalid file: Number of fields in {file_path} "
-                "row(s) does not match expected number of columns from header"
-            )
+        error, warning = describe_csv_structure_report(file_path, reports[file_path], expected_header_row)
 
+        if warning != "":
+            print(warning)  # functional
         if error != "":
             print(error)  # functional
-            add_error_file_log_entry(file_path, error)
+            file_errors[file_path] = error
         else:
             valid_files.append(file_path)
+    add_error_file_log_entries(file_errors)
     return valid_files
 
 
@@ -264,7 +578,7 @@ def validate_processed_files(df: DataFrame, source_file_column: str):
     processed_files = [f for f in processed_files if isinstance(f, str) and f != ""]
     dirs = [Path(f).parent.as_posix() for f in processed_files]
     dirs = [d for d in dirs if d not in ["."]]
-    dirs = [d for d in dirs if isinstance(d, str)]
+    dirs = sorted(set(d for d in dirs if isinstance(d, str)))
     found_files = []
     for d in dirs:
         files = [f for f in list_contents(d, date_from_filename=False)["file_path"].to_list() if isinstance(f, str)]
@@ -443,5 +757,5 @@ def check_lookup_table_joined_columns_unique(df, join_column_list, name_of_df):
     if duplicate_key_rows_df.count() > 0:
         raise ValueError(
             f"The lookup dataframe {name_of_df} has entries with duplicate join keys ({', '.join(join_column_list)})."
-            f"Duplicate rows: \n{duplicate_key_rows_df.toPandas()}"
+            f"Duplicate rows: \n{spark_to_pandas(duplicate_key_rows_df)}"
         )
@@ -6,6 +6,7 @@ from pathlib import Path
 from typing import Dict
 from typing import List
 from typing import Tuple
+from uuid import uuid4
 
 import numpy as np
 import pandas as pd
@@ -16,6 +17,7 @@ from pandas import Timestamp
 from pyspark.sql import SparkSession
 from pytest_regressions.data_regression import RegressionYamlDumper
 
+import survey_pipeline_template.pipeline.load as load_module
 from dummy_data_generation.helpers import CustomRandom
 from dummy_data_generation.helpers_weight import Distribution
 from dummy_data_generation.schemas import get_example_participant_data_data_description
@@ -61,6 +63,25 @@ def spark_session():
     spark_session.stop()
 
 
+@pytest.fixture
+def pipeline_storage(spark_session, monkeypatch, tmp_path):
+    """
+    Storage config for reading and writing pipeline tables in the default database, with a table prefix unique to
+    the test. Tables are dropped after the test. Add table layouts to the `table_layouts` of the yielded config.
+    """
+    storage_config = {"database": "default", "table_prefix": f"test_{uuid4().hex[:8]}_", "table_layouts": {}}
+    monkeypatch.setattr(
+        load_module, "get_config", lambda: {"storage": storage_config, "fused_checkpoint_type": "local"}
+    )
+    load_module.get_run_id.cache_clear()
+    spark_session.sparkContext.setCheckpointDir(str(tmp_path / "checkpoints"))
+    yield storage_config
+    load_module.get_run_id.cache_clear()
+    for table in spark_session.catalog.listTables("default"):
+        if table.name.startswith(storage_config["table_prefix"]):
+            spark_session.sql(f"DROP TABLE default.{table.name}")
+
+
 def generate_barcodes(count=60, format="ONS########"):
     """
     Generate a set of random formatted barcodes
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import openpyxl
+from pyspark.sql.types import IntegerType
+from pyspark.sql.types import StringType
+from pyspark.sql.types import StructField
+from pyspark.sql.types import StructType
+from pyspark.sql.types import TimestampType
+
+from survey_pipeline_template.extract import iter_excel_chunks
+
+
+def test_iter_excel_chunks(tmp_path):
+    """Test that rows are read in chunks, converted to the schema's types by position."""
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.append(["Participant ID", "Visit Count", "Visit Date", "Extra"])
+    worksheet.append(["A1", 1, datetime(2022, 1, 1), "x"])
+    worksheet.append(["A2", "2.0", None, "y"])
+    worksheet.append([None, None, None, None])
+    worksheet.append([3, "not a number", datetime(2022, 1, 3)])
+    workbook.save(tmp_path / "input.xlsx")
+    schema = StructType(
+        [
+            StructField("participant_id", StringType()),
+            StructField("visit_count", IntegerType()),
+            StructField("visit_datetime", TimestampType()),
+        ]
+    )
+
+    chunks = list(iter_excel_chunks(str(tmp_path / "input.xlsx"), schema, chunk_size=2))
+
+    assert chunks == [
+        [["A1", 1, datetime(2022, 1, 1)], ["A2", 2, None]],
+        [["3", None, datetime(2022, 1, 3)]],
+    ]
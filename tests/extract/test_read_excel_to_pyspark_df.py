@@ -0,0 +1,38 @@
+import openpyxl
+import pytest
+from chispa import assert_df_equality
+
+import survey_pipeline_template.extract as extract_module
+from survey_pipeline_template.extract import read_excel_to_pyspark_df
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.append(["participant_id", "visit_id"])
+    worksheet.append(["A1", "V1"])
+    worksheet.append(["A2", "V2"])
+    worksheet.append(["A3", "V3"])
+    workbook.save(tmp_path / "input.xlsx")
+    return str(tmp_path / "input.xlsx")
+
+
+def test_read_excel_to_pyspark_df(spark_session, tmp_path, workbook_path):
+    """Test that rows staged in chunks under the checkpoint directory are read back as a single DataFrame."""
+    spark_session.sparkContext.setCheckpointDir(str(tmp_path / "checkpoints"))
+    expected_df = spark_session.createDataFrame(
+        data=[("A1", "V1"), ("A2", "V2"), ("A3", "V3")], schema="participant_id string, visit_id string"
+    )
+
+    output_df = read_excel_to_pyspark_df(workbook_path, chunk_size=2)
+
+    assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_nullable=True)
+    assert all("/checkpoints/" in file_path for file_path in output_df.inputFiles())
+
+
+def test_read_excel_to_pyspark_df_without_checkpoint_directory(monkeypatch, workbook_path):
+    monkeypatch.setattr(extract_module, "get_staging_directory", lambda name: None)
+
+    with pytest.raises(ValueError, match="checkpoint directory"):
+        read_excel_to_pyspark_df(workbook_path)
@@ -0,0 +1,37 @@
+from survey_pipeline_template.file_catalog import FileCatalog
+from survey_pipeline_template.filesystem import LocalFileSystem
+
+
+def test_file_catalog_reuses_persisted_listings(spark_session, tmp_path, monkeypatch):
+    """Test that listings saved by one catalog are reused by the next, for directories that have not changed."""
+    (tmp_path / "input" / "nested").mkdir(parents=True)
+    (tmp_path / "input" / "file_1.csv").write_bytes(b"")
+    (tmp_path / "input" / "nested" / "file_2.csv").write_bytes(b"")
+    cache_path = str(tmp_path / "file_catalog.json")
+
+    file_catalog = FileCatalog(LocalFileSystem(), cache_path)
+    listed = file_catalog.list_status(tmp_path / "input", recursive=True)
+    file_catalog.save()
+
+    def fail_to_list_directory(self, path):
+        raise AssertionError(f"{path} listed again")
+
+    monkeypatch.setattr(LocalFileSystem, "list_directory", fail_to_list_directory)
+    recovered_file_catalog = FileCatalog(LocalFileSystem(), cache_path)
+
+    assert recovered_file_catalog.list_status(tmp_path / "input", recursive=True) == listed
+    assert [file_info.path for file_info in listed] == [
+        f"{tmp_path}/input/file_1.csv",
+        f"{tmp_path}/input/nested",
+        f"{tmp_path}/input/nested/file_2.csv",
+    ]
+
+
+def test_file_catalog_file_operations(tmp_path):
+    """Test that operations other than listing are passed to the catalog's file system."""
+    file_catalog = FileCatalog(LocalFileSystem())
+
+    assert file_catalog.write_bytes(tmp_path / "file.csv", b"header\nvalue\n")
+    assert file_catalog.isfile(tmp_path / "file.csv")
+    assert file_catalog.read_first_line(tmp_path / "file.csv") == "header"
+    assert file_catalog.size(tmp_path / "file.csv") == 13
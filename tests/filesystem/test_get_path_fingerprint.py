@@ -0,0 +1,26 @@
+from survey_pipeline_template.hdfs_utils import _human_readable_size
+from survey_pipeline_template.hdfs_utils import get_path_fingerprint
+
+
+def test_get_path_fingerprint(spark_session, tmp_path):
+    """Test that the fingerprint of a local directory changes when a file under it changes, and not otherwise."""
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "a.csv").write_text("a")
+    (tmp_path / "nested" / "b.csv").write_text("b")
+
+    fingerprint = get_path_fingerprint(str(tmp_path))
+    assert get_path_fingerprint(str(tmp_path)) == fingerprint
+    assert get_path_fingerprint(str(tmp_path / "*.csv")) != fingerprint
+
+    (tmp_path / "nested" / "b.csv").write_text("bb")
+    assert get_path_fingerprint(str(tmp_path)) != fingerprint
+    assert get_path_fingerprint(str(tmp_path / "missing")) is None
+
+
+def test_human_readable_size():
+    assert [_human_readable_size(size) for size in [1023, 1536, 5 * 1024**3, 3 * 1024**6]] == [
+        "1023",
+        "1.5 K",
+        "5.0 G",
+        "3072.0 P",
+    ]
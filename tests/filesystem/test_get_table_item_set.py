@@ -0,0 +1,14 @@
+from survey_pipeline_template.file_catalog import get_table_item_set
+from survey_pipeline_template.pipeline.load import update_table
+
+
+def test_get_table_item_set(spark_session, pipeline_storage):
+    """Test that table values are read once, and read again after the table is written to."""
+    update_table(spark_session.createDataFrame([("a",), ("b",)], "item string"), "item_table", "overwrite")
+    assert get_table_item_set("item_table", "item") == {"a", "b"}
+
+    spark_session.sql(f"INSERT INTO default.{pipeline_storage['table_prefix']}item_table VALUES ('c')")
+    assert get_table_item_set("item_table", "item") == {"a", "b"}
+
+    update_table(spark_session.createDataFrame([("d",)], "item string"), "item_table", "append")
+    assert get_table_item_set("item_table", "item") == {"a", "b", "c", "d"}
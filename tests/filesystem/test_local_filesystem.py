@@ -0,0 +1,23 @@
+from survey_pipeline_template.filesystem import LocalFileSystem
+
+
+def test_local_filesystem_list_status(tmp_path):
+    """Test that the contents of matching directories are listed, as with `hadoop fs -ls`."""
+    (tmp_path / "a" / "nested").mkdir(parents=True)
+    (tmp_path / "a" / "file_1.csv").write_bytes(b"header_1,header_2\nvalue_1,value_2\n")
+    (tmp_path / "a" / "nested" / "file_2.csv").write_bytes(b"")
+    (tmp_path / "b.csv").write_bytes(b"")
+    file_system = LocalFileSystem()
+
+    listed = [(file_info.path, file_info.is_dir) for file_info in file_system.list_status(tmp_path / "a")]
+    listed_recursive = [file_info.path for file_info in file_system.list_status(tmp_path / "a", recursive=True)]
+    listed_glob = [file_info.path for file_info in file_system.list_status(f"{tmp_path}/*.csv")]
+
+    assert listed == [(f"{tmp_path}/a/file_1.csv", False), (f"{tmp_path}/a/nested", True)]
+    assert listed_recursive == [
+        f"{tmp_path}/a/file_1.csv",
+        f"{tmp_path}/a/nested",
+        f"{tmp_path}/a/nested/file_2.csv",
+    ]
+    assert listed_glob == [f"{tmp_path}/b.csv"]
+    assert file_system.read_first_line(tmp_path / "a" / "file_1.csv", initial_num_bytes=4) == "header_1,header_2"
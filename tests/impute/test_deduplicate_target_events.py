@@ -0,0 +1,63 @@
+import random
+from datetime import date
+from datetime import timedelta
+
+import pytest
+from chispa import assert_df_equality
+
+from survey_pipeline_template.impute import deduplicate_target_events
+
+schema = "participant_id integer, event_date date, event_id integer, target_date date"
+
+
+def deduplicate_target_events_by_loop(rows, target_date_tolerance):
+    """
+    Reference implementation, repeatedly keeping the earliest remaining record for each participant and removing all
+    records within the tolerance of its target date.
+    """
+    kept_rows = []
+    for participant_id in {row[0] for row in rows}:
+        remaining_rows = sorted(row for row in rows if row[0] == participant_id)
+        while remaining_rows:
+            first_row = remaining_rows[0]
+            kept_rows.append(first_row)
+            remaining_rows = [
+                row for row in remaining_rows if abs((row[3] - first_row[3]).days) > target_date_tolerance
+            ]
+    return kept_rows
+
+
+def generate_chains(seed):
+    """
+    Generate overlapping chains of target dates, where consecutive dates are just within or just outside of the
+    tolerance of each other, recorded in a different order to the target dates.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for participant_id in range(20):
+        target_date = date(2020, 1, 1)
+        event_dates = rng.sample(range(60), rng.randint(1, 15))
+        for event_id, event_day in enumerate(event_dates):
+            target_date += timedelta(days=rng.choice([0, 2, 3, 4, 7, 8]) * rng.choice([1, -1]))
+            rows.append((participant_id, date(2021, 1, 1) + timedelta(days=event_day), event_id, target_date))
+    return rows
+
+
+@pytest.mark.parametrize("target_date_tolerance", [0, 3, 7])
+@pytest.mark.parametrize("seed", [1, 2])
+def test_deduplicate_target_events(spark_session, target_date_tolerance, seed):
+    rows = generate_chains(seed)
+    input_df = spark_session.createDataFrame(rows, schema=schema)
+    expected_df = spark_session.createDataFrame(
+        deduplicate_target_events_by_loop(rows, target_date_tolerance), schema=schema
+    )
+
+    output_df = deduplicate_target_events(
+        input_df,
+        target_date_column="target_date",
+        target_date_tolerance=target_date_tolerance,
+        participant_id_column="participant_id",
+        event_datetime_column="event_date",
+        event_id_column="event_id",
+    )
+    assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_nullable=True)
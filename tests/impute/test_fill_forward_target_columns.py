@@ -46,7 +46,6 @@ def test_fill_forward_target_columns_1(spark_session):
         participant_id_column="participant_id",
         event_datetime_column="event_date",
         event_id_column="event_id",
-        use_hdfs=False,
     )
 
     assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_column_order=True, ignore_nullable=True)
@@ -84,7 +83,6 @@ def test_fill_forward_target_columns_2(spark_session):
         participant_id_column="participant_id",
         event_datetime_column="event_date",
         event_id_column="event_id",
-        use_hdfs=False,
     )
 
     assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_column_order=True, ignore_nullable=True)
@@ -125,7 +123,6 @@ def test_fill_forward_target_columns_3(spark_session):
         participant_id_column="participant_id",
         event_datetime_column="event_date",
         event_id_column="event_id",
-        use_hdfs=False,
     )
 
     assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_column_order=True, ignore_nullable=True)
@@ -167,7 +164,6 @@ def test_fill_forward_target_columns_4(spark_session):
         participant_id_column="participant_id",
         event_datetime_column="event_date",
         event_id_column="event_id",
-        use_hdfs=False,
     )
 
     assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_column_order=True, ignore_nullable=True)
@@ -211,6 +207,5 @@ def test_fill_forward_target_columns_5(spark_session):
         participant_id_column="participant_id",
         event_datetime_column="event_date",
         event_id_column="event_id",
-        use_hdfs=False,
     )
     assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_column_order=True, ignore_nullable=True)
@@ -0,0 +1,50 @@
+from chispa import assert_df_equality
+from pyspark.sql import functions as F
+from pyspark.sql.window import Window
+
+from survey_pipeline_template.impute import fill_using_windows
+
+
+def test_fill_using_windows(spark_session):
+    """
+    Test that columns are filled over their own windows, and that columns filled more than once use their earlier fill.
+    """
+    input_df = spark_session.createDataFrame(
+        data=[
+            # fmt:off
+            (1, 1, "a",  None, None),
+            (1, 2, None, "x",  None),
+            (1, 3, None, None, 10),
+            (1, 4, "b",  None, None),
+            (2, 1, None, None, None),
+            (2, 2, "c",  None, 20),
+            # fmt:on
+        ],
+        schema="id integer, visit integer, letter string, symbol string, number integer",
+    )
+    expected_df = spark_session.createDataFrame(
+        data=[
+            # fmt:off
+            (1, 1, "a", None, 10),
+            (1, 2, "a", "x",  10),
+            (1, 3, "a", "x",  10),
+            (1, 4, "b", "x",  None),
+            (2, 1, "c", None, 20),
+            (2, 2, "c", None, 20),
+            # fmt:on
+        ],
+        schema="id integer, visit integer, letter string, symbol string, number integer",
+    )
+    forwards_window = Window.partitionBy("id").orderBy("visit")
+    backwards_window = Window.partitionBy("id").orderBy(F.desc("visit"))
+
+    output_df = fill_using_windows(
+        input_df,
+        [
+            (["letter", "symbol"], forwards_window, F.last),
+            (["number"], backwards_window, F.last),
+            # only fills the first letter of participant 2, after filling forwards
+            (["letter"], backwards_window, F.last),
+        ],
+    )
+    assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_nullable=True)
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+from chispa import assert_df_equality
+
+from survey_pipeline_template.impute import find_nearest_donor_groups
+from survey_pipeline_template.impute import weighted_distance
+
+
+@pytest.fixture
+def donor_groups(spark_session):
+    rng = random.Random(7)
+    values = ["A", "B", "C", None]
+    imputing_df = spark_session.createDataFrame(
+        data=[("imp-" + str(i), *[rng.choice(values) for _ in range(3)]) for i in range(30)],
+        schema="unique_imputation_group string, first string, second string, third string",
+    )
+    donor_df = spark_session.createDataFrame(
+        data=[("don-" + str(i), *[rng.choice(values[:2]) for _ in range(3)]) for i in range(6)],
+        schema="unique_donor_group string, don_first string, don_second string, don_third string",
+    )
+    return imputing_df, donor_df
+
+
+@pytest.mark.parametrize(
+    "weights,maximum_distance", [([1, 1, 1], None), ([5, 2, 1], 3), ([1, 1, 1], 0), ([0.5, 0.25, 0.75], 0.75)]
+)
+def test_find_nearest_donor_groups(spark_session, donor_groups, weights, maximum_distance):
+    imputing_df, donor_df = donor_groups
+    donor_group_columns = ["first", "second", "third"]
+
+    expected_df = weighted_distance(
+        imputing_df.crossJoin(donor_df), "unique_imputation_group", donor_group_columns, weights
+    )
+    if maximum_distance is not None:
+        expected_df = expected_df.filter(expected_df.distance <= maximum_distance)
+    expected_df = expected_df.select("unique_imputation_group", "unique_donor_group")
+
+    output_df = find_nearest_donor_groups(imputing_df, donor_df, donor_group_columns, weights, maximum_distance)
+    assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_nullable=True)
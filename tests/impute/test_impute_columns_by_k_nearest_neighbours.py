@@ -0,0 +1,49 @@
+from chispa import assert_df_equality
+
+from survey_pipeline_template.impute import impute_columns_by_k_nearest_neighbours
+
+
+def test_impute_columns_by_k_nearest_neighbours(spark_session):
+    """
+    Test that records missing any of the reference columns are imputed with all of the values of a single donor.
+    """
+    input_df = spark_session.createDataFrame(
+        data=[
+            ("1", "g1", "A", 1),
+            ("2", "g1", None, None),
+            ("3", "g2", "B", 2),
+            ("4", "g2", "C", None),
+            ("5", "g2", "D", 3),
+        ],
+        schema="uid string, group string, letter string, number integer",
+    )
+    expected_df = spark_session.createDataFrame(
+        data=[
+            ("1", None, None),
+            ("2", "A", 1),
+            ("3", None, None),
+            ("5", None, None),
+        ],
+        schema="uid string, imputed_letter string, imputed_number integer",
+    )
+
+    output_df = impute_columns_by_k_nearest_neighbours(
+        input_df,
+        column_names_to_assign=["imputed_letter", "imputed_number"],
+        reference_columns=["letter", "number"],
+        donor_group_columns=["group"],
+        log_file_path="./",
+        rng_seed=1,
+    )
+    assert output_df.columns == input_df.columns + ["imputed_letter", "imputed_number"]
+
+    # the record missing a number is imputed from either complete donor in its group
+    imputed_row = output_df.filter(output_df.uid == "4").first()
+    assert (imputed_row["imputed_letter"], imputed_row["imputed_number"]) in [("B", 2), ("D", 3)]
+
+    assert_df_equality(
+        output_df.filter(output_df.uid != "4").select("uid", "imputed_letter", "imputed_number"),
+        expected_df,
+        ignore_row_order=True,
+        ignore_nullable=True,
+    )
@@ -2,6 +2,7 @@ from chispa.dataframe_comparer import assert_df_equality
 
 from survey_pipeline_template.impute import impute_and_flag
 from survey_pipeline_template.impute import impute_by_k_nearest_neighbours
+from survey_pipeline_template.impute import KNNImputationDiagnostics
 
 
 def test_impute_by_k_nearest_neighbours(spark_session):
@@ -53,3 +54,57 @@ def test_impute_by_k_nearest_neighbours(spark_session):
         ignore_column_order=True,
         ignore_nullable=True,
     )
+
+
+def test_impute_by_k_nearest_neighbours_diagnostics(spark_session):
+    """
+    Test that record and donor pool counts are returned with the imputed values.
+    """
+    input_df = spark_session.createDataFrame(
+        [("A", "1", "A"), ("B", "1", "B"), ("C", "2", "C"), ("D", "1", None), ("E", "2", None), ("F", "2", None)],
+        schema="""uid string, group_column string, important_column string""",
+    )
+
+    output_df, diagnostics = impute_by_k_nearest_neighbours(
+        input_df,
+        column_name_to_assign="imputed_column",
+        reference_column="important_column",
+        donor_group_columns=["group_column"],
+        log_file_path="./",
+        return_diagnostics=True,
+    )
+    assert output_df.filter(output_df.imputed_column.isNotNull()).count() == 3
+    assert diagnostics == KNNImputationDiagnostics(
+        input_count=6,
+        impute_count=3,
+        donor_count=3,
+        imputation_group_count=2,
+        no_donor_group_count=0,
+        below_minimum_donor_group_count=0,
+        output_count=6,
+        missing_count=0,
+    )
+
+
+def test_impute_by_k_nearest_neighbours_independent_of_partitioning(spark_session):
+    """
+    Test that each record is imputed the same value with the same seed, however the input data are partitioned.
+    """
+    input_data = [(f"D{index}", "1", letter) for index, letter in enumerate("ABCDEFGH")]
+    input_data += [(f"R{index}", "1", None) for index in range(8)]
+    input_df = spark_session.createDataFrame(input_data, schema="uid string, group_column string, letter string")
+
+    def impute(df):
+        return impute_by_k_nearest_neighbours(
+            df,
+            column_name_to_assign="imputed_letter",
+            reference_column="letter",
+            donor_group_columns=["group_column"],
+            log_file_path="./",
+            rng_seed=1,
+        )
+
+    output_df = impute(input_df.coalesce(1))
+    repartitioned_output_df = impute(input_df.repartition(4).sort("uid", ascending=False))
+
+    assert_df_equality(output_df, repartitioned_output_df, ignore_row_order=True, ignore_nullable=True)
@@ -51,3 +51,40 @@ def test_impute_date_by_k_nearest_neighbours(spark_session):
         expected_df,
         ignore_row_order=True,
     )
+
+
+def test_impute_date_by_k_nearest_neighbours_joint(spark_session):
+    input_df = spark_session.createDataFrame(
+        data=[
+            # fmt:off
+            (1,         '2020-01-01',       'A'),
+            (2,         '2021-06-01',       'A'),
+            (3,         None,               'A'),
+            (4,         None,               'A'),
+            # fmt:on
+        ],
+        schema="""
+            id integer,
+            date string,
+            group string
+        """,
+    ).withColumn("date", F.to_timestamp(F.col("date")))
+
+    output_df = impute_date_by_k_nearest_neighbours(
+        df=input_df,
+        column_name_to_assign="date",
+        reference_column="date",
+        donor_group_columns=["group"],
+        log_file_path="/",
+        rng_seed=1,
+        joint=True,
+    )
+    imputed_year_months = sorted(
+        (row["year"], row["month"])
+        for row in output_df.filter(F.col("date").isNotNull())
+        .select(F.year("date").alias("year"), F.month("date").alias("month"))
+        .collect()
+    )
+    # one of each donor, taking the year and month from the same donor
+    assert imputed_year_months == [(2020, 1), (2021, 6)]
+    assert output_df.filter((F.col("id") <= 2) & F.col("date").isNotNull()).count() == 0
@@ -0,0 +1,42 @@
+import pyspark.sql.functions as F
+
+from survey_pipeline_template.impute import sample_proportional_to_size
+
+
+def test_sample_proportional_to_size(spark_session):
+    """Test that the required number of distinct values are sampled from each group, reproducibly by seed"""
+    input_df = spark_session.createDataFrame(
+        data=[
+            ("1", "a", 0.5, 2),
+            ("1", "b", 0.9, 2),
+            ("1", "c", 0.6, 2),
+            ("2", "a", 0.2, 1),
+            ("2", "b", 0.8, 1),
+            ("3", "a", 1.0, 1),
+        ],
+        schema="group string, value string, size double, sample_count integer",
+    )
+
+    output_df = sample_proportional_to_size(input_df, ["group"], "value", "size", "sample_count", rng_seed=1)
+    repeated_output_df = sample_proportional_to_size(
+        input_df.repartition(3), ["group"], "value", "size", "sample_count", rng_seed=1
+    )
+
+    group_counts = {row["group"]: row["count"] for row in output_df.groupBy("group").count().collect()}
+    assert group_counts == {"1": 2, "2": 1, "3": 1}
+    assert sorted(output_df.collect()) == sorted(repeated_output_df.collect())
+
+
+def test_sample_proportional_to_size_distribution(spark_session):
+    """Test that values are sampled with probability proportional to their size"""
+    input_df = (
+        spark_session.range(4000)
+        .select(F.col("id").cast("string").alias("group"))
+        .crossJoin(spark_session.createDataFrame([("a", 0.2), ("b", 0.8)], schema="value string, size double"))
+        .withColumn("sample_count", F.lit(1))
+    )
+
+    output_df = sample_proportional_to_size(input_df, ["group"], "value", "size", "sample_count", rng_seed=2)
+
+    proportion_b = output_df.filter(F.col("value") == "b").count() / 4000
+    assert 0.77 < proportion_b < 0.83
@@ -0,0 +1,28 @@
+import logging
+
+from survey_pipeline_template.impute import _validate_donor_group_variables
+
+
+def test_validate_donor_group_variables(spark_session, caplog):
+    """
+    Test that rows outside of each bound are counted against the bound that they fall outside of.
+    """
+    df = spark_session.createDataFrame(
+        data=[(1, 5, "a"), (2, 10, "b"), (3, 20, "c"), (4, None, "d"), (5, 30, None)],
+        schema="age integer, height integer, reference string",
+    )
+    with caplog.at_level(logging.WARNING):
+        _validate_donor_group_variables(
+            df,
+            "reference",
+            ["age", "height"],
+            [1, 1],
+            {"age": [2, 3, "int"], "height": [10, None, "string"]},
+        )
+
+    assert [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING] == [
+        "height dtype is int and not the required string",
+        "1 rows have age below 2",
+        "2 rows have age above 3",
+        "1 rows have height below 10",
+    ]
@@ -0,0 +1,49 @@
+from survey_pipeline_template.pipeline.pipeline_stages import register_pipeline_stage
+from survey_pipeline_template.pipeline.run import build_stage_dependency_graph
+
+
+@register_pipeline_stage("dependency_test_stage")
+def dependency_test_stage(input_table: str = None, output_table: str = None, output_survey_table: str = None):
+    pass
+
+
+@register_pipeline_stage("dependency_test_survey_stage")
+def dependency_test_survey_stage(input_survey_table: str, output_survey_table: str):
+    pass
+
+
+@register_pipeline_stage("dependency_test_untracked_stage")
+def dependency_test_untracked_stage():
+    pass
+
+
+def test_build_stage_dependency_graph():
+    """Test that stages depend only on earlier stages that they share tables or conditions with."""
+    stages_config = {
+        "lookup_a": {"function": "dependency_test_stage", "output_tables": {"output_table": "a"}},
+        "lookup_b": {"function": "dependency_test_stage", "output_tables": {"output_table": "b"}},
+        "union": {
+            "function": "dependency_test_stage",
+            "input_tables": {"input_table": "a"},
+            "output_tables": {"output_survey_table": "survey"},
+        },
+        "transform": {"function": "dependency_test_survey_stage", "output_tables": {"output_survey_table": "out"}},
+        "report_b": {
+            "function": "dependency_test_stage",
+            "input_tables": {"input_table": "b"},
+            "when": {"operator": "all", "conditions": {"lookup_a": "updated"}},
+        },
+        "cleanup": {"function": "dependency_test_untracked_stage"},
+        "lookup_c": {"function": "dependency_test_stage", "output_tables": {"output_table": "c"}, "depends_on": []},
+    }
+    stages_to_run = list(stages_config)
+
+    assert build_stage_dependency_graph(stages_to_run, stages_config) == {
+        "lookup_a": set(),
+        "lookup_b": set(),
+        "union": {"lookup_a"},
+        "transform": {"union"},
+        "report_b": {"lookup_a", "lookup_b"},
+        "cleanup": {"lookup_a", "lookup_b", "union", "transform", "report_b"},
+        "lookup_c": {"cleanup"},
+    }
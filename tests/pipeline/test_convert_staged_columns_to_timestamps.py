@@ -0,0 +1,35 @@
+import pyspark.sql.functions as F
+from chispa import assert_df_equality
+
+from survey_pipeline_template.pipeline.input_file_processing import convert_staged_columns_to_timestamps
+
+
+def test_convert_staged_columns_to_timestamps(spark_session):
+    input_df = spark_session.createDataFrame(
+        data=[
+            # unedited values use the staged timestamp
+            (1, "2022-01-08", "2022-01-08", "2021-12-31 00:00:00"),
+            # edited values are parsed again
+            (2, "2022-02-01", "2022-01-08", "2022-01-08 00:00:00"),
+            (3, None, "2022-01-08", "2022-01-08 00:00:00"),
+            (4, None, None, None),
+        ],
+        schema="""
+            id integer,
+            visit_date string,
+            _staged_raw_visit_date string,
+            _staged_timestamp_visit_date string
+        """,
+    ).withColumn("_staged_timestamp_visit_date", F.to_timestamp("_staged_timestamp_visit_date"))
+    expected_df = spark_session.createDataFrame(
+        data=[
+            (1, "2021-12-31 00:00:00"),
+            (2, "2022-02-01 00:00:00"),
+            (3, None),
+            (4, None),
+        ],
+        schema="id integer, visit_date string",
+    ).withColumn("visit_date", F.to_timestamp("visit_date"))
+
+    output_df = convert_staged_columns_to_timestamps(input_df, {"yyyy-MM-dd": ["visit_date", "missing_date"]})
+    assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_nullable=True)
@@ -0,0 +1,34 @@
+from chispa import assert_df_equality
+
+from survey_pipeline_template.pipeline.load import extract_from_table
+from survey_pipeline_template.pipeline.load import update_table
+
+
+def test_extract_from_table_columns(spark_session, pipeline_storage):
+    df = spark_session.createDataFrame(
+        data=[(1, "a", 1.5), (2, "b", 2.5)], schema="id integer, letter string, number double"
+    )
+    update_table(df, "example_table", "overwrite")
+
+    output_df = extract_from_table("example_table", columns=["number", "id"])
+
+    assert_df_equality(output_df, df.select("number", "id"), ignore_row_order=True, ignore_nullable=True)
+
+
+def test_extract_from_table_derived_partition_columns(spark_session, pipeline_storage):
+    """Test that derived partition columns are dropped, unless they are selected, and can be filtered on."""
+    pipeline_storage["table_layouts"]["partitioned_table"] = {
+        "partition_by": ["id_partition"],
+        "partition_columns": {"id_partition": "id % 2"},
+    }
+    df = spark_session.createDataFrame(data=[(1, "a"), (2, "b"), (3, "c")], schema="id integer, letter string")
+    update_table(df, "partitioned_table", "overwrite")
+
+    assert_df_equality(extract_from_table("partitioned_table"), df, ignore_row_order=True, ignore_nullable=True)
+    assert_df_equality(
+        extract_from_table("partitioned_table", partition_filter="id_partition = 1"),
+        df.filter("id != 2"),
+        ignore_row_order=True,
+        ignore_nullable=True,
+    )
+    assert extract_from_table("partitioned_table", columns=["id", "id_partition"]).columns == ["id", "id_partition"]
@@ -0,0 +1,44 @@
+import pytest
+
+from survey_pipeline_template.pipeline.load import add_stage_log_entry
+from survey_pipeline_template.pipeline.load import get_table_versions
+from survey_pipeline_template.pipeline.load import update_table
+from survey_pipeline_template.pipeline.stage_cache import get_cached_stage_result
+from survey_pipeline_template.pipeline.stage_cache import get_stage_fingerprint
+
+
+@pytest.fixture
+def cached_stage(spark_session, pipeline_storage):
+    """A successful run of a stage that reads `input_table` and writes `output_table`."""
+    df = spark_session.createDataFrame(data=[(1, "a")], schema="id integer, letter string")
+    update_table(df, "input_table", "overwrite")
+    update_table(df, "output_table", "overwrite")
+    fingerprint = get_stage_fingerprint("stage", {"setting": 1}, ["input_table"])
+    add_stage_log_entry(1, "stage", "success", fingerprint, {"status": "updated"}, get_table_versions(["output_table"]))
+    return df
+
+
+def test_get_cached_stage_result_hit(cached_stage):
+    fingerprint = get_stage_fingerprint("stage", {"setting": 1}, ["input_table"])
+
+    assert get_cached_stage_result("stage", fingerprint, ["output_table"]) == {"status": "updated"}
+
+
+def test_get_cached_stage_result_changed_config(cached_stage):
+    fingerprint = get_stage_fingerprint("stage", {"setting": 2}, ["input_table"])
+
+    assert get_cached_stage_result("stage", fingerprint, ["output_table"]) is None
+
+
+def test_get_cached_stage_result_changed_input(cached_stage):
+    update_table(cached_stage, "input_table", "append")
+    fingerprint = get_stage_fingerprint("stage", {"setting": 1}, ["input_table"])
+
+    assert get_cached_stage_result("stage", fingerprint, ["output_table"]) is None
+
+
+def test_get_cached_stage_result_output_written_since(cached_stage):
+    fingerprint = get_stage_fingerprint("stage", {"setting": 1}, ["input_table"])
+    update_table(cached_stage, "output_table", "append")
+
+    assert get_cached_stage_result("stage", fingerprint, ["output_table"]) is None
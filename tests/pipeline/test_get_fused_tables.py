@@ -0,0 +1,34 @@
+from survey_pipeline_template.pipeline.pipeline_stages import register_pipeline_stage
+from survey_pipeline_template.pipeline.run import get_fused_tables
+
+
+@register_pipeline_stage("fused_test_survey_stage")
+def fused_test_survey_stage(input_survey_table: str, output_survey_table: str):
+    pass
+
+
+@register_pipeline_stage("fused_test_report_stage")
+def fused_test_report_stage(input_table: str):
+    pass
+
+
+def test_get_fused_tables():
+    """Test that only output survey tables consumed by the next stage, and not persisted, are fused."""
+    stages_config = {
+        "stage_a": {"function": "fused_test_survey_stage", "output_tables": {"output_survey_table": "a"}},
+        "stage_b": {
+            "function": "fused_test_survey_stage",
+            "output_tables": {"output_survey_table": "b"},
+            "persist_output": True,
+        },
+        "stage_c": {"function": "fused_test_survey_stage", "output_tables": {"output_survey_table": "c"}},
+        "stage_d": {
+            "function": "fused_test_survey_stage",
+            "input_tables": {"input_survey_table": "b"},
+            "output_tables": {"output_survey_table": "d"},
+        },
+        "stage_e": {"function": "fused_test_survey_stage", "output_tables": {"output_survey_table": "e"}},
+        "report": {"function": "fused_test_report_stage", "input_tables": {"input_table": "e"}},
+    }
+
+    assert get_fused_tables(list(stages_config), stages_config) == {"a", "d"}
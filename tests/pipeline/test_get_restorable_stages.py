@@ -0,0 +1,40 @@
+import pytest
+
+from survey_pipeline_template.pipeline.load import add_stage_log_entry
+from survey_pipeline_template.pipeline.load import get_table_versions
+from survey_pipeline_template.pipeline.load import update_table
+from survey_pipeline_template.pipeline.stage_cache import get_restorable_stages
+
+
+@pytest.fixture
+def logged_run(spark_session, pipeline_storage):
+    """A run in which the second of three stages errored, with each stage writing its own output table."""
+    df = spark_session.createDataFrame(data=[(1, "a")], schema="id integer, letter string")
+    for stage_name, stage_status in [("stage_a", "success"), ("stage_b", "errored"), ("stage_c", "success")]:
+        update_table(df, f"{stage_name}_output", "overwrite")
+        add_stage_log_entry(
+            1,
+            stage_name,
+            stage_status,
+            stage_result={"output_survey_table": f"{stage_name}_output"},
+            output_table_versions=get_table_versions([f"{stage_name}_output"]),
+        )
+    return df
+
+
+def test_get_restorable_stages(logged_run):
+    """Test that stages are restored up to the first stage that did not complete successfully."""
+    restorable_stages = get_restorable_stages(1, ["stage_a", "stage_b", "stage_c"])
+
+    assert restorable_stages == {"stage_a": {"output_survey_table": "stage_a_output"}}
+
+
+def test_get_restorable_stages_output_written_since(logged_run):
+    update_table(logged_run, "stage_a_output", "append")
+
+    assert get_restorable_stages(1, ["stage_a", "stage_b", "stage_c"]) == {}
+
+
+def test_get_restorable_stages_unlogged_run(logged_run):
+    with pytest.raises(ValueError):
+        get_restorable_stages(2, ["stage_a", "stage_b", "stage_c"])
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from survey_pipeline_template.pipeline.load import get_run_id
+from survey_pipeline_template.pipeline.load import PipelineLogBuffer
+from survey_pipeline_template.pipeline.load import RUN_LOG_SCHEMA
+from survey_pipeline_template.pipeline.load import start_log_buffer
+from survey_pipeline_template.pipeline.load import stop_log_buffer
+
+
+def test_get_run_id_includes_recovered_run_log_entries(pipeline_storage, tmp_path):
+    """Test that a run ID recovered from the log journal, but not yet written to the run log, is not reused."""
+    journal_path = str(tmp_path / "log_journal.jsonl")
+    PipelineLogBuffer(journal_path).add("run_log", RUN_LOG_SCHEMA, [1, datetime(2022, 1, 1), "pipeline", "1.0.0", "{}"])
+
+    start_log_buffer(journal_path)
+    try:
+        assert get_run_id() == 2
+    finally:
+        stop_log_buffer()
+    get_run_id.cache_clear()
+
+    assert get_run_id() == 2
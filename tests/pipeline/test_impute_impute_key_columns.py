@@ -4,6 +4,8 @@ import pytest
 from chispa.dataframe_comparer import assert_df_equality
 from pyspark.sql import functions as F
 
+import survey_pipeline_template.pipeline.demographic_transformations as demographic_transformations_module
+from survey_pipeline_template.impute import impute_and_flag
 from survey_pipeline_template.pipeline.demographic_transformations import impute_key_columns
 
 
@@ -70,3 +72,96 @@ def test_impute_key_columns(spark_session):
 
     for demographic_variable in ["ethnicity_white", "sex", "date_of_birth"]:
         assert output_df.where(F.col(demographic_variable).isNull()).count() == 0
+
+
+@pytest.mark.integration
+def test_impute_key_columns_incremental(spark_session):
+    """
+    Test that participants with unchanged inputs keep their values from the lookup, while new or changed participants
+    are imputed again.
+    """
+    os.environ["deployment"] = "local"
+    schema = """ons_household_id string, participant_id string, cis_area_code_20 string, region_code string,
+        work_status_group string, people_in_household_count_group string, ethnicity_white string, sex string,
+        date_of_birth string, visit_datetime string"""
+    input_df = spark_session.createDataFrame(
+        [
+            # fmt: off
+            ("A", "A-A", "1", "A", "g1", "3", "white", "Female", "1990-01-01", "2020-01-01"),
+            ("A", "A-B", "1", "A", "g1", "3", None, "Female", "1990-01-01", "2020-01-01"),  # Impute by mode
+            ("B", "B-A", "2", "B", "g1", "1", "other", "Female", "1990-01-01", "2020-01-01"),
+            # fmt: on
+        ],
+        schema=schema,
+    )
+    first_output_df = impute_key_columns(input_df, None, log_directory="./", incremental=True).cache()
+    assert "imputation_input_hash" in first_output_df.columns
+    assert first_output_df.filter(F.col("ethnicity_white_imputation_method") == "impute_by_mode").count() == 1
+
+    # values from the lookup show which participants were imputed again
+    lookup_df = first_output_df.withColumn(
+        "ethnicity_white", F.when(F.col("participant_id") == "A-B", "lookup value").otherwise(F.col("ethnicity_white"))
+    ).withColumn("sex", F.when(F.col("participant_id") == "B-A", "lookup value").otherwise(F.col("sex")))
+    changed_input_df = input_df.withColumn(
+        "work_status_group", F.when(F.col("participant_id") == "B-A", "g2").otherwise(F.col("work_status_group"))
+    )
+    output_df = impute_key_columns(changed_input_df, lookup_df, log_directory="./", incremental=True)
+
+    output_values = {
+        row["participant_id"]: (row["ethnicity_white"], row["ethnicity_white_imputation_method"], row["sex"])
+        for row in output_df.collect()
+    }
+    assert output_values == {
+        "A-A": ("white", None, "Female"),
+        "A-B": ("lookup value", "impute_by_mode", "Female"),
+        "B-A": ("other", None, "Female"),
+    }
+    assert output_df.filter(F.col("work_status_group") == "g2").count() == 1
+
+
+@pytest.mark.integration
+def test_impute_key_columns_incremental_imputes_fewer_records(spark_session, monkeypatch):
+    """
+    Test that only a new participant and the donors in its donor pools are imputed in incremental mode, while all
+    participants are imputed otherwise, with the same values for the new participant.
+    """
+    os.environ["deployment"] = "local"
+    schema = """ons_household_id string, participant_id string, cis_area_code_20 string, region_code string,
+        work_status_group string, people_in_household_count_group string, ethnicity_white string, sex string,
+        date_of_birth string, visit_datetime string"""
+    input_df = spark_session.createDataFrame(
+        [
+            # fmt: off
+            ("A", "A-A", "1", "A", "g1", "3", "white", "Female", "1990-01-01", "2020-01-01"),
+            ("B", "B-A", "2", "B", "g1", "1", "other", "Male",   "1980-01-01", "2020-01-01"),
+            ("C", "C-A", "3", "B", "g2", "2", "white", "Female", "1970-01-01", "2020-01-01"),
+            ("D", "D-A", "4", "C", "g2", "2", "other", "Male",   "1960-01-01", "2020-01-01"),
+            # fmt: on
+        ],
+        schema=schema,
+    )
+    lookup_df = impute_key_columns(input_df, None, log_directory="./", incremental=True).cache()
+    new_participant_df = spark_session.createDataFrame(
+        [("A", "A-B", "1", "A", "g1", "3", None, "Female", "1990-01-01", "2020-01-01")], schema=schema
+    )
+    input_df = input_df.unionByName(new_participant_df)
+
+    imputed_record_counts = []
+
+    def count_imputed_records(df, *args, **kwargs):
+        imputed_record_counts.append(df.count())
+        return impute_and_flag(df, *args, **kwargs)
+
+    monkeypatch.setattr(demographic_transformations_module, "impute_and_flag", count_imputed_records)
+
+    output_df = impute_key_columns(input_df, lookup_df, log_directory="./", incremental=True)
+    incremental_counts, imputed_record_counts = imputed_record_counts, []
+    full_output_df = impute_key_columns(input_df, lookup_df, log_directory="./")
+
+    # only the household of the new participant is used to impute its ethnicity by mode
+    assert incremental_counts == [2]
+    assert imputed_record_counts == [5, 5, 5, 5]
+    imputed_columns = ["participant_id", "ethnicity_white", "ethnicity_white_imputation_method"]
+    assert_df_equality(
+        output_df.select(*imputed_columns), full_output_df.select(*imputed_columns), ignore_row_order=True
+    )
@@ -0,0 +1,34 @@
+from chispa import assert_df_equality
+
+from survey_pipeline_template.pipeline.load import extract_from_table
+from survey_pipeline_template.pipeline.load import update_table
+from survey_pipeline_template.pipeline.pipeline_stages import join_lookup_table
+
+
+def test_join_lookup_table_lookup_columns(spark_session, pipeline_storage):
+    """Test that only the selected lookup columns are joined, and that rows without join values are kept."""
+    input_df = spark_session.createDataFrame(data=[(1, "a"), (2, "b"), (3, None)], schema="id integer, key string")
+    lookup_df = spark_session.createDataFrame(
+        data=[("a", "A", "unused"), ("b", "B", "unused")], schema="key string, value string, unused string"
+    )
+    expected_df = spark_session.createDataFrame(
+        data=[(1, "a", "A"), (2, "b", "B"), (3, None, None)], schema="id integer, key string, value string"
+    )
+    update_table(input_df, "input_table", "overwrite")
+    update_table(lookup_df, "lookup_table", "overwrite")
+
+    join_lookup_table(
+        input_survey_table="input_table",
+        output_survey_table="output_table",
+        lookup_table_name="lookup_table",
+        join_on_columns=["key"],
+        lookup_columns=["value"],
+    )
+
+    assert_df_equality(
+        extract_from_table("output_table"),
+        expected_df,
+        ignore_row_order=True,
+        ignore_column_order=True,
+        ignore_nullable=True,
+    )
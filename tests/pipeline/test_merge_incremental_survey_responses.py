@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from chispa import assert_df_equality
+
+from survey_pipeline_template.pipeline.load import _get_table_location
+from survey_pipeline_template.pipeline.load import extract_from_table
+from survey_pipeline_template.pipeline.load import update_table
+from survey_pipeline_template.pipeline.pipeline_stages import merge_incremental_survey_responses
+
+schema = "participant_id integer, participant_completion_window_id integer, result string"
+
+
+def test_merge_incremental_survey_responses_partitioned(spark_session, pipeline_storage):
+    """Test that only the partitions of a partitioned output table that hold merged responses are rewritten."""
+    pipeline_storage["table_layouts"]["all_responses"] = {
+        "partition_by": ["participant_partition"],
+        "partition_columns": {"participant_partition": "participant_id % 2"},
+    }
+    existing_df = spark_session.createDataFrame([(1, 1, "old"), (2, 2, "old"), (3, 3, "old")], schema=schema)
+    update_table(existing_df, "all_responses", "overwrite")
+    even_partition = Path(_get_table_location("all_responses").replace("file:", "")) / "participant_partition=0"
+    even_partition_files = sorted(path.name for path in even_partition.iterdir())
+
+    processed_df = spark_session.createDataFrame([(1, 1, "new"), (1, 4, "new")], schema=schema)
+    update_table(processed_df, "processed_responses", "overwrite")
+    merge_incremental_survey_responses("processed_responses", "all_responses")
+
+    expected_df = spark_session.createDataFrame(
+        [(1, 1, "new"), (1, 4, "new"), (2, 2, "old"), (3, 3, "old")], schema=schema
+    )
+    assert_df_equality(
+        extract_from_table("all_responses"),
+        expected_df,
+        ignore_row_order=True,
+        ignore_column_order=True,
+        ignore_nullable=True,
+    )
+    assert sorted(path.name for path in even_partition.iterdir()) == even_partition_files
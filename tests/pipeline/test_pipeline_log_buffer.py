@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from survey_pipeline_template.pipeline.load import PipelineLogBuffer
+
+
+def test_pipeline_log_buffer_recovers_journal(tmp_path):
+    """Test that log entries buffered but not written by one run are recovered from the journal by the next."""
+    journal_path = tmp_path / "log_journal.jsonl"
+    schema = "run_id integer, run_status_datetime timestamp, run_status string"
+    log_entries = [[1, datetime(2022, 1, 1, 12, 30), "started"], [1, datetime(2022, 1, 1, 13, 0, 0, 5), "errored"]]
+
+    log_buffer = PipelineLogBuffer(str(journal_path))
+    for log_entry in log_entries:
+        log_buffer.add("run_status", schema, log_entry)
+
+    recovered_log_buffer = PipelineLogBuffer(str(journal_path))
+
+    assert log_buffer.get_entries("run_status") == log_entries
+    assert recovered_log_buffer.get_entries("run_status") == log_entries
+    assert recovered_log_buffer.get_entries("table_log") == []
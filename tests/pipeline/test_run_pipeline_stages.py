@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+import survey_pipeline_template.pipeline.run as run_module
+from survey_pipeline_template.pipeline.run import run_pipeline_stages
+
+
+class RecordingSplunkLogger:
+    def __init__(self):
+        self.logs = []
+
+    def log(self, **kwargs):
+        self.logs.append(kwargs)
+
+
+@pytest.fixture
+def stage_threads(monkeypatch, spark_session):
+    """Register stages that record the thread they are run on, without writing any pipeline log tables."""
+    threads = {}
+
+    def record_thread(stage_name):
+        threads[stage_name] = threading.current_thread()
+
+    monkeypatch.setattr(
+        run_module,
+        "pipeline_stages",
+        {"stage_a": lambda **kwargs: record_thread("stage_a"), "stage_b": lambda **kwargs: record_thread("stage_b")},
+    )
+    for function_name in ["add_run_status", "add_stage_log_entry", "add_run_metrics_entry", "flush_log_buffer"]:
+        monkeypatch.setattr(run_module, function_name, lambda *args, **kwargs: None)
+    monkeypatch.setattr(run_module, "get_table_versions", lambda tables: {})
+    return threads
+
+
+def test_run_pipeline_stages_serial_without_thread_local_properties(monkeypatch, stage_threads):
+    """Test that stages are run one at a time on the calling thread when local properties are shared by threads."""
+    monkeypatch.setattr(run_module, "thread_local_properties_supported", lambda: False)
+    stage_configs = {"stage_a": {"output_tables": {"a": "table_a"}}, "stage_b": {"output_tables": {"b": "table_b"}}}
+
+    error_count = run_pipeline_stages(
+        ["stage_a", "stage_b"], stage_configs, 1, RecordingSplunkLogger(), max_concurrent_stages=2
+    )
+
+    assert error_count == 0
+    assert stage_threads == {"stage_a": threading.main_thread(), "stage_b": threading.main_thread()}
+
+
+def test_run_pipeline_stages_concurrent_with_thread_local_properties(monkeypatch, stage_threads):
+    monkeypatch.setattr(run_module, "thread_local_properties_supported", lambda: True)
+    stage_configs = {"stage_a": {"output_tables": {"a": "table_a"}}, "stage_b": {"output_tables": {"b": "table_b"}}}
+
+    error_count = run_pipeline_stages(
+        ["stage_a", "stage_b"], stage_configs, 1, RecordingSplunkLogger(), max_concurrent_stages=2
+    )
+
+    assert error_count == 0
+    assert set(stage_threads) == {"stage_a", "stage_b"}
+    assert threading.main_thread() not in stage_threads.values()
+
+
+def test_run_pipeline_stages_without_metrics(monkeypatch, stage_threads):
+    """Test that jobs are not tagged for metrics collection unless stage metrics are captured."""
+
+    def fail_to_collect(*args, **kwargs):
+        raise AssertionError("metrics collector should not be created")
+
+    monkeypatch.setattr(run_module, "StageMetricsCollector", fail_to_collect)
+    stage_configs = {"stage_a": {"output_tables": {"a": "table_a"}}}
+
+    error_count = run_pipeline_stages(["stage_a"], stage_configs, 1, RecordingSplunkLogger())
+
+    assert error_count == 0
+    assert set(stage_threads) == {"stage_a"}
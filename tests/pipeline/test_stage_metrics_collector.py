@@ -0,0 +1,36 @@
+from py4j.protocol import Py4JError
+
+from survey_pipeline_template.pipeline.stage_metrics import StageMetricsCollector
+
+
+def test_stage_metrics_collector(spark_session):
+    """Test that jobs are tagged with the collector's job group, and the previous job group is restored on exit."""
+    spark_context = spark_session.sparkContext
+    spark_context.setLocalProperty("spark.jobGroup.id", "outer_group")
+    metrics_collector = StageMetricsCollector(run_id=1, stage_name="example_stage")
+
+    with metrics_collector:
+        assert spark_context.getLocalProperty("spark.jobGroup.id") == "run_1_example_stage"
+        spark_session.range(10).count()
+
+    assert spark_context.getLocalProperty("spark.jobGroup.id") == "outer_group"
+    spark_context.setLocalProperty("spark.jobGroup.id", None)
+    metrics = metrics_collector.get_metrics()
+    assert metrics["job_count"] >= 1
+    assert metrics["gc_time_ms"] >= 0
+
+
+def test_stage_metrics_collector_without_status_store(spark_session, monkeypatch):
+    """Test that failing to read executor metrics does not fail the jobs run within the collector."""
+
+    def raise_py4j_error(self):
+        raise Py4JError("status store unavailable")
+
+    monkeypatch.setattr(StageMetricsCollector, "_get_total_gc_time_ms", raise_py4j_error)
+    metrics_collector = StageMetricsCollector(run_id=1, stage_name="example_stage")
+
+    with metrics_collector:
+        spark_session.range(10).count()
+
+    assert metrics_collector.gc_time_ms is None
+    assert spark_session.sparkContext.getLocalProperty("spark.jobGroup.id") is None
@@ -0,0 +1,51 @@
+from chispa import assert_df_equality
+
+from survey_pipeline_template.pipeline.load import create_processed_file_log_entry
+from survey_pipeline_template.pipeline.load import extract_from_table
+from survey_pipeline_template.pipeline.load import update_table
+from survey_pipeline_template.pipeline.pipeline_stages import merge_incremental_survey_responses
+from survey_pipeline_template.pipeline.pipeline_stages import union_survey_response_files
+
+schema = (
+    "participant_id integer, ons_household_id string, survey_response_source_file string, "
+    "participant_completion_window_id integer"
+)
+
+
+def process_files(spark_session, rows):
+    """Append responses to the transformed responses table, logging their source files as processed."""
+    df = spark_session.createDataFrame(rows, schema=schema)
+    update_table(df, "transformed_responses", "append")
+    create_processed_file_log_entry(df, "survey_response_source_file", "responses", "transformed_responses")
+
+
+def run_incremental_union(spark_session):
+    union_survey_response_files(["transformed_responses"], "unioned_responses", "all_responses")
+    return extract_from_table("unioned_responses")
+
+
+def test_union_survey_response_files_incremental(spark_session, pipeline_storage):
+    """
+    Test that only the households with responses from unmerged files are processed, and that files without any
+    merged responses are not processed again.
+    """
+    process_files(spark_session, [(1, "h1", "f1", 1), (2, "h1", "f1", 2), (3, "h2", "f1", 3)])
+    first_df = run_incremental_union(spark_session)
+    assert first_df.count() == 3
+    merge_incremental_survey_responses("unioned_responses", "all_responses")
+
+    process_files(spark_session, [(1, "h1", "f2", 4), (4, "h3", "f3", 5)])
+    second_df = run_incremental_union(spark_session)
+    expected_df = spark_session.createDataFrame(
+        [(1, "h1", "f1", 1), (2, "h1", "f1", 2), (1, "h1", "f2", 4), (4, "h3", "f3", 5)], schema=schema
+    )
+    assert_df_equality(second_df, expected_df, ignore_row_order=True, ignore_column_order=True, ignore_nullable=True)
+
+    # all responses from f3 are removed by later stages, but f3 is still logged as merged
+    update_table(second_df.filter("survey_response_source_file != 'f3'"), "processed_responses", "overwrite")
+    merge_incremental_survey_responses("processed_responses", "all_responses")
+    assert sorted(
+        row[0] for row in extract_from_table("all_responses").select("participant_completion_window_id").collect()
+    ) == [1, 2, 3, 4]
+
+    assert run_incremental_union(spark_session).count() == 0
@@ -0,0 +1,136 @@
+import re
+
+import pytest
+from chispa import assert_df_equality
+
+from survey_pipeline_template.pipeline.load import extract_from_table
+from survey_pipeline_template.pipeline.load import update_table
+
+
+@pytest.fixture
+def existing_table(spark_session, pipeline_storage):
+    df = spark_session.createDataFrame(data=[(1, "a")], schema="id integer, letter string")
+    update_table(df, "example_table", "overwrite")
+    return df
+
+
+def test_update_table_schema_evolution(spark_session, existing_table):
+    """Test that new columns are added to the table, and columns missing from the appended rows are filled with nulls."""
+    append_df = spark_session.createDataFrame(data=[(2, 2.5)], schema="id integer, number double")
+    expected_df = spark_session.createDataFrame(
+        data=[(1, "a", None), (2, None, 2.5)], schema="id integer, letter string, number double"
+    )
+
+    update_table(append_df, "example_table", "append", schema_evolution=True)
+
+    assert_df_equality(extract_from_table("example_table"), expected_df, ignore_row_order=True, ignore_nullable=True)
+
+
+def test_update_table_differing_columns(spark_session, existing_table):
+    append_df = spark_session.createDataFrame(data=[(2, 2.5)], schema="id integer, number double")
+
+    with pytest.raises(ValueError):
+        update_table(append_df, "example_table", "append")
+
+
+def test_update_table_type_differences(spark_session, existing_table, capsys):
+    """Test that appended columns with types that can be widened are reported and cast to the table's types."""
+    append_df = spark_session.createDataFrame(data=[(2, "b")], schema="id short, letter string")
+    expected_df = spark_session.createDataFrame(data=[(1, "a"), (2, "b")], schema="id integer, letter string")
+
+    update_table(append_df, "example_table", "append")
+
+    assert "column types that will be cast: id (smallint to int)" in capsys.readouterr().out
+    assert_df_equality(extract_from_table("example_table"), expected_df, ignore_row_order=True, ignore_nullable=True)
+
+
+@pytest.mark.parametrize(
+    "append_schema, type_difference",
+    [
+        ("id long, letter string", "id (bigint to int)"),
+        ("id string, letter string", "id (string to int)"),
+        ("id integer, letter struct<value:string>", "letter (struct<value:string> to string)"),
+    ],
+)
+def test_update_table_unsafe_type_differences(spark_session, existing_table, append_schema, type_difference):
+    """Test that appending columns with types that would lose values when cast to the table's types is refused."""
+    append_df = spark_session.createDataFrame(data=[], schema=append_schema)
+
+    with pytest.raises(ValueError, match=re.escape(f"cannot be safely cast: {type_difference}")):
+        update_table(append_df, "example_table", "append")
+
+    assert_df_equality(extract_from_table("example_table"), existing_table, ignore_nullable=True)
+
+
+def test_update_table_append_partitioned(spark_session, pipeline_storage):
+    """Test appending to a table partitioned by a column, which HIVE moves to the end of the table's columns."""
+    pipeline_storage["table_layouts"]["partitioned_table"] = {"partition_by": ["id"]}
+    df = spark_session.createDataFrame(data=[(1, "a", 1.5)], schema="id integer, letter string, number double")
+    append_df = spark_session.createDataFrame(data=[(2, "b", 2.5)], schema="id integer, letter string, number double")
+
+    update_table(df, "partitioned_table", "overwrite")
+    update_table(append_df, "partitioned_table", "append")
+
+    assert_df_equality(
+        extract_from_table("partitioned_table"),
+        df.union(append_df).select("letter", "number", "id"),
+        ignore_row_order=True,
+        ignore_nullable=True,
+    )
+
+
+def test_update_table_append_with_existing_layout(spark_session, existing_table, pipeline_storage, capsys):
+    """Test that appending to a table uses its existing bucketing, rather than a differing configured layout."""
+    pipeline_storage["table_layouts"]["example_table"] = {"bucket_by": ["id"], "num_buckets": 4}
+    append_df = spark_session.createDataFrame(data=[(2, "b")], schema="id integer, letter string")
+
+    update_table(append_df, "example_table", "append")
+
+    assert "Appending to example_table with its existing layout" in capsys.readouterr().out
+    assert_df_equality(
+        extract_from_table("example_table"),
+        existing_table.union(append_df),
+        ignore_row_order=True,
+        ignore_nullable=True,
+    )
+
+
+def test_update_table_append_bucketed(spark_session, pipeline_storage, capsys):
+    pipeline_storage["table_layouts"]["bucketed_table"] = {"bucket_by": ["id"], "num_buckets": 4, "sort_by": ["letter"]}
+    df = spark_session.createDataFrame(data=[(1, "a")], schema="id integer, letter string")
+    append_df = spark_session.createDataFrame(data=[(2, "b")], schema="id integer, letter string")
+
+    update_table(df, "bucketed_table", "overwrite")
+    update_table(append_df, "bucketed_table", "append")
+
+    assert "existing layout" not in capsys.readouterr().out
+    assert_df_equality(
+        extract_from_table("bucketed_table"), df.union(append_df), ignore_row_order=True, ignore_nullable=True
+    )
+
+
+def test_update_table_overwrite_partitions(spark_session, pipeline_storage):
+    """
+    Test that only the partitions with rows are overwritten, and that later overwrites of the table by other writers
+    still replace the whole table.
+    """
+    pipeline_storage["table_layouts"]["partitioned_table"] = {"partition_by": ["letter"]}
+    df = spark_session.createDataFrame(data=[(1, "a"), (2, "b")], schema="id integer, letter string")
+    update_table(df, "partitioned_table", "overwrite")
+
+    update_table(
+        spark_session.createDataFrame(data=[(3, "a")], schema="id integer, letter string"),
+        "partitioned_table",
+        "overwrite_partitions",
+    )
+
+    expected_df = spark_session.createDataFrame(data=[(3, "a"), (2, "b")], schema="id integer, letter string")
+    assert_df_equality(
+        extract_from_table("partitioned_table"), expected_df, ignore_row_order=True, ignore_nullable=True
+    )
+
+    full_table_name = f"default.{pipeline_storage['table_prefix']}partitioned_table"
+    spark_session.createDataFrame(data=[(4, "c")], schema="id integer, letter string").write.insertInto(
+        full_table_name, overwrite=True
+    )
+    assert [tuple(row) for row in spark_session.table(full_table_name).collect()] == [(4, "c")]
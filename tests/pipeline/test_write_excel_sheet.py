@@ -0,0 +1,24 @@
+from io import BytesIO
+
+import pandas as pd
+
+from survey_pipeline_template.pipeline.reporting import write_excel_sheet
+
+
+def test_write_excel_sheet(spark_session):
+    """Test that a DataFrame collected in chunks is written to a single sheet, with one header row."""
+    input_df = spark_session.createDataFrame(
+        data=[("A", 1), ("B", 2), ("C", 3)], schema="id string, count integer"
+    ).coalesce(1)
+    empty_df = input_df.filter("count > 3")
+    output = BytesIO()
+
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        write_excel_sheet(writer, input_df, "counts", max_rows_per_chunk=2)
+        write_excel_sheet(writer, empty_df, "empty")
+
+    output.seek(0)
+    sheets = pd.read_excel(output, sheet_name=None, engine="openpyxl")
+    assert sheets["counts"].to_dict("list") == {"id": ["A", "B", "C"], "count": [1, 2, 3]}
+    assert list(sheets["empty"].columns) == ["id", "count"]
+    assert sheets["empty"].empty
@@ -0,0 +1,27 @@
+from chispa import assert_df_equality
+
+from survey_pipeline_template.pipeline.load import check_table_exists
+from survey_pipeline_template.pipeline.load import extract_from_table
+from survey_pipeline_template.pipeline.load import get_table_schema
+from survey_pipeline_template.pipeline.load import set_fused_tables
+from survey_pipeline_template.pipeline.load import update_table
+from survey_pipeline_template.pipeline.load import write_fused_tables
+
+
+def test_write_fused_tables(spark_session, pipeline_storage):
+    """Test that a table held in memory during a run is read from memory, then written to HIVE at the end of it."""
+    input_df = spark_session.createDataFrame(data=[(1, "a"), (2, "b")], schema="id integer, letter string")
+    set_fused_tables(["fused_table"])
+
+    update_table(input_df, "fused_table", "overwrite", survey_table=True)
+
+    assert not spark_session.catalog._jcatalog.tableExists(f"default.{pipeline_storage['table_prefix']}fused_table")
+    assert get_table_schema("fused_table") == input_df.schema
+    assert_df_equality(extract_from_table("fused_table"), input_df, ignore_row_order=True)
+
+    write_fused_tables()
+
+    assert spark_session.catalog._jcatalog.tableExists(f"default.{pipeline_storage['table_prefix']}fused_table")
+    assert_df_equality(extract_from_table("fused_table"), input_df, ignore_row_order=True, ignore_nullable=True)
+    assert extract_from_table("table_log").filter("table_name = 'fused_table'").first()["survey_table"] == "true"
+    assert check_table_exists("fused_table")
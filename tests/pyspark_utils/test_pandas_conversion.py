@@ -0,0 +1,40 @@
+import pandas as pd
+from chispa import assert_df_equality
+
+from survey_pipeline_template.pyspark_utils import iter_spark_to_pandas
+from survey_pipeline_template.pyspark_utils import pandas_to_spark
+from survey_pipeline_template.pyspark_utils import spark_to_pandas
+
+
+def test_pandas_to_spark(spark_session):
+    """Test that pandas columns are converted to the schema's types, including integers with nulls"""
+    pandas_df = pd.DataFrame({"id": ["A", "B"], "count": [1, None], "code": [10, 20]})
+    expected_df = spark_session.createDataFrame(
+        data=[("A", 1, "10"), ("B", None, "20")], schema="id string, count integer, code string"
+    )
+
+    output_df = pandas_to_spark(pandas_df, "id string, count integer, code string")
+    assert_df_equality(output_df, expected_df, ignore_nullable=True)
+
+
+def test_spark_to_pandas(spark_session):
+    """Test that DataFrames are collected with and without types supported by Arrow"""
+    input_df = spark_session.createDataFrame(
+        data=[("A", 1, {"a": 1}), ("B", 2, None), ("C", 3, {"c": 3})],
+        schema="id string, count integer, map map<string,int>",
+    )
+
+    arrow_setting = spark_session.conf.get("spark.sql.execution.arrow.enabled", None)
+    output_df = spark_to_pandas(input_df.drop("map"))
+    output_df_with_map = spark_to_pandas(input_df)
+    output_chunks = list(iter_spark_to_pandas(input_df.drop("map").coalesce(1), max_rows_per_chunk=2))
+
+    assert output_df.to_dict("list") == {"id": ["A", "B", "C"], "count": [1, 2, 3]}
+    assert output_df_with_map["map"].tolist() == [{"a": 1}, None, {"c": 3}]
+    # the conversion used is chosen for each call, without changing the session's configuration
+    assert spark_session.conf.get("spark.sql.execution.arrow.enabled", None) == arrow_setting
+    assert [chunk.to_dict("list") for chunk in output_chunks] == [
+        {"id": ["A", "B"], "count": [1, 2]},
+        {"id": ["C"], "count": [3]},
+    ]
+    assert str(output_chunks[0]["count"].dtype) == "int32"
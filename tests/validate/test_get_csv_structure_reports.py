@@ -0,0 +1,33 @@
+from survey_pipeline_template.validate import get_csv_structure_reports
+
+
+def test_get_csv_structure_reports(tmp_path):
+    """
+    Test that each file is reported on separately, whether it is checked in the batch, checked alone for being too
+    large, or checked alone for having a comma in its path.
+    """
+    file_contents = {
+        "valid.csv": "field_1|field_2\n1|1\n2|2\n",
+        "invalid.csv": "field_1|field_2\n1|1\n2|2|2\n",
+        "with,comma.csv": "field_1|field_2\n1|1|1\n",
+        "large.csv": "field_1|field_2\n" + "1|1\n" * 50,
+    }
+    file_paths = []
+    for file_name, file_content in file_contents.items():
+        file_path = tmp_path / file_name
+        file_path.write_text(file_content)
+        file_paths.append(str(file_path))
+
+    reports = get_csv_structure_reports(
+        file_paths, delimiter="|", expected_header=["field_1", "field_2"], max_batch_file_bytes=100
+    )
+
+    assert {file_path.split("/")[-1]: report["valid"] for file_path, report in reports.items()} == {
+        "valid.csv": True,
+        "invalid.csv": False,
+        "with,comma.csv": False,
+        "large.csv": True,
+    }
+    assert reports[str(tmp_path / "invalid.csv")]["invalid_field_count_lines"] == [3]
+    assert reports[str(tmp_path / "with,comma.csv")]["line_count"] == 2
+    assert reports[str(tmp_path / "large.csv")]["line_count"] == 51
@@ -0,0 +1,34 @@
+from chispa import assert_df_equality
+
+from survey_pipeline_template.validate import normalise_schemas
+
+
+def test_normalise_schemas(spark_session, tmp_path):
+    """Test that headers are found after any preceding lines, and columns are renamed or dropped by regex"""
+    (tmp_path / "preamble.csv").write_text('Batch 1\n,,\njob title,Main Role,SOC code,\nnurse,"cares, a lot",1234,\n')
+    (tmp_path / "reordered.csv").write_text('SOC code,other,title,role\n5678,x,"chef ""head""",\n')
+    (tmp_path / "invalid.csv").write_text("title,role,other\nnurse,cares,1234\n")
+    schema = {
+        "work_main_job_title": {"type": "string"},
+        "work_main_job_role": {"type": "string"},
+        "standard_occupational_classification_code": {"type": "string"},
+    }
+    regex_schema = {
+        "title": "work_main_job_title",
+        "role|Role": "work_main_job_role",
+        "code|SOC": "standard_occupational_classification_code",
+    }
+    expected_df = spark_session.createDataFrame(
+        data=[("nurse", "cares, a lot", "1234"), ('chef "head"', "", "5678")],
+        schema="work_main_job_title string, work_main_job_role string, standard_occupational_classification_code string",
+    )
+
+    errors, dfs = normalise_schemas(
+        [str(tmp_path / file_name) for file_name in ["preamble.csv", "reordered.csv", "invalid.csv"]],
+        schema,
+        regex_schema,
+    )
+
+    assert list(errors) == [str(tmp_path / "invalid.csv")]
+    output_df = dfs[str(tmp_path / "preamble.csv")].unionByName(dfs[str(tmp_path / "reordered.csv")])
+    assert_df_equality(output_df, expected_df, ignore_row_order=True, ignore_nullable=True)
@@ -1,6 +1,7 @@
 import pytest
 
 from survey_pipeline_template.pyspark_utils import get_or_create_spark_session
+from survey_pipeline_template.validate import get_csv_structure_report
 from survey_pipeline_template.validate import validate_csv_fields
 from survey_pipeline_template.validate import validate_csv_header
 
@@ -40,3 +41,20 @@ def test_validate_csv_fields_error():
     spark_session = get_or_create_spark_session()
     text_rdd = spark_session.sparkContext.parallelize(['"field_1"|"field_2"|"field_3"', "1|1|1|1"])
     assert not validate_csv_fields(text_rdd, delimiter="|")
+
+
+def test_get_csv_structure_report():
+    spark_session = get_or_create_spark_session()
+    lines = ['"field_1"|"field_2"|"field_3"\r', "1|1|1\r", "1|1\r", '"1|1|1\r', "1|1|1|1", "1|�|1"]
+    text_rdd = spark_session.sparkContext.parallelize(lines, 3)
+    report = get_csv_structure_report(
+        text_rdd, delimiter="|", expected_header=["field_1", "field_2", "field_3"], max_sample_lines=1
+    )
+    assert report["valid_header"]
+    assert not report["valid"]
+    assert report["line_count"] == 6
+    assert report["field_counts"] == {3: 2, 2: 1, 1: 1, 4: 1}
+    assert (report["invalid_field_count_count"], report["invalid_field_count_lines"]) == (3, [3])
+    assert (report["unbalanced_quote_count"], report["unbalanced_quote_lines"]) == (1, [4])
+    assert (report["encoding_error_count"], report["encoding_error_lines"]) == (1, [6])
+    assert report["mixed_line_terminators"]